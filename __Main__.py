@@ -1,13 +1,54 @@
-from fastapi import FastAPI, Depends, Query, HTTPException
-from typing import List, Optional, Dict
+from fastapi import FastAPI, Depends, Query, HTTPException, Header, WebSocket, WebSocketDisconnect, Request, Response
+from fastapi.responses import StreamingResponse, FileResponse
+from typing import List, Optional, Dict, Union
+import json
+import os
+from datetime import datetime
 from sqlalchemy.orm import Session
-from . import mac_operations, screen_operation, materiel_operation
+from . import mac_operations, screen_operation, materiel_operation, warranty_operations, asset_operations, serial_bloom
+from . import inventory_campaign, reconciliation, change_feed, sync_operations, fast_json, projection, facets, batch_operations, bulk_operations
+from . import revert_operations, idempotency, concurrency, admission, jobs, xlsx_export, archive_operations
+from . import history_operations
 from .database import get_db
 from .models import MacItem, MacItemCreate, MacItemUpdate, EcranItems, EcranCreate, EcranUpdate
+from .models import WarrantyExpiring, WarrantyExpiringReport, AssetItem
+from .models import Campaign, CampaignCreate, ScanBatch, BatchGetRequest, BulkUpdateRequest, BulkRevert, FacetedSearchResult
+from .models import Job, JobCreate
 from . import schemas
+from .models import MacItemDB, EcranItemDB, EquipementDB
 from audit_manager import audit_changes, AuditManager, AuditLog
 
 app = FastAPI(title="Inventory API")
+app.add_middleware(idempotency.IdempotencyMiddleware)
+# Ajouté en dernier : s'exécute en premier, avant toute requête à la base
+app.add_middleware(admission.AdmissionControlMiddleware)
+
+@app.on_event("startup")
+def start_background_tasks():
+    serial_bloom.init_serial_filter()
+    warranty_operations.warranty_scheduler.start()
+    inventory_campaign.scan_flusher.start()
+    jobs.job_runner.start()
+    revert_operations.resume_pending_reverts()
+    idempotency.idempotency_cleaner.start()
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    warranty_operations.warranty_scheduler.stop()
+    inventory_campaign.scan_flusher.stop()
+    idempotency.idempotency_cleaner.stop()
+    jobs.job_runner.stop()
+    serial_bloom.save_serial_filter()
+
+def get_current_user_id(request: Request, x_user_id: Optional[int] = Header(default=None)) -> int:
+    """
+    Utilisateur à l'origine de la requête, enregistré dans l'historique :
+    request.state.user_id s'il est posé par l'authentification, sinon l'en-tête X-User-Id
+    """
+    user_id = getattr(request.state, "user_id", None) or x_user_id
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User identification required (X-User-Id header)")
+    return user_id
 
 # MAC endpoints
 @app.post("/mac-items/", response_model=MacItem)
@@ -15,41 +56,122 @@ def create_mac_item(mac_item: MacItemCreate, db: Session = Depends(get_db)):
     ops = mac_operations.MacOperations(db)
     return ops.create_or_update_mac_item(mac_item.dict())
 
-@app.get("/mac-items/search", response_model=List[MacItem])  # Removed trailing slash
+@app.get("/mac-items/search", response_model=Union[List[MacItem], FacetedSearchResult])  # Removed trailing slash
 def search_mac_items(
     numero_serie: Optional[str] = None,
     modele: Optional[str] = None,
     statut: Optional[str] = None,
+    fast: bool = Query(default=False, description="Sérialisation directe des lignes, sans validation par modèle"),
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    filters: Optional[List[str]] = Query(default=None, alias="filter", description="Ex. ram>=16, stockage_type in (SSD), prix between 100 and 500"),
+    sort: Optional[str] = Query(default=None, description="Ex. -prix,annee_achat"),
+    skip: int = 0,
+    limit: Optional[int] = Query(default=None, ge=1, le=10000),
+    facets_param: Optional[str] = Query(default=None, alias="facets", description="Ex. statut,marque,localisation"),
     db: Session = Depends(get_db)
 ):
     ops = mac_operations.MacOperations(db)
-    return ops.search_mac_items(numero_serie, modele, statut)
+    columns = projection.parse_fields(MacItemDB, MacItem, fields)
+    facet_fields = facets.parse_facets(MacItemDB, facets_param)
+    if fast or columns or facet_fields:
+        keys, rows = ops.search_mac_rows(numero_serie, modele, statut, columns, filters, sort, skip, limit)
+        if facet_fields:
+            return fast_json.FastJSONResponse(fast_json.dumps({
+                "items": [dict(zip(keys, row)) for row in rows],
+                "facets": ops.search_mac_facets(facet_fields, numero_serie, modele, statut, filters),
+            }))
+        return fast_json.FastJSONResponse(fast_json.dump_rows(keys, rows))
+    return ops.search_mac_items(numero_serie, modele, statut, filters, sort, skip, limit)
 
 @app.get("/mac-items/", response_model=List[MacItem])
 def read_mac_items(
     skip: int = 0,
     limit: int = Query(default=100, ge=1, le=100),  # Added ge=1 for validation
+    fast: bool = Query(default=False, description="Sérialisation directe des lignes, sans validation par modèle"),
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
     db: Session = Depends(get_db)
 ):
     ops = mac_operations.MacOperations(db)
+    columns = projection.parse_fields(MacItemDB, MacItem, fields)
+    if fast or columns:
+        keys, rows = ops.list_mac_rows(skip, limit, columns)
+        return fast_json.FastJSONResponse(fast_json.dump_rows(keys, rows))
     return ops.list_mac_items(skip, limit)
 
+@app.post("/mac-items/batch-get")
+def batch_get_mac_items(
+    request: BatchGetRequest,
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    db: Session = Depends(get_db)
+):
+    """
+    Lire plusieurs Mac par identifiants, dans l'ordre demandé (found=false si absent)
+    """
+    columns = projection.parse_fields(MacItemDB, MacItem, fields)
+    ops = batch_operations.BatchOperations(db)
+    return fast_json.FastJSONResponse(fast_json.dumps(ops.get_by_ids(MacItemDB, MacItem, request.ids, columns)))
+
 @app.get("/mac-items/{item_id}", response_model=MacItem)
-def read_mac_item(item_id: int, db: Session = Depends(get_db)):
+def read_mac_item(
+    item_id: int,
+    response: Response,
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    db: Session = Depends(get_db)
+):
     ops = mac_operations.MacOperations(db)
-    return ops.get_mac_item(item_id)
+    columns = projection.parse_fields(MacItemDB, MacItem, fields)
+    if columns:
+        keys, row = ops.get_mac_row(item_id, columns)
+        item = dict(zip(keys, row))
+        headers = {"ETag": concurrency.etag(item["version"])} if "version" in item else None
+        return fast_json.FastJSONResponse(fast_json.dumps(item), headers=headers)
+    result = ops.get_mac_item(item_id)
+    response.headers["ETag"] = concurrency.etag(result[0].version)
+    return result
+
+@app.get("/mac-items/{item_id}/history")
+def read_mac_item_history(
+    item_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=history_operations.DEFAULT_HISTORY_LIMIT, ge=1, le=history_operations.MAX_HISTORY_LIMIT),
+    db: Session = Depends(get_db)
+):
+    """
+    Historique d'un Mac mis en forme, du plus récent au plus ancien, envoyé en flux ;
+    rappeler avec next_cursor pour la page suivante
+    """
+    mac_operations.MacOperations(db).get_mac_row(item_id, [MacItemDB.id_mac])
+    history_operations.decode_history_cursor(cursor)
+    return StreamingResponse(
+        history_operations.stream_record_history("mac_inventory", item_id, cursor, limit),
+        media_type="application/json"
+    )
 
 @app.put("/mac-items/{item_id}", response_model=MacItem)
-def update_mac_item(item_id: int, mac_item: MacItemUpdate, db: Session = Depends(get_db)):
+async def update_mac_item(
+    item_id: int,
+    mac_item: MacItemUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db)
+):
+    """
+    Avec If-Match (ETag lu précédemment), la mise à jour n'est appliquée que si
+    l'article n'a pas été modifié entre-temps ; sinon 412
+    """
     ops = mac_operations.MacOperations(db)
     mac_item_dict = mac_item.dict(exclude_unset=True)
     mac_item_dict["id_mac"] = item_id
-    return ops.create_or_update_mac_item(mac_item_dict)
+    item = await ops.create_or_update_mac_item(
+        mac_item_dict, expected_version=concurrency.parse_if_match(if_match)
+    )
+    response.headers["ETag"] = concurrency.etag(item.version)
+    return item
 
 @app.delete("/mac-items/{item_id}")
-def delete_mac_item(item_id: int, db: Session = Depends(get_db)):
+def delete_mac_item(item_id: int, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
     ops = mac_operations.MacOperations(db)
-    ops.delete_mac_item(item_id)
+    ops.delete_mac_item(item_id, user_id)
     return {"message": "Item deleted successfully"}
 
 # Screen endpoints
@@ -58,41 +180,121 @@ def create_ecran_item(ecran_item: EcranCreate, db: Session = Depends(get_db)):
     ops = screen_operation.ScreenOperations(db)
     return ops.create_or_update_ecran_item(ecran_item.dict())
 
-@app.get("/ecran-items/search", response_model=List[EcranItems])  # Removed trailing slash
+@app.get("/ecran-items/search", response_model=Union[List[EcranItems], FacetedSearchResult])  # Removed trailing slash
 def search_ecran_items(
     numero_serie: Optional[str] = None,
     modele: Optional[str] = None,
     statut: Optional[str] = None,
+    fast: bool = Query(default=False, description="Sérialisation directe des lignes, sans validation par modèle"),
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    filters: Optional[List[str]] = Query(default=None, alias="filter", description="Ex. ram>=16, stockage_type in (SSD), prix between 100 and 500"),
+    sort: Optional[str] = Query(default=None, description="Ex. -prix,annee_achat"),
+    skip: int = 0,
+    limit: Optional[int] = Query(default=None, ge=1, le=10000),
+    facets_param: Optional[str] = Query(default=None, alias="facets", description="Ex. statut,marque,localisation"),
     db: Session = Depends(get_db)
 ):
     ops = screen_operation.ScreenOperations(db)
-    return ops.search_ecran_items(numero_serie, modele, statut)
+    columns = projection.parse_fields(EcranItemDB, EcranItems, fields)
+    facet_fields = facets.parse_facets(EcranItemDB, facets_param)
+    if fast or columns or facet_fields:
+        keys, rows = ops.search_ecran_rows(numero_serie, modele, statut, columns, filters, sort, skip, limit)
+        if facet_fields:
+            return fast_json.FastJSONResponse(fast_json.dumps({
+                "items": [dict(zip(keys, row)) for row in rows],
+                "facets": ops.search_ecran_facets(facet_fields, numero_serie, modele, statut, filters),
+            }))
+        return fast_json.FastJSONResponse(fast_json.dump_rows(keys, rows))
+    return ops.search_ecran_items(numero_serie, modele, statut, filters, sort, skip, limit)
 
 @app.get("/ecran-items/", response_model=List[EcranItems])
 def read_ecran_items(
     skip: int = 0,
     limit: int = Query(default=100, ge=1, le=100),  # Added ge=1 for validation
+    fast: bool = Query(default=False, description="Sérialisation directe des lignes, sans validation par modèle"),
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
     db: Session = Depends(get_db)
 ):
     ops = screen_operation.ScreenOperations(db)
+    columns = projection.parse_fields(EcranItemDB, EcranItems, fields)
+    if fast or columns:
+        keys, rows = ops.list_ecran_rows(skip, limit, columns)
+        return fast_json.FastJSONResponse(fast_json.dump_rows(keys, rows))
     return ops.list_ecran_items(skip, limit)
 
+@app.post("/ecran-items/batch-get")
+def batch_get_ecran_items(
+    request: BatchGetRequest,
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    db: Session = Depends(get_db)
+):
+    """
+    Lire plusieurs écrans par identifiants, dans l'ordre demandé (found=false si absent)
+    """
+    columns = projection.parse_fields(EcranItemDB, EcranItems, fields)
+    ops = batch_operations.BatchOperations(db)
+    return fast_json.FastJSONResponse(fast_json.dumps(ops.get_by_ids(EcranItemDB, EcranItems, request.ids, columns)))
+
 @app.get("/ecran-items/{item_id}", response_model=EcranItems)
-def read_ecran_item(item_id: int, db: Session = Depends(get_db)):
+def read_ecran_item(
+    item_id: int,
+    response: Response,
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    db: Session = Depends(get_db)
+):
     ops = screen_operation.ScreenOperations(db)
-    return ops.get_ecran_item(item_id)
+    columns = projection.parse_fields(EcranItemDB, EcranItems, fields)
+    if columns:
+        keys, row = ops.get_ecran_row(item_id, columns)
+        item = dict(zip(keys, row))
+        headers = {"ETag": concurrency.etag(item["version"])} if "version" in item else None
+        return fast_json.FastJSONResponse(fast_json.dumps(item), headers=headers)
+    result = ops.get_ecran_item(item_id)
+    response.headers["ETag"] = concurrency.etag(result[0].version)
+    return result
+
+@app.get("/ecran-items/{item_id}/history")
+def read_ecran_item_history(
+    item_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=history_operations.DEFAULT_HISTORY_LIMIT, ge=1, le=history_operations.MAX_HISTORY_LIMIT),
+    db: Session = Depends(get_db)
+):
+    """
+    Historique d'un écran mis en forme, du plus récent au plus ancien, envoyé en flux ;
+    rappeler avec next_cursor pour la page suivante
+    """
+    screen_operation.ScreenOperations(db).get_ecran_row(item_id, [EcranItemDB.id_ecran])
+    history_operations.decode_history_cursor(cursor)
+    return StreamingResponse(
+        history_operations.stream_record_history("ecran", item_id, cursor, limit),
+        media_type="application/json"
+    )
 
 @app.put("/ecran-items/{item_id}", response_model=EcranItems)
-def update_ecran_item(item_id: int, ecran_item: EcranUpdate, db: Session = Depends(get_db)):
+async def update_ecran_item(
+    item_id: int,
+    ecran_item: EcranUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db)
+):
+    """
+    Avec If-Match, la mise à jour n'est appliquée que si l'écran n'a pas été modifié entre-temps ; sinon 412
+    """
     ops = screen_operation.ScreenOperations(db)
     ecran_item_dict = ecran_item.dict(exclude_unset=True)
     ecran_item_dict["id_ecran"] = item_id
-    return ops.create_or_update_ecran_item(ecran_item_dict)
+    item = await ops.create_or_update_ecran_item(
+        ecran_item_dict, expected_version=concurrency.parse_if_match(if_match)
+    )
+    response.headers["ETag"] = concurrency.etag(item.version)
+    return item
 
 @app.delete("/ecran-items/{item_id}")
-def delete_ecran_item(item_id: int, db: Session = Depends(get_db)):
+def delete_ecran_item(item_id: int, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
     ops = screen_operation.ScreenOperations(db)
-    ops.delete_ecran_item(item_id)
+    ops.delete_ecran_item(item_id, user_id)
     return {"message": "Screen deleted successfully"}
 
 # Endpoints pour Categorie
@@ -113,29 +315,46 @@ def read_categorie(categorie_id: int, db: Session = Depends(get_db)):
     return db_categorie
 
 @app.put("/categories/{categorie_id}", response_model=schemas.Categorie)
-def update_categorie_endpoint(categorie_id: int, categorie: schemas.CategorieCreate, db: Session = Depends(get_db)):
-    return materiel_operation.update_categorie(db=db, categorie_id=categorie_id, categorie=categorie)
+def update_categorie_endpoint(
+    categorie_id: int,
+    categorie: schemas.CategorieCreate,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db)
+):
+    operations = materiel_operation.CategorieOperations(db)
+    db_categorie = operations.update_categorie(
+        categorie_id, categorie.dict(exclude_unset=True), concurrency.parse_if_match(if_match)
+    )
+    response.headers["ETag"] = concurrency.etag(db_categorie.version)
+    return db_categorie
 
 @app.delete("/categories/{categorie_id}", response_model=schemas.Categorie)
-def delete_categorie_endpoint(categorie_id: int, db: Session = Depends(get_db)):
-    return materiel_operation.delete_categorie(db=db, categorie_id=categorie_id)
+def delete_categorie_endpoint(categorie_id: int, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    operations = materiel_operation.CategorieOperations(db)
+    return operations.delete_categorie(categorie_id, user_id)
 
 # Endpoints pour Equipement
 @app.post("/equipements/", response_model=schemas.Equipement)
 def create_or_update_equipement(
     equipement_data: Dict,
+    response: Response,
     detail_data: Optional[Dict] = None,
+    if_match: Optional[str] = Header(default=None),
     db: Session = Depends(get_db)
 ):
     """
-    Créer ou mettre à jour un équipement avec ses détails optionnels
+    Créer ou mettre à jour un équipement avec ses détails optionnels.
+    Avec If-Match, la mise à jour est refusée (412) si l'équipement a changé entre-temps.
     """
     try:
         operations = materiel_operation.EquipementOperations(db)
         equipement = operations.create_or_update_equipement(
             equipement_data, 
-            detail_data
+            detail_data,
+            expected_version=concurrency.parse_if_match(if_match)
         )
+        response.headers["ETag"] = concurrency.etag(equipement.version)
         return equipement
     except HTTPException as e:
         raise e
@@ -144,35 +363,100 @@ def create_or_update_equipement(
 def list_equipements(
     skip: int = 0, 
     limit: int = 100,
+    include: Optional[str] = Query(default=None, description="categorie,details"),
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    db: Session = Depends(get_db)
+):
+    """
+    Récupérer la liste des équipements, avec catégorie et détails si demandés
+    """
+    includes = materiel_operation.parse_includes(include)
+    operations = materiel_operation.EquipementOperations(db)
+    columns = projection.parse_fields(EquipementDB, schemas.Equipement, fields)
+    if columns:
+        if includes:
+            raise HTTPException(status_code=400, detail="fields cannot be combined with include")
+        keys, rows = operations.list_equipement_rows(skip, limit, columns)
+        return fast_json.FastJSONResponse(fast_json.dump_rows(keys, rows))
+    return operations.get_all_equipements(skip, limit, includes)
+
+@app.get("/equipements/search", response_model=Union[List[schemas.Equipement], FacetedSearchResult])
+def search_equipements(
+    filters: Optional[List[str]] = Query(default=None, alias="filter", description="Ex. ram>=16, stockage_type in (SSD), prix between 100 and 500"),
+    sort: Optional[str] = Query(default=None, description="Ex. -prix,annee_achat"),
+    skip: int = 0,
+    limit: Optional[int] = Query(default=None, ge=1, le=10000),
+    include: Optional[str] = Query(default=None, description="categorie,details"),
+    facets_param: Optional[str] = Query(default=None, alias="facets", description="Ex. statut,marque,localisation"),
     db: Session = Depends(get_db)
 ):
     """
-    Récupérer la liste des équipements
+    Rechercher des équipements avec le langage de filtres, et les comptes par facette si demandés
     """
+    includes = materiel_operation.parse_includes(include)
     operations = materiel_operation.EquipementOperations(db)
-    return operations.get_all_equipements(skip, limit)
+    equipements = operations.search_equipements(filters, sort, skip, limit, includes)
+    facet_fields = facets.parse_facets(EquipementDB, facets_param)
+    if facet_fields:
+        return fast_json.FastJSONResponse(fast_json.dumps({
+            "items": [schemas.Equipement.model_validate(e).model_dump(mode="json") for e in equipements],
+            "facets": operations.search_equipement_facets(facet_fields, filters),
+        }))
+    return equipements
+
+@app.post("/equipements/batch-get")
+def batch_get_equipements(
+    request: BatchGetRequest,
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
+    db: Session = Depends(get_db)
+):
+    """
+    Lire plusieurs équipements par identifiants, dans l'ordre demandé (found=false si absent)
+    """
+    columns = projection.parse_fields(EquipementDB, schemas.Equipement, fields)
+    ops = batch_operations.BatchOperations(db)
+    return fast_json.FastJSONResponse(fast_json.dumps(ops.get_by_ids(EquipementDB, schemas.Equipement, request.ids, columns)))
 
 @app.get("/equipements/{equipement_id}")
 def get_equipement_details(
     equipement_id: int, 
+    response: Response,
+    include: Optional[str] = Query(default=None, description="categorie,details"),
+    fields: Optional[str] = Query(default=None, description="Colonnes à renvoyer, séparées par des virgules"),
     db: Session = Depends(get_db)
 ):
     """
     Récupérer les détails d'un équipement spécifique
     """
     operations = materiel_operation.EquipementOperations(db)
-    return operations.get_equipement_with_details(equipement_id)
+    columns = projection.parse_fields(EquipementDB, schemas.Equipement, fields)
+    if columns:
+        if include:
+            raise HTTPException(status_code=400, detail="fields cannot be combined with include")
+        keys, row = operations.get_equipement_row(equipement_id, columns)
+        item = dict(zip(keys, row))
+        headers = {"ETag": concurrency.etag(item["version"])} if "version" in item else None
+        return fast_json.FastJSONResponse(fast_json.dumps(item), headers=headers)
+    if include is None:
+        result = operations.get_equipement_with_details(equipement_id)
+        response.headers["ETag"] = concurrency.etag(result["equipement"].version)
+        return result
+    includes = materiel_operation.parse_includes(include)
+    equipement = operations.get_equipement(equipement_id, includes)
+    response.headers["ETag"] = concurrency.etag(equipement.version)
+    return schemas.Equipement.model_validate(equipement)
 
 @app.delete("/equipements/{equipement_id}", response_model=schemas.Equipement)
 def delete_equipement(
     equipement_id: int, 
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """
     Supprimer un équipement et ses détails associés
     """
     operations = materiel_operation.EquipementOperations(db)
-    return operations.delete_equipement(equipement_id)
+    return operations.delete_equipement(equipement_id, user_id)
 
 
 # Endpoints pour DetailEquipement
@@ -188,13 +472,334 @@ def read_detail(detail_id: int, db: Session = Depends(get_db)):
     return db_detail
 
 @app.put("/details/{detail_id}", response_model=schemas.DetailEquipement)
-def update_detail_endpoint(detail_id: int, detail: schemas.DetailEquipementCreate, db: Session = Depends(get_db)):
-    return materiel_operation.update_detail_equipement(db=db, detail_id=detail_id, detail=detail)
+def update_detail_endpoint(
+    detail_id: int,
+    detail: schemas.DetailEquipementCreate,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db)
+):
+    operations = materiel_operation.DetailEquipementOperations(db)
+    db_detail = operations.update_detail(
+        detail_id, detail.dict(exclude_unset=True), concurrency.parse_if_match(if_match)
+    )
+    response.headers["ETag"] = concurrency.etag(db_detail.version)
+    return db_detail
 
 @app.delete("/details/{detail_id}", response_model=schemas.DetailEquipement)
-def delete_detail_endpoint(detail_id: int, db: Session = Depends(get_db)):
-    return materiel_operation.delete_detail_equipement(db=db, detail_id=detail_id)
+def delete_detail_endpoint(detail_id: int, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    operations = materiel_operation.DetailEquipementOperations(db)
+    return operations.delete_detail(detail_id, user_id)
+
 
+# Modification groupée (statut, localisation...) en une transaction
+@app.post("/bulk/{table_name}")
+def bulk_update_items(
+    table_name: str,
+    request: BulkUpdateRequest,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Appliquer les mêmes changements à un ensemble d'articles sélectionnés par ids
+    ou par filtres ; renvoie le batch_id de l'historique et le nombre de lignes modifiées
+    """
+    ops = bulk_operations.BulkOperations(db)
+    return ops.bulk_update(table_name, request.changes, user_id, request.ids, request.filters)
+
+@app.post("/operations/{batch_id}/revert", response_model=BulkRevert)
+def revert_bulk_operation(
+    batch_id: str,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Annuler une opération groupée à partir des anciennes valeurs de l'historique.
+    L'annulation s'exécute en arrière-plan ; rappeler l'endpoint relance une annulation échouée.
+    """
+    ops = revert_operations.RevertOperations(db)
+    return ops.start_revert(batch_id, user_id)
+
+@app.get("/operations/{batch_id}/revert", response_model=BulkRevert)
+def read_bulk_revert(batch_id: str, db: Session = Depends(get_db)):
+    ops = revert_operations.RevertOperations(db)
+    return ops.get_revert(batch_id)
+
+# Recherche d'un matériel par numéro de série, tous types confondus
+@app.get("/assets/{numero_serie}", response_model=AssetItem)
+def read_asset(numero_serie: str, db: Session = Depends(get_db)):
+    """
+    Retrouver un Mac, un écran ou un équipement à partir de son numéro de série
+    """
+    ops = asset_operations.AssetOperations(db)
+    return ops.get_by_serial(numero_serie)
+
+# Endpoints pour les garanties
+@app.get("/warranty/expiring", response_model=List[WarrantyExpiring])
+def read_expiring_warranties(
+    within_days: int = Query(default=30, ge=0, le=3650),
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    Lister les garanties (Mac, écrans, équipements) expirant dans les prochains jours
+    """
+    ops = warranty_operations.WarrantyOperations(db)
+    return ops.get_expiring(within_days, skip, limit)
+
+@app.get("/warranty/expiring-soon", response_model=List[WarrantyExpiringReport])
+def read_expiring_soon_report(
+    within_days: int = Query(default=warranty_operations.SCAN_HORIZON_DAYS, ge=0, le=3650),
+    notifie: Optional[bool] = None,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    Rapport matérialisé des garanties expirant bientôt, avec état de notification
+    """
+    ops = warranty_operations.WarrantyOperations(db)
+    return ops.get_expiring_report(within_days, notifie, skip, limit)
+
+@app.post("/warranty/expiring-soon/{entry_id}/notify", response_model=WarrantyExpiringReport)
+def notify_expiring_warranty(entry_id: int, db: Session = Depends(get_db)):
+    ops = warranty_operations.WarrantyOperations(db)
+    return ops.mark_notified(entry_id)
+
+@app.post("/warranty/scan")
+def scan_expiring_warranties(db: Session = Depends(get_db)):
+    """
+    Déclencher immédiatement le scan des garanties (normalement quotidien)
+    """
+    ops = warranty_operations.WarrantyOperations(db)
+    return {"materialized": ops.refresh_expiring_table()}
+
+
+# Endpoints pour les campagnes d'inventaire
+@app.post("/campaigns/", response_model=Campaign)
+def open_campaign(campaign: CampaignCreate, db: Session = Depends(get_db)):
+    ops = inventory_campaign.CampaignOperations(db)
+    return ops.open_campaign(campaign.dict())
+
+@app.get("/campaigns/{campaign_id}", response_model=Campaign)
+def read_campaign(campaign_id: int, db: Session = Depends(get_db)):
+    ops = inventory_campaign.CampaignOperations(db)
+    return ops.get_campaign(campaign_id)
+
+@app.post("/campaigns/{campaign_id}/scans")
+def add_campaign_scans(
+    campaign_id: int,
+    batch: ScanBatch,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Enregistrer un lot de numéros de série scannés à une localisation
+    """
+    ops = inventory_campaign.CampaignOperations(db)
+    return ops.add_scans(campaign_id, batch.localisation, batch.numeros_serie, user_id)
+
+@app.get("/campaigns/{campaign_id}/progress")
+def read_campaign_progress(campaign_id: int, db: Session = Depends(get_db)):
+    """
+    Compteurs de progression par localisation (scans appliqués et en attente)
+    """
+    ops = inventory_campaign.CampaignOperations(db)
+    return ops.get_progress(campaign_id)
+
+@app.post("/campaigns/{campaign_id}/close", response_model=Campaign)
+def close_campaign(campaign_id: int, db: Session = Depends(get_db)):
+    ops = inventory_campaign.CampaignOperations(db)
+    return ops.close_campaign(campaign_id)
+
+@app.get("/campaigns/{campaign_id}/reconciliation")
+def read_campaign_reconciliation(
+    campaign_id: int,
+    response: Response,
+    format: str = Query(default="json", pattern="^(json|csv)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Écarts entre les scans de la campagne et la base : résumé par localisation
+    en JSON, ou liste complète en CSV produite par une tâche de fond (202 et la
+    tâche, dont le résultat se télécharge avec GET /jobs/{job_id}/result)
+    """
+    ops = inventory_campaign.CampaignOperations(db)
+    ops.get_campaign(campaign_id)
+
+    if format == "csv":
+        job = jobs.JobOperations(db).create_job("reconciliation", {"campaign_id": campaign_id})
+        response.status_code = 202
+        response.headers["Location"] = f"/jobs/{job.id}"
+        return Job.model_validate(job)
+
+    ops.flush(campaign_id)
+    return reconciliation.ReconciliationEngine(db).summary(campaign_id)
+
+
+# Synchronisation incrémentale pour les clients hors ligne
+@app.get("/sync")
+def sync_inventory(
+    since: Optional[str] = None,
+    limit: int = Query(default=sync_operations.DEFAULT_SYNC_LIMIT, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """
+    Articles créés/modifiés et supprimés depuis le curseur, avec le nouveau curseur.
+    Rappeler avec ce curseur tant que has_more est vrai. 410 : le curseur précède
+    l'historique archivé, resynchroniser sans curseur.
+    """
+    ops = sync_operations.SyncOperations(db)
+    return ops.get_changes(since, limit)
+
+# Flux des changements (historique d'audit en direct)
+@app.get("/changes/stream")
+async def stream_changes(
+    table_name: Optional[str] = None,
+    since_id: Optional[int] = None,
+    last_event_id: Optional[int] = Header(default=None)
+):
+    """
+    Server-Sent Events : diffuse les entrées d'audit au fil de l'eau.
+    La reprise se fait avec since_id ou l'en-tête Last-Event-ID.
+    """
+    resume_from = since_id if since_id is not None else last_event_id
+
+    async def events():
+        async for entry in change_feed.publisher.stream(table_name, resume_from):
+            if entry is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {entry['id']}\nevent: change\ndata: {json.dumps(entry, default=str)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/changes/ws")
+async def websocket_changes(
+    websocket: WebSocket,
+    table_name: Optional[str] = None,
+    since_id: Optional[int] = None
+):
+    await websocket.accept()
+    try:
+        async for entry in change_feed.publisher.stream(table_name, since_id):
+            if entry is None:
+                await websocket.send_json({"type": "heartbeat"})
+                continue
+            await websocket.send_text(json.dumps(entry, default=str))
+    except WebSocketDisconnect:
+        pass
+
+
+# Tâches de fond : exports, rapports et archivage
+@app.post("/jobs/", response_model=Job, status_code=202)
+def create_job(job: JobCreate, db: Session = Depends(get_db)):
+    """
+    Lancer une tâche de fond (ex. {"type": "reconciliation", "params": {"campaign_id": 1}}) ;
+    suivre ensuite sa progression avec GET /jobs/{job_id}
+    """
+    ops = jobs.JobOperations(db)
+    return ops.create_job(job.type, job.params)
+
+@app.get("/jobs/", response_model=List[Job])
+def list_jobs(
+    type: Optional[str] = None,
+    statut: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    ops = jobs.JobOperations(db)
+    return ops.list_jobs(type, statut, skip, limit)
+
+@app.get("/jobs/{job_id}", response_model=Job)
+def read_job(job_id: str, db: Session = Depends(get_db)):
+    ops = jobs.JobOperations(db)
+    return ops.get_job(job_id)
+
+@app.post("/jobs/{job_id}/cancel", response_model=Job)
+def cancel_job(job_id: str, db: Session = Depends(get_db)):
+    ops = jobs.JobOperations(db)
+    return ops.cancel_job(job_id)
+
+@app.get("/jobs/{job_id}/result")
+def read_job_result(job_id: str, db: Session = Depends(get_db)):
+    """
+    Télécharger le fichier produit par une tâche terminée
+    """
+    ops = jobs.JobOperations(db)
+    job = ops.get_result_file(job_id)
+    return FileResponse(
+        job.result_path,
+        media_type=job.result_content_type,
+        filename=os.path.basename(job.result_path)
+    )
+
+
+# Exports
+@app.post("/exports/inventory", response_model=Job, status_code=202)
+def export_inventory(
+    format: str = Query(default="xlsx", pattern="^xlsx$"),
+    tables: Optional[str] = Query(default=None, description="Ex. mac_inventory,ecran,equipements"),
+    db: Session = Depends(get_db)
+):
+    """
+    Export Excel de l'inventaire (une feuille par table), généré en tâche de fond ;
+    le fichier est ensuite téléchargé avec GET /jobs/{job_id}/result
+    """
+    if xlsx_export.Workbook is None:
+        raise HTTPException(status_code=501, detail="XLSX export requires the openpyxl package")
+    ops = jobs.JobOperations(db)
+    return ops.create_job("inventory_xlsx", {"tables": xlsx_export.parse_tables(tables)})
+
+
+# Historique
+@app.get("/history")
+def query_history(
+    table_name: Optional[List[str]] = Query(default=None, description="Une ou plusieurs tables ; toutes si absent"),
+    record_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = Query(default=None, pattern="^(CREATE|UPDATE|DELETE)$"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=history_operations.DEFAULT_HISTORY_LIMIT, ge=1, le=history_operations.MAX_HISTORY_LIMIT),
+    db: Session = Depends(get_db)
+):
+    """
+    Rechercher dans l'historique (ex. toutes les suppressions d'un utilisateur sur
+    un trimestre). Rappeler avec next_cursor pour obtenir la page suivante.
+    """
+    ops = history_operations.HistoryOperations(db)
+    return ops.query_history(table_name, record_id, user_id, action, start_date, end_date, cursor, limit)
+
+@app.get("/history/field-changes")
+def query_field_changes(
+    field: str,
+    new: Optional[str] = None,
+    old: Optional[str] = None,
+    table_name: Optional[List[str]] = Query(default=None, description="Une ou plusieurs tables ; toutes si absent"),
+    record_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=history_operations.DEFAULT_HISTORY_LIMIT, ge=1, le=history_operations.MAX_HISTORY_LIMIT),
+    db: Session = Depends(get_db)
+):
+    """
+    Qui a changé quoi en quoi (ex. field=statut&new=Vendu). L'index est alimenté à
+    chaque écriture d'historique ; la tâche "audit_field_changes" reprend l'existant.
+    """
+    ops = history_operations.HistoryOperations(db)
+    return ops.query_field_changes(
+        field, new, old, table_name, record_id, user_id, start_date, end_date, cursor, limit
+    )
 
 @app.get("/history/{table_name}/{record_id}")
 async def get_record_history(
@@ -0,0 +1,194 @@
+from typing import Dict, Optional
+from fastapi.responses import JSONResponse
+from collections import deque
+import asyncio
+import logging
+import re
+import time
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+# Part de chaque classe de route dans les requêtes simultanées. Les limites sont
+# tirées de la capacité du pool des routes (pool_size + max_overflow) : le total
+# reste sous cette capacité, une classe saturée ne peut pas bloquer les autres
+# sur pool_timeout, et "hot" garde une capacité réservée. Le middleware
+# d'idempotence et les threads de fond ont leur propre pool (service_engine).
+ROUTE_CLASS_SHARES = {
+    "hot": 6,
+    "read": 10,
+    "write": 8,
+    "export": 2,
+    "history": 4,
+}
+# Capacité retenue quand le pool n'a pas de taille fixe (NullPool, StaticPool)
+DEFAULT_POOL_CAPACITY = 30
+# Attente maximale dans la file d'une classe (budget de latence)
+ROUTE_CLASS_MAX_WAIT = {
+    "hot": 0.5,
+    "read": 2.0,
+    "write": 5.0,
+    "export": 1.0,
+    "history": 2.0,
+}
+MAX_QUEUE_LENGTH = 100
+# CoDel : si l'attente en file reste au-dessus de TARGET_DELAY pendant tout
+# un INTERVAL, la classe passe en délestage jusqu'à ce que la file se vide
+CODEL_TARGET_DELAY = 0.1
+CODEL_INTERVAL = 1.0
+RETRY_AFTER_SECONDS = 1
+
+_SINGLE_ITEM_PATTERN = re.compile(r"^/(?:[\w-]+/\d+|assets/[^/]+)/?$")
+# Flux longs (SSE) : ils occupent une connexion HTTP, pas le pool de la base
+_UNLIMITED_PREFIXES = ("/changes/",)
+
+
+class Overloaded(Exception):
+    pass
+
+
+def pool_capacity(pool) -> int:
+    """Connexions simultanées permises par un QueuePool : pool_size + max_overflow"""
+    try:
+        size = pool.size()
+    except AttributeError:
+        return DEFAULT_POOL_CAPACITY
+    # max_overflow = -1 : débordement illimité
+    overflow = getattr(pool, "_max_overflow", 0)
+    if overflow < 0:
+        return DEFAULT_POOL_CAPACITY
+    return size + overflow
+
+
+def route_class_limits(capacity: int) -> Dict[str, int]:
+    """Répartit la capacité entre les classes selon ROUTE_CLASS_SHARES (au moins 1 chacune)"""
+    total = sum(ROUTE_CLASS_SHARES.values())
+    return {
+        name: max(1, capacity * share // total)
+        for name, share in ROUTE_CLASS_SHARES.items()
+    }
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    if path.startswith(_UNLIMITED_PREFIXES):
+        return None
+    if path.startswith("/history") or path.endswith("/history"):
+        return "history"
+    if path.endswith(("/reconciliation", "/result")) or "/export" in path:
+        return "export"
+    if method in ("GET", "HEAD"):
+        return "hot" if _SINGLE_ITEM_PATTERN.match(path) else "read"
+    if path.endswith("/batch-get"):
+        return "read"
+    return "write"
+
+
+class RouteClassLimiter:
+    """
+    Sémaphore à file FIFO avec délestage CoDel. Utilisé uniquement depuis la
+    boucle asyncio du worker : pas de verrou nécessaire.
+    """
+
+    def __init__(self, name: str, limit: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.waiters = deque()
+        self.first_above_time = 0.0
+        self.dropping = False
+
+    def _record_sojourn(self, sojourn: float):
+        now = time.monotonic()
+        if sojourn < CODEL_TARGET_DELAY:
+            self.first_above_time = 0.0
+            self.dropping = False
+        elif self.first_above_time == 0.0:
+            self.first_above_time = now + CODEL_INTERVAL
+        elif now >= self.first_above_time:
+            if not self.dropping:
+                logger.warning(f"Admission control: shedding {self.name} requests, queue delay {sojourn:.3f}s")
+            self.dropping = True
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            self._record_sojourn(0.0)
+            return
+        if (self.dropping and self.waiters) or len(self.waiters) >= MAX_QUEUE_LENGTH:
+            raise Overloaded()
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        enqueued = time.monotonic()
+        try:
+            # Le créneau est transmis par release() : in_flight reste inchangé
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # Créneau attribué au moment de l'expiration : on le rend
+                self.release()
+            else:
+                future.cancel()
+                self.waiters.remove(future)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._record_sojourn(time.monotonic() - enqueued)
+            raise Overloaded()
+        self._record_sojourn(time.monotonic() - enqueued)
+
+    def release(self):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionControlMiddleware:
+    """
+    Limite les requêtes en cours par classe de route et répond 503 + Retry-After
+    plutôt que de laisser les requêtes s'accumuler derrière le pool de connexions.
+    Middleware ASGI pur : le créneau est rendu quand la réponse (même en flux)
+    est entièrement envoyée.
+    """
+
+    def __init__(self, app, capacity: Optional[int] = None):
+        self.app = app
+        if capacity is None:
+            capacity = pool_capacity(engine.pool)
+        limits = route_class_limits(capacity)
+        logger.info(f"Admission control limits for a pool of {capacity} connections: {limits}")
+        self.limiters: Dict[str, RouteClassLimiter] = {
+            name: RouteClassLimiter(name, limit, ROUTE_CLASS_MAX_WAIT[name])
+            for name, limit in limits.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_class = classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[route_class]
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server overloaded, retry later"},
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
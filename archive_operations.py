@@ -0,0 +1,109 @@
+from typing import Dict
+from sqlalchemy import select, delete, insert, func
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+import os
+
+from .jobs import register_job, JobContext
+from audit_manager import AuditLog, AuditFieldChange, field_change_rows
+from audit_archive import audit_archive
+
+logger = logging.getLogger(__name__)
+
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "365"))
+ARCHIVE_CHUNK_SIZE = 20000
+DELETE_CHUNK_SIZE = 1000
+FIELD_CHANGES_CHUNK_SIZE = 5000
+
+
+@register_job("audit_archive", exclusive=True)
+def run_audit_archive_job(context: JobContext) -> Dict:
+    """
+    Déplace les entrées d'historique plus anciennes que la rétention vers les
+    segments Parquet, par lots : fichiers et manifeste d'abord, puis suppression
+    et commit. Un arrêt entre les deux laisse un doublon, ignoré à la lecture.
+    Une seule tâche d'archivage s'exécute à la fois (register_job exclusive).
+    """
+    if not audit_archive.available:
+        raise RuntimeError("Audit archival requires the pyarrow package")
+
+    retention_days = int(context.params.get("retention_days", AUDIT_RETENTION_DAYS))
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    db = context.db
+
+    total = db.query(func.count(AuditLog.id)).filter(AuditLog.timestamp < cutoff).scalar() or 0
+    archived, segments = 0, 0
+    while True:
+        rows = db.execute(
+            select(AuditLog.__table__).where(AuditLog.timestamp < cutoff)
+            .order_by(AuditLog.id).limit(ARCHIVE_CHUNK_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+
+        groups = defaultdict(list)
+        for row in rows:
+            entry = dict(row)
+            entry["action"] = entry["action"].value
+            groups[(entry["table_name"], entry["timestamp"].strftime("%Y-%m"))].append(entry)
+        for (table_name, month), entries in groups.items():
+            audit_archive.write_segment(table_name, month, entries)
+        segments += len(groups)
+
+        ids = [row["id"] for row in rows]
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            db.execute(delete(AuditLog).where(AuditLog.id.in_(ids[start:start + DELETE_CHUNK_SIZE])))
+        db.commit()
+
+        archived += len(rows)
+        context.progress(archived * 100 // total if total else 0, f"{archived} entries archived")
+
+    logger.info(f"Archived {archived} audit entries older than {cutoff.isoformat()} into {segments} segments")
+    return {"archived": archived, "segments": segments, "cutoff": cutoff.isoformat()}
+
+
+@register_job("audit_field_changes", exclusive=True)
+def run_field_changes_backfill_job(context: JobContext) -> Dict:
+    """
+    Alimente audit_field_changes à partir des entrées d'historique existantes,
+    par lots commités dans l'ordre des id. La progression ne dépend que de
+    last_id : les entrées déjà indexées (écritures récentes, lot repris après
+    un arrêt) sont écartées lot par lot, et celles sans champ modifié ne sont
+    parcourues qu'une fois par exécution. Deux exécutions simultanées passeraient
+    toutes deux ce contrôle : la tâche est exclusive (register_job).
+    """
+    db = context.db
+    total = db.query(func.count(AuditLog.id)).scalar() or 0
+    last_id, scanned, indexed = 0, 0, 0
+    while True:
+        rows = db.execute(
+            select(
+                AuditLog.id, AuditLog.table_name, AuditLog.record_id, AuditLog.old_values,
+                AuditLog.new_values, AuditLog.timestamp, AuditLog.user_id
+            ).where(AuditLog.id > last_id)
+            .order_by(AuditLog.id).limit(FIELD_CHANGES_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        already_indexed = set(db.execute(
+            select(AuditFieldChange.audit_log_id).distinct().where(
+                AuditFieldChange.audit_log_id.between(rows[0].id, rows[-1].id)
+            )
+        ).scalars())
+        changes = [
+            change for row in rows if row.id not in already_indexed
+            for change in field_change_rows(*row)
+        ]
+        if changes:
+            db.execute(insert(AuditFieldChange), changes)
+        db.commit()
+
+        last_id = rows[-1].id
+        scanned += len(rows)
+        indexed += len(changes)
+        context.progress(min(scanned * 100 // total, 99) if total else 0, f"{scanned} entries scanned")
+
+    logger.info(f"Indexed {indexed} field changes from {scanned} audit entries")
+    return {"entries": scanned, "field_changes": indexed}
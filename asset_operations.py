@@ -0,0 +1,43 @@
+from fastapi import HTTPException
+from typing import Dict
+from sqlalchemy import select, literal, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+
+from .models import INVENTORY_MODELS, INVENTORY_COMMON_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+class AssetOperations:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_by_serial(self, numero_serie: str) -> Dict:
+        """
+        Recherche un numéro de série dans toutes les tables d'inventaire en une requête.
+        numero_serie est unique (donc indexé) sur chaque table : chaque branche
+        du UNION ALL est une recherche par index.
+        """
+        try:
+            branches = []
+            for table_name, model in INVENTORY_MODELS.items():
+                pk = model.__mapper__.primary_key[0]
+                branches.append(
+                    select(
+                        literal(table_name).label("table_name"),
+                        pk.label("record_id"),
+                        *[getattr(model, field) for field in INVENTORY_COMMON_FIELDS]
+                    ).where(model.numero_serie == numero_serie)
+                )
+
+            row = self.db.execute(union_all(*branches)).mappings().first()
+            if not row:
+                logger.warning(f"Asset not found with serial number: {numero_serie}")
+                raise HTTPException(status_code=404, detail="Asset not found")
+            return dict(row)
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
@@ -0,0 +1,280 @@
+# audit_archive.py
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+import json
+import logging
+import os
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows : le verrou entre processus n'est pas disponible
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow est optionnel, requis seulement pour l'archivage
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_LOCK_NAME = "manifest.lock"
+ARCHIVE_COMPRESSION = "zstd"
+
+ARCHIVE_COLUMNS = [
+    "id", "table_name", "record_id", "action", "old_values", "new_values",
+    "user_id", "timestamp", "ip_address", "user_agent", "batch_id",
+]
+# Valeurs JSON stockées en texte : leur structure varie d'une table à l'autre
+JSON_COLUMNS = ("old_values", "new_values")
+
+
+def _archive_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("table_name", pa.string()),
+        ("record_id", pa.int64()),
+        ("action", pa.string()),
+        ("old_values", pa.string()),
+        ("new_values", pa.string()),
+        ("user_id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("ip_address", pa.string()),
+        ("user_agent", pa.string()),
+        ("batch_id", pa.string()),
+    ])
+
+
+class AuditArchive:
+    """
+    Segments Parquet (zstd) de l'historique archivé, rangés par table et par mois :
+    <dir>/<table_name>/<AAAA-MM>/part-<uuid>.parquet. Le manifeste garde pour chaque
+    fichier les bornes id, record_id et timestamp, pour n'ouvrir que les fichiers
+    pouvant contenir les entrées demandées.
+    """
+
+    def __init__(self, directory: str = AUDIT_ARCHIVE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+
+    @property
+    def available(self) -> bool:
+        return pq is not None
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _load_manifest(self, force: bool = False) -> List[Dict[str, Any]]:
+        """Relit le manifeste s'il a été modifié (par un autre worker)"""
+        path = self._manifest_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return []
+        if force or self._manifest is None or mtime != self._manifest_mtime:
+            with open(path) as handle:
+                self._manifest = json.load(handle)["segments"]
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _save_manifest(self, segments: List[Dict[str, Any]]):
+        path = self._manifest_path()
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "w") as handle:
+            json.dump({"segments": segments}, handle)
+        os.replace(temporary, path)
+        self._manifest = segments
+        self._manifest_mtime = os.path.getmtime(path)
+
+    def write_segment(self, table_name: str, month: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Écrit un fichier pour les entrées d'une table et d'un mois, puis l'ajoute au manifeste"""
+        if pq is None:
+            raise RuntimeError("Audit archival requires the pyarrow package")
+
+        rows = sorted(rows, key=lambda row: (row["record_id"], row["id"]))
+        columns = {name: [row.get(name) for row in rows] for name in ARCHIVE_COLUMNS}
+        for name in JSON_COLUMNS:
+            columns[name] = [None if value is None else json.dumps(value) for value in columns[name]]
+        table = pa.Table.from_pydict(columns, schema=_archive_schema())
+
+        relative_path = os.path.join(table_name, month, f"part-{uuid.uuid4().hex}.parquet")
+        path = os.path.join(self.directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, path, compression=ARCHIVE_COMPRESSION)
+
+        timestamps = [row["timestamp"] for row in rows]
+        segment = {
+            "path": relative_path,
+            "table_name": table_name,
+            "month": month,
+            "rows": len(rows),
+            "min_id": min(row["id"] for row in rows),
+            "max_id": max(row["id"] for row in rows),
+            "min_record_id": rows[0]["record_id"],
+            "max_record_id": rows[-1]["record_id"],
+            "min_timestamp": min(timestamps).isoformat(),
+            "max_timestamp": max(timestamps).isoformat(),
+        }
+        with self._lock, self._manifest_file_lock():
+            # Relu sous le verrou : un autre processus a pu l'étendre entre-temps
+            self._save_manifest(self._load_manifest(force=True) + [segment])
+        return segment
+
+    @contextmanager
+    def _manifest_file_lock(self):
+        """Verrou exclusif entre processus sur la mise à jour du manifeste"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, MANIFEST_LOCK_NAME), "a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def table_names(self) -> List[str]:
+        with self._lock:
+            return sorted({segment["table_name"] for segment in self._load_manifest()})
+
+    def newest_timestamp(self, table_name: str) -> Optional[datetime]:
+        """Entrée archivée la plus récente de la table (None si rien n'est archivé)"""
+        with self._lock:
+            segments = [s for s in self._load_manifest() if s["table_name"] == table_name]
+        if not segments:
+            return None
+        return max(datetime.fromisoformat(s["max_timestamp"]) for s in segments)
+
+    def _segments(self,
+                  table_name: str,
+                  record_id: Optional[int],
+                  start_date: Optional[datetime],
+                  end_date: Optional[datetime]) -> List[Dict[str, Any]]:
+        with self._lock:
+            segments = list(self._load_manifest())
+        selected = []
+        for segment in segments:
+            if segment["table_name"] != table_name:
+                continue
+            if record_id is not None and not segment["min_record_id"] <= record_id <= segment["max_record_id"]:
+                continue
+            if start_date and datetime.fromisoformat(segment["max_timestamp"]) < start_date:
+                continue
+            if end_date and datetime.fromisoformat(segment["min_timestamp"]) > end_date:
+                continue
+            selected.append(segment)
+        return selected
+
+    def query(self,
+              table_name: str,
+              record_id: Optional[int] = None,
+              start_date: Optional[datetime] = None,
+              end_date: Optional[datetime] = None,
+              user_id: Optional[int] = None,
+              action: Optional[str] = None,
+              before: Optional[Tuple[datetime, int]] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Entrées archivées correspondant aux filtres, sous forme de dictionnaires,
+        de la plus récente à la plus ancienne. Avec before, seules les entrées
+        antérieures à (timestamp, id) sont renvoyées ; avec limit, les segments
+        sont lus du plus récent au plus ancien et la lecture s'arrête dès que les
+        segments restants ne peuvent plus contenir l'une des limit premières.
+        """
+        if pq is None:
+            if os.path.exists(self._manifest_path()):
+                logger.warning("Audit archive present but pyarrow is not installed, archived history skipped")
+            return []
+
+        if before and (end_date is None or before[0] < end_date):
+            end_date = before[0]
+        filters = []
+        if record_id is not None:
+            filters.append(("record_id", "=", record_id))
+        if start_date:
+            filters.append(("timestamp", ">=", start_date))
+        if end_date:
+            filters.append(("timestamp", "<=", end_date))
+        if user_id:
+            filters.append(("user_id", "=", user_id))
+        if action:
+            filters.append(("action", "=", action))
+
+        segments = sorted(
+            self._segments(table_name, record_id, start_date, end_date),
+            key=lambda segment: segment["max_timestamp"],
+            reverse=True
+        )
+        # Un lot repris après un arrêt de l'archivage peut figurer dans deux segments
+        entries, seen = [], set()
+        for segment in segments:
+            if limit and len(entries) >= limit:
+                # Les segments suivants ne contiennent que des entrées plus anciennes
+                # que leur max_timestamp : arrêt s'il précède la limit-ième entrée
+                entries.sort(key=lambda row: (row["timestamp"], row["id"]), reverse=True)
+                del entries[limit:]
+                if datetime.fromisoformat(segment["max_timestamp"]) < entries[-1]["timestamp"]:
+                    break
+            path = os.path.join(self.directory, segment["path"])
+            table = pq.read_table(path, filters=filters or None)
+            for row in table.to_pylist():
+                if row["id"] in seen or (before and (row["timestamp"], row["id"]) >= before):
+                    continue
+                seen.add(row["id"])
+                for name in JSON_COLUMNS:
+                    if row[name] is not None:
+                        row[name] = json.loads(row[name])
+                entries.append(row)
+        entries.sort(key=lambda row: (row["timestamp"], row["id"]), reverse=True)
+        return entries[:limit] if limit else entries
+
+    def latest(self,
+               table_name: str,
+               record_ids: List[int],
+               start_date: Optional[datetime] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Entrée archivée la plus récente de chaque record_id, en une seule lecture :
+        segments du plus récent au plus ancien, arrêt dès que chaque record_id est
+        trouvé et que les segments restants sont tous plus anciens
+        """
+        if pq is None or not record_ids:
+            return {}
+
+        wanted = set(record_ids)
+        filters = [("record_id", "in", sorted(wanted))]
+        if start_date:
+            filters.append(("timestamp", ">=", start_date))
+        segments = sorted(
+            (
+                segment for segment in self._segments(table_name, None, start_date, None)
+                if segment["min_record_id"] <= max(wanted) and segment["max_record_id"] >= min(wanted)
+            ),
+            key=lambda segment: segment["max_timestamp"],
+            reverse=True
+        )
+        latest: Dict[int, Dict[str, Any]] = {}
+        for segment in segments:
+            if len(latest) == len(wanted) and datetime.fromisoformat(segment["max_timestamp"]) < min(
+                row["timestamp"] for row in latest.values()
+            ):
+                break
+            table = pq.read_table(os.path.join(self.directory, segment["path"]), filters=filters)
+            for row in table.to_pylist():
+                current = latest.get(row["record_id"])
+                if current is None or (row["timestamp"], row["id"]) > (current["timestamp"], current["id"]):
+                    latest[row["record_id"]] = row
+        for row in latest.values():
+            for name in JSON_COLUMNS:
+                if row[name] is not None:
+                    row[name] = json.loads(row[name])
+        return latest
+
+audit_archive = AuditArchive()
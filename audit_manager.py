@@ -1,22 +1,57 @@
 # audit_manager.py
-from datetime import datetime
-from typing import Optional, Dict, Any
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Enum
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Enum, Index, insert, select, func
 from sqlalchemy.orm import Session, relationship
 from sqlalchemy.ext.declarative import declarative_base
 from enum import Enum as PyEnum
 from functools import wraps
 import json
+import logging
+
+from audit_archive import audit_archive
 
 Base = declarative_base()
+logger = logging.getLogger(__name__)
+
+# Fonctions appelées après chaque écriture dans l'historique (flux de changements)
+_change_listeners = []
+
+def register_change_listener(listener):
+    """Enregistre une fonction appelée sans argument après chaque écriture d'audit"""
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+def _notify_change_listeners():
+    for listener in _change_listeners:
+        try:
+            listener()
+        except Exception as e:
+            logger.error(f"Audit change listener failed: {str(e)}")
 
 class ActionType(PyEnum):
     CREATE = "CREATE"
     UPDATE = "UPDATE"
     DELETE = "DELETE"
 
+class User(Base):
+    __tablename__ = 'users'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    email = Column(String(255), unique=True)
+
 class AuditLog(Base):
     __tablename__ = 'audit_logs'
+    # Index des requêtes d'historique, triées par (timestamp, id) pour la pagination
+    __table_args__ = (
+        Index("ix_audit_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_audit_logs_table_timestamp", "table_name", "timestamp", "id"),
+        Index("ix_audit_logs_record", "table_name", "record_id", "timestamp", "id"),
+        Index("ix_audit_logs_user_timestamp", "user_id", "timestamp", "id"),
+        Index("ix_audit_logs_action_timestamp", "action", "timestamp", "id"),
+    )
     
     id = Column(Integer, primary_key=True)
     table_name = Column(String(50), nullable=False)
@@ -30,6 +65,80 @@ class AuditLog(Base):
     # Champs additionnels pour plus de contexte
     ip_address = Column(String(50))
     user_agent = Column(String(200))
+    # Identifiant commun aux entrées d'une même opération groupée
+    batch_id = Column(String(36), index=True)
+
+# Valeurs tronquées à la taille de la colonne indexée
+FIELD_VALUE_LENGTH = 255
+
+class AuditFieldChange(Base):
+    """
+    Index dérivé de l'historique : une ligne par champ modifié, pour répondre à
+    "qui a passé statut à Vendu" sans lire le JSON de chaque entrée. Pas de clé
+    étrangère vers audit_logs : les lignes survivent à l'archivage des entrées.
+    """
+    __tablename__ = 'audit_field_changes'
+    __table_args__ = (
+        Index("ix_audit_field_changes_field_new", "field", "new", "timestamp", "id"),
+        Index("ix_audit_field_changes_field_timestamp", "field", "timestamp", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    audit_log_id = Column(Integer, nullable=False, index=True)
+    table_name = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    field = Column(String(100), nullable=False)
+    old = Column(String(FIELD_VALUE_LENGTH), nullable=True)
+    new = Column(String(FIELD_VALUE_LENGTH), nullable=True)
+    timestamp = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+
+def changed_fields(old_values: Optional[Dict], new_values: Optional[Dict]) -> List[Tuple[str, Any, Any]]:
+    """(champ, ancienne valeur, nouvelle valeur) des champs modifiés par une entrée d'historique"""
+    if not old_values:  # Création
+        return [(key, None, value) for key, value in (new_values or {}).items()]
+
+    if not new_values:  # Suppression
+        return [(key, value, None) for key, value in old_values.items()]
+
+    # Modification
+    return [
+        (key, old_values.get(key), new_values.get(key))
+        for key in sorted(set(old_values) | set(new_values))
+        if old_values.get(key) != new_values.get(key)
+    ]
+
+def field_value_text(value) -> Optional[str]:
+    """Forme texte d'une valeur, telle que stockée et comparée dans audit_field_changes"""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str)
+    return value[:FIELD_VALUE_LENGTH]
+
+def field_change_rows(
+    audit_log_id: int,
+    table_name: str,
+    record_id: int,
+    old_values: Optional[Dict],
+    new_values: Optional[Dict],
+    timestamp: datetime,
+    user_id: int
+) -> List[Dict[str, Any]]:
+    """Lignes audit_field_changes d'une entrée d'historique"""
+    return [
+        {
+            "audit_log_id": audit_log_id,
+            "table_name": table_name,
+            "record_id": record_id,
+            "field": field[:100],
+            "old": field_value_text(old),
+            "new": field_value_text(new),
+            "timestamp": timestamp,
+            "user_id": user_id,
+        }
+        for field, old, new in changed_fields(old_values, new_values)
+    ]
 
 class AuditManager:
     def __init__(self, db: Session):
@@ -39,15 +148,23 @@ class AuditManager:
         """Convertit un modèle SQLAlchemy en dictionnaire"""
         data = {}
         for column in model.__table__.columns:
-            value = getattr(model, column.name)
-            # Gestion des types spéciaux
-            if isinstance(value, datetime):
-                value = value.isoformat()
+            value = self._serialize_value(getattr(model, column.name))
             if hasattr(value, '__dict__'):
                 continue  # Évite les relations complexes
             data[column.name] = value
         return data
 
+    @staticmethod
+    def _serialize_value(value):
+        """Rend une valeur de colonne compatible avec une colonne JSON"""
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, PyEnum):
+            return value.value
+        return value
+
     def log_change(
         self,
         table_name: str,
@@ -57,9 +174,13 @@ class AuditManager:
         new_values: Optional[Dict] = None,
         user_id: Optional[int] = None,
         ip_address: Optional[str] = None,
-        user_agent: Optional[str] = None
+        user_agent: Optional[str] = None,
+        commit: bool = True
     ):
-        """Enregistre une modification dans l'historique"""
+        """
+        Enregistre une modification dans l'historique. Avec commit=False, l'entrée
+        est validée avec la transaction de l'appelant.
+        """
         audit_entry = AuditLog(
             table_name=table_name,
             record_id=record_id,
@@ -67,11 +188,79 @@ class AuditManager:
             old_values=old_values,
             new_values=new_values,
             user_id=user_id or self._get_current_user_id(),
+            timestamp=datetime.utcnow(),
             ip_address=ip_address,
             user_agent=user_agent
         )
         self.db.add(audit_entry)
-        self.db.commit()
+        self.db.flush()
+        rows = field_change_rows(
+            audit_entry.id, table_name, record_id, old_values, new_values,
+            audit_entry.timestamp, audit_entry.user_id
+        )
+        if rows:
+            self.db.execute(insert(AuditFieldChange), rows)
+        if commit:
+            self.db.commit()
+            _notify_change_listeners()
+
+    def log_changes_bulk(
+        self,
+        table_name: str,
+        action: ActionType,
+        changes: List[Tuple[int, Optional[Dict], Optional[Dict]]],
+        batch_id: str,
+        user_id: int,
+        commit: bool = True
+    ):
+        """
+        Enregistre les modifications d'une opération groupée en un seul INSERT
+        multi-lignes. changes : liste de (record_id, old_values, new_values).
+        L'utilisateur est obligatoire : les opérations groupées s'exécutent aussi
+        hors requête (tâches de fond), sans utilisateur courant.
+        """
+        if not user_id:
+            raise ValueError("log_changes_bulk requires a user_id")
+        if not changes:
+            return
+        timestamp = datetime.utcnow()
+        values = [
+            {
+                "table_name": table_name,
+                "record_id": record_id,
+                "action": action,
+                "old_values": old_values,
+                "new_values": new_values,
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "batch_id": batch_id,
+            }
+            for record_id, old_values, new_values in changes
+        ]
+        # Identifiants des entrées insérées, dans l'ordre de changes
+        if self.db.get_bind().dialect.insert_executemany_returning:
+            audit_log_ids = self.db.scalars(
+                insert(AuditLog).returning(AuditLog.id, sort_by_parameter_order=True), values
+            ).all()
+        else:
+            # MySQL : pas de RETURNING, l'ORM récupère l'id de chaque insertion
+            entries = [AuditLog(**entry) for entry in values]
+            self.db.add_all(entries)
+            self.db.flush()
+            audit_log_ids = [entry.id for entry in entries]
+
+        rows = [
+            row
+            for audit_log_id, (record_id, old_values, new_values) in zip(audit_log_ids, changes)
+            for row in field_change_rows(
+                audit_log_id, table_name, record_id, old_values, new_values, timestamp, user_id
+            )
+        ]
+        if rows:
+            self.db.execute(insert(AuditFieldChange), rows)
+        if commit:
+            self.db.commit()
+            _notify_change_listeners()
 
     def get_history(
         self,
@@ -80,9 +269,13 @@ class AuditManager:
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
         user_id: Optional[int] = None,
-        action: Optional[ActionType] = None
+        action: Optional[ActionType] = None,
+        limit: Optional[int] = None
     ) -> list:
-        """Récupère l'historique avec filtres optionnels"""
+        """
+        Récupère l'historique avec filtres optionnels. Si la période demandée remonte
+        avant la dernière entrée archivée, les segments d'archive sont aussi lus.
+        """
         query = self.db.query(AuditLog).filter(AuditLog.table_name == table_name)
         
         if record_id is not None:
@@ -96,7 +289,74 @@ class AuditManager:
         if action:
             query = query.filter(AuditLog.action == action)
             
-        return query.order_by(AuditLog.timestamp.desc()).all()
+        query = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc())
+        if limit:
+            query = query.limit(limit)
+        entries = query.all()
+        if limit and len(entries) == limit:
+            return entries
+        entries = self._with_archived(entries, table_name, record_id, start_date, end_date, user_id, action, limit)
+        return entries[:limit] if limit else entries
+
+    def get_last_changes(
+        self,
+        table_name: str,
+        record_ids: List[int],
+        created_since: Optional[datetime] = None
+    ) -> Dict[int, "AuditLog"]:
+        """
+        Dernière entrée d'historique de chaque enregistrement, en une requête.
+        Les enregistrements sans entrée en base sont cherchés en une seule lecture
+        de l'archive, à partir de created_since (création la plus ancienne).
+        """
+        if not record_ids:
+            return {}
+        ranked = select(
+            AuditLog.id,
+            func.row_number().over(
+                partition_by=AuditLog.record_id,
+                order_by=(AuditLog.timestamp.desc(), AuditLog.id.desc())
+            ).label("rank")
+        ).where(AuditLog.table_name == table_name, AuditLog.record_id.in_(record_ids)).subquery()
+        entries = self.db.query(AuditLog).join(ranked, AuditLog.id == ranked.c.id).filter(ranked.c.rank == 1).all()
+        last_changes = {entry.record_id: entry for entry in entries}
+
+        missing = [record_id for record_id in record_ids if record_id not in last_changes]
+        if missing and audit_archive.newest_timestamp(table_name) is not None:
+            for record_id, row in audit_archive.latest(table_name, missing, created_since).items():
+                last_changes[record_id] = AuditLog(**{**row, "action": ActionType(row["action"])})
+        return last_changes
+
+    def _with_archived(
+        self,
+        entries: list,
+        table_name: str,
+        record_id: Optional[int],
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        user_id: Optional[int],
+        action: Optional[ActionType],
+        limit: Optional[int] = None
+    ) -> list:
+        newest_archived = audit_archive.newest_timestamp(table_name)
+        if newest_archived is None or (start_date and start_date > newest_archived):
+            return entries
+
+        # Une entrée archivée mais pas encore supprimée peut figurer des deux côtés,
+        # et un lot repris après un arrêt peut figurer dans deux segments
+        seen = {entry.id for entry in entries}
+        archived = []
+        for row in audit_archive.query(
+            table_name, record_id, start_date, end_date, user_id, action.value if action else None,
+            limit=limit + len(seen) if limit else None
+        ):
+            if row["id"] in seen:
+                continue
+            seen.add(row["id"])
+            archived.append(AuditLog(**{**row, "action": ActionType(row["action"])}))
+        if not archived:
+            return entries
+        return sorted(entries + archived, key=lambda entry: (entry.timestamp, entry.id), reverse=True)
 
     def _get_current_user_id(self) -> int:
         """À implémenter selon votre système d'authentification"""
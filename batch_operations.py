@@ -0,0 +1,47 @@
+from fastapi import HTTPException
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+
+from .fast_json import schema_columns
+from .models import MAX_BATCH_IDS
+
+logger = logging.getLogger(__name__)
+
+IN_CHUNK_SIZE = 500
+
+
+class BatchOperations:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_by_ids(self, model, schema, ids: Sequence[int], columns: Optional[list] = None) -> List[Dict]:
+        """
+        Résout une liste d'identifiants par requêtes IN découpées en lots.
+        Le résultat suit l'ordre de la demande ; un identifiant absent est
+        renvoyé avec found=False.
+        """
+        pk = model.__mapper__.primary_key[0]
+        columns = columns or schema_columns(model, schema)
+        if pk.name not in [column.name for column in columns]:
+            columns = [pk] + list(columns)
+
+        unique_ids = list(dict.fromkeys(ids))
+        found = {}
+        try:
+            for start in range(0, len(unique_ids), IN_CHUNK_SIZE):
+                chunk = unique_ids[start:start + IN_CHUNK_SIZE]
+                for row in self.db.execute(select(*columns).where(pk.in_(chunk))).mappings():
+                    found[row[pk.name]] = dict(row)
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+        return [
+            {"id": item_id, "found": True, "item": found[item_id]} if item_id in found
+            else {"id": item_id, "found": False}
+            for item_id in ids
+        ]
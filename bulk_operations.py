@@ -0,0 +1,125 @@
+from fastapi import HTTPException
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+import uuid
+
+from .models import INVENTORY_MODELS, Status
+from .filter_dsl import parse_filter, coerce_json_value
+from audit_manager import AuditManager, ActionType
+
+logger = logging.getLogger(__name__)
+
+IN_CHUNK_SIZE = 1000
+MAX_BULK_ROWS = 50000
+# Colonnes qui ne peuvent pas être modifiées en masse
+PROTECTED_FIELDS = {"numero_serie", "date_creation", "date_modification", "version"}
+
+
+def get_inventory_model(table_name: str):
+    model = INVENTORY_MODELS.get(table_name)
+    if model is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown inventory table: {table_name}. Use one of: {', '.join(INVENTORY_MODELS)}"
+        )
+    return model
+
+
+class BulkOperations:
+    def __init__(self, db: Session):
+        self.db = db
+        self.audit_manager = AuditManager(db)
+
+    def _validate_changes(self, model, changes: Dict[str, Any]) -> Dict[str, Any]:
+        if not changes:
+            raise HTTPException(status_code=400, detail="No changes provided")
+
+        pk = model.__mapper__.primary_key[0]
+        columns = model.__table__.columns
+        values = {}
+        for field, value in changes.items():
+            if field not in columns or field == pk.name or field in PROTECTED_FIELDS:
+                raise HTTPException(status_code=400, detail=f"Field cannot be bulk updated: {field}")
+            value = coerce_json_value(columns[field], value)
+            if field == "statut" and value is not None:
+                try:
+                    value = Status(value).value
+                except ValueError:
+                    raise HTTPException(status_code=400, detail=f"Invalid statut: {value}")
+            values[field] = value
+        return values
+
+    def bulk_update(self,
+                    table_name: str,
+                    changes: Dict[str, Any],
+                    user_id: int,
+                    ids: Optional[List[int]] = None,
+                    filters: Optional[List[str]] = None) -> Dict:
+        """
+        Applique les mêmes changements à un ensemble d'articles (ids et/ou filtres)
+        dans une seule transaction : lecture verrouillée des anciennes valeurs,
+        UPDATE ensembliste, puis historique en un INSERT multi-lignes avec un batch_id.
+        """
+        model = get_inventory_model(table_name)
+        values = self._validate_changes(model, changes)
+        if not ids and not filters:
+            raise HTTPException(status_code=400, detail="Either ids or filters must be provided")
+
+        pk = model.__mapper__.primary_key[0]
+        conditions = [parse_filter(model, expression)[2] for expression in filters or []]
+        if ids:
+            conditions.append(pk.in_(list(dict.fromkeys(ids))))
+
+        changed_columns = [getattr(model, field) for field in values]
+        batch_id = str(uuid.uuid4())
+        try:
+            rows = self.db.execute(
+                select(pk, *changed_columns).where(*conditions)
+                .order_by(pk).limit(MAX_BULK_ROWS + 1).with_for_update()
+            ).all()
+            if len(rows) > MAX_BULK_ROWS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Bulk update is limited to {MAX_BULK_ROWS} rows, narrow the selection"
+                )
+
+            if not rows:
+                self.db.commit()
+                return {"batch_id": None, "matched": 0, "updated": 0}
+
+            # L'UPDATE porte sur les id lus et verrouillés, pas sur le filtre :
+            # une ligne insérée entre-temps ne peut pas être modifiée sans historique
+            record_ids = [row[0] for row in rows]
+            updated = 0
+            for start in range(0, len(record_ids), IN_CHUNK_SIZE):
+                chunk = record_ids[start:start + IN_CHUNK_SIZE]
+                result = self.db.execute(
+                    update(model).where(pk.in_(chunk)).values(**values, version=model.version + 1)
+                )
+                updated += result.rowcount
+
+            serialize = self.audit_manager._serialize_value
+            new_values = {field: serialize(value) for field, value in values.items()}
+            self.audit_manager.log_changes_bulk(
+                table_name=table_name,
+                action=ActionType.UPDATE,
+                changes=[
+                    (row[0], {field: serialize(old) for field, old in zip(values, row[1:])}, new_values)
+                    for row in rows
+                ],
+                batch_id=batch_id,
+                user_id=user_id,
+            )
+            logger.info(f"Bulk update {batch_id} on {table_name}: {updated} rows")
+            return {"batch_id": batch_id, "matched": len(rows), "updated": updated}
+
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+        except HTTPException:
+            self.db.rollback()
+            raise
@@ -0,0 +1,245 @@
+from typing import Dict, List, Optional, Set
+from sqlalchemy import select, func
+from datetime import datetime, timedelta
+import asyncio
+import logging
+
+from .database import get_service_session
+from audit_manager import AuditLog, register_change_listener
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 1.0
+POLL_BATCH_SIZE = 500
+SUBSCRIBER_QUEUE_SIZE = 1000
+HEARTBEAT_SECONDS = 15
+# Les id d'audit sont attribués à l'insertion mais visibles au commit : une entrée
+# d'id inférieur au dernier lu peut apparaître plus tard. Les id manquants sous le
+# dernier lu sont relus à chaque cycle pendant LATE_COMMIT_WINDOW_SECONDS
+LATE_COMMIT_WINDOW_SECONDS = 60
+# Au-delà, un saut d'id (séquence réinitialisée, base restaurée) n'est pas suivi
+MAX_TRACKED_GAP = 10_000
+
+
+def serialize_entry(log: AuditLog) -> Dict:
+    return {
+        "id": log.id,
+        "table_name": log.table_name,
+        "record_id": log.record_id,
+        "action": log.action.value,
+        "old_values": log.old_values,
+        "new_values": log.new_values,
+        "user_id": log.user_id,
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+    }
+
+
+def _fetch_after(last_id: int, table_name: Optional[str] = None, limit: int = POLL_BATCH_SIZE) -> List[Dict]:
+    db = get_service_session()
+    try:
+        query = db.query(AuditLog).filter(AuditLog.id > last_id)
+        if table_name:
+            query = query.filter(AuditLog.table_name == table_name)
+        return [serialize_entry(log) for log in query.order_by(AuditLog.id).limit(limit).all()]
+    finally:
+        db.close()
+
+
+def _fetch_last_id() -> int:
+    db = get_service_session()
+    try:
+        return db.execute(select(func.max(AuditLog.id))).scalar() or 0
+    finally:
+        db.close()
+
+
+def _fetch_recent_ids(last_id: int, since: datetime) -> List[int]:
+    """id croissants des entrées d'id <= last_id horodatées depuis since"""
+    db = get_service_session()
+    try:
+        return db.execute(
+            select(AuditLog.id).where(AuditLog.timestamp >= since, AuditLog.id <= last_id).order_by(AuditLog.id)
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+def _fetch_ids(ids: List[int]) -> List[Dict]:
+    db = get_service_session()
+    try:
+        query = db.query(AuditLog).filter(AuditLog.id.in_(ids)).order_by(AuditLog.id)
+        return [serialize_entry(log) for log in query.all()]
+    finally:
+        db.close()
+
+
+class Subscription:
+    def __init__(self, table_name: Optional[str] = None):
+        self.table_name = table_name
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, entry: Dict) -> bool:
+        return self.table_name is None or entry["table_name"] == self.table_name
+
+
+class ChangePublisher:
+    """
+    Un seul lecteur de audit_logs par worker, qui diffuse les nouvelles entrées
+    à tous les abonnés. Il est réveillé immédiatement par les écritures d'audit
+    du même processus et interroge la base à intervalle régulier pour les autres.
+    Les entrées validées en retard (id inférieur au dernier lu) sont retrouvées
+    en relisant uniquement les id manquants, chacun diffusé une seule fois.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.poll_interval = poll_interval
+        self.last_id = 0
+        # id manquants sous last_id -> date de détection, abandonnés hors fenêtre
+        self._gaps: Dict[int, datetime] = {}
+        self._subscribers: List[Subscription] = []
+        self._task: Optional[asyncio.Task] = None
+        self._starting: Optional[asyncio.Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def notify(self):
+        """Appelé après une écriture d'audit, éventuellement depuis un autre thread"""
+        if self._loop and self._wakeup and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.last_id = await asyncio.to_thread(_fetch_last_id)
+        # Les entrées déjà présentes au démarrage ne sont pas diffusées ; seuls les
+        # trous de la fenêtre récente (transactions encore ouvertes) sont surveillés
+        recent = await asyncio.to_thread(_fetch_recent_ids, self.last_id, self._window_start())
+        self._gaps = {}
+        if recent:
+            self._add_gaps(recent[0], self.last_id, known=set(recent))
+        self._task = asyncio.create_task(self._run())
+
+    def _add_gaps(self, after_id: int, before_id: int, known: Set[int] = frozenset()):
+        if before_id - after_id > MAX_TRACKED_GAP:
+            return
+        detected = datetime.utcnow()
+        for entry_id in range(after_id + 1, before_id):
+            if entry_id not in known:
+                self._gaps[entry_id] = detected
+
+    @staticmethod
+    def _window_start() -> datetime:
+        return datetime.utcnow() - timedelta(seconds=LATE_COMMIT_WINDOW_SECONDS)
+
+    async def _publish_late_commits(self):
+        # Un trou jamais comblé (transaction annulée) est abandonné après la fenêtre
+        window_start = self._window_start()
+        self._gaps = {
+            entry_id: detected for entry_id, detected in self._gaps.items() if detected >= window_start
+        }
+        if self._gaps:
+            for entry in await asyncio.to_thread(_fetch_ids, sorted(self._gaps)):
+                self._publish(entry)
+
+    async def _ensure_started(self):
+        # Les abonnés arrivant pendant le démarrage attendent le même lecteur
+        if self._starting is None or (self._task is not None and self._task.done()):
+            self._task = None
+            self._starting = asyncio.ensure_future(self._start())
+        starting = self._starting
+        try:
+            await asyncio.shield(starting)
+        except Exception:
+            # Démarrage en échec : le prochain abonné le relance
+            if self._starting is starting:
+                self._starting = None
+            raise
+
+    async def _run(self):
+        # Le premier cycle s'exécute avant l'inscription de l'abonné ayant démarré le lecteur
+        while True:
+            try:
+                entries = await asyncio.to_thread(_fetch_after, self.last_id)
+                for entry in entries:
+                    self._add_gaps(self.last_id, entry["id"])
+                    self._publish(entry)
+                    self.last_id = entry["id"]
+                if len(entries) == POLL_BATCH_SIZE:
+                    continue
+                await self._publish_late_commits()
+            except Exception as e:
+                logger.error(f"Change feed polling failed: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._subscribers:
+                break
+
+    def _publish(self, entry: Dict):
+        self._gaps.pop(entry["id"], None)
+        for subscription in list(self._subscribers):
+            if not subscription.matches(entry):
+                continue
+            try:
+                subscription.queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                # Abonné trop lent : il est déconnecté et reprendra depuis son dernier id
+                subscription.overflowed = True
+                self._subscribers.remove(subscription)
+
+    async def subscribe(self, table_name: Optional[str] = None) -> Subscription:
+        await self._ensure_started()
+        subscription = Subscription(table_name)
+        self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscribers:
+            self._subscribers.remove(subscription)
+
+    async def stream(self, table_name: Optional[str] = None, since_id: Optional[int] = None):
+        """
+        Produit les entrées d'audit (dict) à partir de since_id puis en direct.
+        None est produit à chaque intervalle de HEARTBEAT_SECONDS sans activité.
+        """
+        subscription = await self.subscribe(table_name)
+        try:
+            last_sent = since_id if since_id is not None else self.last_id
+            # Entrées du rattrapage, que le flux direct peut aussi diffuser
+            # (validation en retard) ; le publieur diffuse chaque id une seule fois
+            sent_in_backlog = set()
+
+            # Rattrapage depuis la base jusqu'au point où le flux direct a démarré
+            live_from = self.last_id
+            while since_id is not None and last_sent < live_from:
+                backlog = await asyncio.to_thread(_fetch_after, last_sent, table_name)
+                backlog = [entry for entry in backlog if entry["id"] <= live_from]
+                if not backlog:
+                    break
+                for entry in backlog:
+                    last_sent = entry["id"]
+                    sent_in_backlog.add(entry["id"])
+                    yield entry
+
+            while not subscription.overflowed:
+                try:
+                    entry = await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if entry["id"] in sent_in_backlog:
+                    continue
+                if since_id is not None and live_from < entry["id"] <= since_id:
+                    # Déjà reçue par le client avant sa reconnexion
+                    continue
+                yield entry
+        finally:
+            self.unsubscribe(subscription)
+
+
+publisher = ChangePublisher()
+register_change_listener(publisher.notify)
@@ -0,0 +1,54 @@
+from fastapi import HTTPException
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def etag(version: Optional[int]) -> Optional[str]:
+    """ETag d'un article : son numéro de version"""
+    return None if version is None else f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    Version attendue d'après l'en-tête If-Match ("3", W/"3").
+    None si l'en-tête est absent ou vaut '*' : pas de contrôle de version.
+    """
+    if if_match is None:
+        return None
+    value = if_match.strip()
+    if value == "*":
+        return None
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.isdigit():
+        raise HTTPException(status_code=400, detail=f"Invalid If-Match header: {if_match}")
+    return int(value)
+
+
+def precondition_failed(current_version: Optional[int] = None) -> HTTPException:
+    headers = {"ETag": etag(current_version)} if current_version is not None else None
+    return HTTPException(
+        status_code=412,
+        detail="The item was modified by another request, reload it and retry",
+        headers=headers
+    )
+
+
+def check_version(item, expected_version: Optional[int]):
+    """
+    Compare la version lue à celle de If-Match. L'UPDATE émis ensuite porte
+    WHERE version = <version lue> (version_id_col) : une écriture concurrente
+    entre la lecture et le commit lève StaleDataError, convertie en 412.
+    """
+    if expected_version is None:
+        return
+    if item is None:
+        raise precondition_failed()
+    if item.version != expected_version:
+        logger.warning(
+            f"Version conflict on {type(item).__name__}: expected {expected_version}, found {item.version}"
+        )
+        raise precondition_failed(item.version)
@@ -51,23 +51,26 @@ def get_database_url():
         logger.error(f"Missing database configuration: {e}")
         raise
 
-def create_database_engine(db_url=None):
+def create_database_engine(db_url=None, **pool_options):
     """
     Create and test database engine with connection pooling and error handling.
+    pool_options override the default pool settings (pool_size, max_overflow...).
     """
     if not db_url:
         db_url = get_database_url()
 
+    # Additional connection parameters for robustness
+    options = {
+        "pool_size": 10,  # Adjust based on expected concurrent connections
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,  # Recycle connections every 30 minutes
+        "pool_pre_ping": True  # Test connection before using
+    }
+    options.update(pool_options)
+
     try:
-        # Additional connection parameters for robustness
-        engine = create_engine(
-            db_url,
-            pool_size=10,  # Adjust based on expected concurrent connections
-            max_overflow=20,
-            pool_timeout=30,
-            pool_recycle=1800,  # Recycle connections every 30 minutes
-            pool_pre_ping=True  # Test connection before using
-        )
+        engine = create_engine(db_url, **options)
 
         # Verify connection
         with engine.connect() as connection:
@@ -85,6 +88,24 @@ Base = declarative_base()
 engine = create_database_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Pool séparé pour les tâches de fond : elles ne peuvent pas épuiser celui de l'API
+JOB_POOL_SIZE = int(os.getenv('JOB_POOL_SIZE', '4'))
+job_engine = create_database_engine(pool_size=JOB_POOL_SIZE, max_overflow=2, pool_timeout=120)
+
+def get_job_session():
+    """Session SessionLocal liée au pool des tâches de fond"""
+    return SessionLocal(bind=job_engine)
+
+# Pool séparé pour les accès hors des routes : clés d'idempotence (middleware) et
+# threads de fond (flux de modifications, scans, garanties). Le pool principal
+# reste entièrement à la disposition des routes, dont l'admission le répartit
+SERVICE_POOL_SIZE = int(os.getenv('SERVICE_POOL_SIZE', '4'))
+service_engine = create_database_engine(pool_size=SERVICE_POOL_SIZE, max_overflow=2, pool_timeout=30)
+
+def get_service_session():
+    """Session SessionLocal liée au pool des services internes"""
+    return SessionLocal(bind=service_engine)
+
 def get_db():
     """
     Dependency for getting database session in FastAPI.
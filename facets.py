@@ -0,0 +1,98 @@
+from fastapi import HTTPException
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import select, func, tuple_, Text
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from collections import Counter
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_FACETS = 10
+SCAN_BATCH_SIZE = 10000
+# Hors PostgreSQL, les valeurs sont comptées côté application : au-delà de ce
+# nombre de lignes parcourues (filtre indexé peu sélectif), la requête est refusée
+MAX_SCAN_ROWS = 500_000
+NULL_FACET = "null"
+
+
+def parse_facets(model, facets: Optional[str]) -> List[str]:
+    if not facets:
+        return []
+    fields = list(dict.fromkeys(name.strip() for name in facets.split(",") if name.strip()))
+    columns = model.__table__.columns
+    unknown = [name for name in fields if name not in columns or isinstance(columns[name].type, Text)]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid facet fields: {', '.join(unknown)}")
+    if len(fields) > MAX_FACETS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FACETS} facets can be requested")
+    return fields
+
+
+def _facet_key(value) -> str:
+    return NULL_FACET if value is None else str(value)
+
+
+def _grouping_sets_counts(db: Session, model, conditions: Sequence, fields: List[str]) -> Dict[str, Dict[str, int]]:
+    """PostgreSQL : toutes les facettes en une requête GROUP BY GROUPING SETS"""
+    columns = [getattr(model, field) for field in fields]
+    query = select(
+        *columns,
+        *[func.grouping(column).label(f"grouping_{field}") for field, column in zip(fields, columns)],
+        func.count().label("total"),
+    ).where(*conditions).group_by(func.grouping_sets(*[tuple_(column) for column in columns]))
+
+    counts = {field: {} for field in fields}
+    for row in db.execute(query).mappings():
+        for field in fields:
+            # GROUPING(col) = 0 : la ligne appartient à l'ensemble de cette colonne
+            if row[f"grouping_{field}"] == 0:
+                counts[field][_facet_key(row[field])] = row["total"]
+                break
+    return counts
+
+
+def _single_scan_counts(db: Session, model, conditions: Sequence, fields: List[str]) -> Dict[str, Dict[str, int]]:
+    """Autres SGBD : un seul parcours des colonnes demandées, comptage par lot de lignes"""
+    columns = [getattr(model, field) for field in fields]
+    counters = {field: Counter() for field in fields}
+    result = db.execute(
+        select(*columns).where(*conditions).execution_options(yield_per=SCAN_BATCH_SIZE)
+    )
+    scanned = 0
+    for batch in result.partitions():
+        scanned += len(batch)
+        if scanned > MAX_SCAN_ROWS:
+            result.close()
+            raise HTTPException(
+                status_code=400,
+                detail=f"Facets over more than {MAX_SCAN_ROWS} rows require a more selective filter"
+            )
+        for field, values in zip(fields, zip(*batch)):
+            counters[field].update(values)
+    return {
+        field: {_facet_key(value): count for value, count in counter.most_common()}
+        for field, counter in counters.items()
+    }
+
+
+def compute_facets(db: Session, model, conditions: Sequence, fields: List[str]) -> Dict[str, Dict[str, int]]:
+    """
+    Comptes par valeur des colonnes demandées. Les conditions viennent de plan_query,
+    qui refuse déjà un parcours non indexé d'une grande table.
+    """
+    if not fields:
+        return {}
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            counts = _grouping_sets_counts(db, model, conditions, fields)
+        else:
+            counts = _single_scan_counts(db, model, conditions, fields)
+        return {
+            field: dict(sorted(values.items(), key=lambda item: -item[1]))
+            for field, values in counts.items()
+        }
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database operation failed")
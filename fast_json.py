@@ -0,0 +1,50 @@
+from typing import Iterable, List, Sequence, Type
+from fastapi import Response
+from pydantic import BaseModel
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel, repli sur json de la bibliothèque standard
+    orjson = None
+
+
+def _default(value):
+    # Même rendu que pydantic en mode JSON : Decimal en chaîne, Enum par valeur
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dump_rows(keys: Sequence[str], rows: Iterable[Sequence]) -> bytes:
+    """Sérialise des lignes (tuples) en tableau JSON d'objets, sans modèle intermédiaire"""
+    return dumps([dict(zip(keys, row)) for row in rows])
+
+
+def schema_columns(model, schema: Type[BaseModel]) -> List:
+    """Colonnes de la table correspondant aux champs du schéma de réponse, dans son ordre"""
+    columns = model.__table__.columns
+    return [columns[name] for name in schema.model_fields if name in columns]
+
+
+class FastJSONResponse(Response):
+    """Réponse dont le contenu est déjà sérialisé en bytes"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
@@ -0,0 +1,239 @@
+from fastapi import HTTPException
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import Integer, Numeric, Float, Date, DateTime, String, Text, text, select, func, literal_column
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sans filtre indexé, une requête sur une grande table doit être paginée
+# par pages d'au plus MAX_UNINDEXED_LIMIT lignes, sinon elle est refusée
+LARGE_TABLE_ROWS = 100_000
+MAX_UNINDEXED_LIMIT = 500
+ROW_ESTIMATE_TTL_SECONDS = 600
+
+_FILTER_PATTERN = re.compile(
+    r"^\s*(?P<field>\w+)\s*(?P<op>>=|<=|!=|=|<|>|\s+not\s+in\s+|\s+in\s+|\s+between\s+)\s*(?P<value>.+?)\s*$",
+    re.IGNORECASE,
+)
+_SELECTIVE_OPS = {"=", "<", "<=", ">", ">=", "in", "between"}
+_row_estimates: Dict[str, Tuple[float, int]] = {}
+
+
+class FilterPlan:
+    def __init__(self, conditions: list, order_by: list, skip: int, limit: Optional[int], indexed: bool):
+        self.conditions = conditions
+        self.order_by = order_by
+        self.skip = skip
+        self.limit = limit
+        self.indexed = indexed
+
+    def apply(self, query):
+        """Applique le plan à un Query ORM ou à un select() Core"""
+        query = query.where(*self.conditions).order_by(*self.order_by)
+        if self.skip:
+            query = query.offset(self.skip)
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        return query
+
+
+def indexed_columns(model) -> set:
+    """Colonnes pouvant servir de point d'entrée d'un index (première colonne)"""
+    table = model.__table__
+    names = {column.name for column in table.primary_key.columns}
+    names.update(column.name for column in table.columns if column.unique or column.index)
+    for index in table.indexes:
+        names.add(list(index.columns)[0].name)
+    return names
+
+
+def coerce_value(column, raw: str):
+    raw = raw.strip().strip("'\"")
+    column_type = column.type
+    try:
+        if isinstance(column_type, Integer):
+            return int(raw)
+        if isinstance(column_type, Numeric) and not isinstance(column_type, Float):
+            return Decimal(raw)
+        if isinstance(column_type, Float):
+            return float(raw)
+        if isinstance(column_type, DateTime):
+            return datetime.fromisoformat(raw)
+        if isinstance(column_type, Date):
+            # Une année seule (annee_achat < 2020) vaut le 1er janvier
+            return date(int(raw), 1, 1) if raw.isdigit() and len(raw) == 4 else date.fromisoformat(raw)
+    except (ValueError, InvalidOperation):
+        raise HTTPException(status_code=400, detail=f"Invalid value for {column.name}: {raw}")
+    return raw
+
+
+def coerce_json_value(column, value):
+    """
+    Convertit une valeur JSON (corps de requête, historique) vers le type de la
+    colonne. Les chaînes destinées à une colonne texte sont gardées telles quelles :
+    ni guillemets ni espaces retirés, contrairement aux valeurs d'un filtre.
+    """
+    if value is None or isinstance(column.type, (String, Text)):
+        return value
+    return coerce_value(column, str(value))
+
+
+def _parse_list(column, raw: str) -> list:
+    raw = raw.strip()
+    if not (raw.startswith("(") and raw.endswith(")")):
+        raise HTTPException(status_code=400, detail=f"Expected a parenthesised list for {column.name}")
+    values = [value for value in raw[1:-1].split(",") if value.strip()]
+    if not values:
+        raise HTTPException(status_code=400, detail=f"Empty list for {column.name}")
+    return [coerce_value(column, value) for value in values]
+
+
+def parse_filter(model, expression: str):
+    """Traduit une expression (ram>=16, stockage_type in (SSD), prix between 100 and 500) en condition"""
+    match = _FILTER_PATTERN.match(expression)
+    if not match:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {expression}")
+
+    field, op, raw = match.group("field"), " ".join(match.group("op").lower().split()), match.group("value")
+    columns = model.__table__.columns
+    if field not in columns:
+        raise HTTPException(status_code=400, detail=f"Unknown filter field: {field}")
+    column = getattr(model, field)
+
+    if op == "in":
+        return field, op, column.in_(_parse_list(columns[field], raw))
+    if op == "not in":
+        return field, op, column.not_in(_parse_list(columns[field], raw))
+    if op == "between":
+        bounds = re.split(r"\s+and\s+", raw, flags=re.IGNORECASE)
+        if len(bounds) != 2:
+            raise HTTPException(status_code=400, detail=f"Expected 'between <a> and <b>' for {field}")
+        return field, op, column.between(coerce_value(columns[field], bounds[0]), coerce_value(columns[field], bounds[1]))
+
+    value = coerce_value(columns[field], raw)
+    conditions = {
+        "=": column == value,
+        "!=": column != value,
+        "<": column < value,
+        "<=": column <= value,
+        ">": column > value,
+        ">=": column >= value,
+    }
+    return field, op, conditions[op]
+
+
+def parse_sort(model, sort: Optional[str]) -> List[Tuple[str, object]]:
+    """sort=-prix,annee_achat : tri décroissant avec le préfixe '-'"""
+    order = []
+    if not sort:
+        return order
+    columns = model.__table__.columns
+    for part in sort.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        descending = part.startswith("-")
+        field = part.lstrip("-+")
+        if field not in columns:
+            raise HTTPException(status_code=400, detail=f"Unknown sort field: {field}")
+        column = getattr(model, field)
+        order.append((field, column.desc() if descending else column.asc()))
+    return order
+
+
+def estimate_rows(db: Session, model) -> int:
+    """
+    Estimation du nombre de lignes via les statistiques du SGBD (sans COUNT).
+    Sans statistiques (autre SGBD, table jamais analysée : reltuples = -1 sous
+    PostgreSQL, table_rows NULL sous MySQL), les lignes sont comptées jusqu'à
+    LARGE_TABLE_ROWS seulement, ce qui suffit à classer la table.
+    """
+    table_name = model.__tablename__
+    cached = _row_estimates.get(table_name)
+    if cached and time.monotonic() - cached[0] < ROW_ESTIMATE_TTL_SECONDS:
+        return cached[1]
+
+    dialect = db.get_bind().dialect.name
+    queries = {
+        "postgresql": "SELECT reltuples::bigint FROM pg_class WHERE relname = :table_name",
+        "mysql": "SELECT table_rows FROM information_schema.tables "
+                 "WHERE table_schema = DATABASE() AND table_name = :table_name",
+    }
+    estimate = None
+    if dialect in queries:
+        try:
+            estimate = db.execute(text(queries[dialect]), {"table_name": table_name}).scalar()
+        except SQLAlchemyError as e:
+            logger.warning(f"Row estimate failed for {table_name}: {str(e)}")
+    if estimate is None or estimate < 0:
+        estimate = db.execute(
+            select(func.count()).select_from(
+                select(literal_column("1")).select_from(model.__table__).limit(LARGE_TABLE_ROWS).subquery()
+            )
+        ).scalar()
+    _row_estimates[table_name] = (time.monotonic(), estimate)
+    return estimate
+
+
+def filter_conditions(model,
+                      filters: Optional[Sequence[str]] = None,
+                      extra_conditions: Sequence = ()) -> list:
+    """
+    Conditions des filtres, sans tri ni pagination ni contrôle d'index : pour les
+    agrégats (facettes), qui bornent eux-mêmes leur parcours
+    """
+    return list(extra_conditions) + [parse_filter(model, expression)[2] for expression in filters or []]
+
+
+def plan_query(db: Session,
+               model,
+               filters: Optional[Sequence[str]] = None,
+               sort: Optional[str] = None,
+               skip: int = 0,
+               limit: Optional[int] = None,
+               extra_conditions: Sequence = (),
+               extra_indexed: bool = False) -> FilterPlan:
+    """
+    Construit conditions, tri et pagination, puis vérifie qu'une requête sur une
+    grande table s'appuie sur un index. Sinon sont refusés (400) le tri sur une
+    colonne non indexée et les requêtes sans limit ou avec limit au-delà de
+    MAX_UNINDEXED_LIMIT : le client pagine avec skip.
+    """
+    indexed = indexed_columns(model)
+    conditions = list(extra_conditions)
+    uses_index = extra_indexed
+    for expression in filters or []:
+        field, op, condition = parse_filter(model, expression)
+        conditions.append(condition)
+        uses_index = uses_index or (field in indexed and op in _SELECTIVE_OPS)
+
+    sort_fields = parse_sort(model, sort)
+    pk = model.__mapper__.primary_key[0]
+    order_by = [clause for _, clause in sort_fields] + [pk]
+
+    if not uses_index:
+        if estimate_rows(db, model) >= LARGE_TABLE_ROWS:
+            unindexed_sort = [field for field, _ in sort_fields if field not in indexed]
+            if unindexed_sort:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Sorting on unindexed column {', '.join(unindexed_sort)} requires a filter on an indexed column"
+                )
+            if limit is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Unpaginated query on a large table requires a filter on an indexed column"
+                )
+            if limit > MAX_UNINDEXED_LIMIT:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"limit above {MAX_UNINDEXED_LIMIT} requires a filter on an indexed column"
+                )
+
+    return FilterPlan(conditions, order_by, skip, limit, uses_index)
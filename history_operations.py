@@ -0,0 +1,316 @@
+from fastapi import HTTPException
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime
+import base64
+import json
+import logging
+
+from .database import SessionLocal
+from .change_feed import serialize_entry
+from .user_directory import user_directory
+from . import fast_json
+from audit_manager import AuditLog, AuditFieldChange, ActionType, changed_fields, field_value_text
+from audit_archive import audit_archive
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_LIMIT = 100
+MAX_HISTORY_LIMIT = 1000
+# Entrées lues (et mises en forme) par requête lors d'un parcours en flux
+HISTORY_CHUNK_SIZE = 200
+
+
+def format_changes(old_values: Optional[Dict], new_values: Optional[Dict]) -> List[Dict]:
+    """Différences champ par champ entre anciennes et nouvelles valeurs"""
+    return [
+        {"field": field, "old": old, "new": new}
+        for field, old, new in changed_fields(old_values, new_values)
+    ]
+
+
+def format_history_entry(db: Session, log: AuditLog) -> Dict:
+    """Entrée d'historique pour l'affichage ; l'utilisateur doit avoir été préchargé"""
+    return {
+        "date": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "user": user_directory.get_user_info(db, log.user_id),
+        "action": log.action.value,
+        "changes": format_changes(log.old_values, log.new_values),
+    }
+
+
+def encode_history_cursor(timestamp: datetime, entry_id: int) -> str:
+    state = [timestamp.isoformat(), entry_id]
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_history_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        timestamp, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        return datetime.fromisoformat(timestamp), int(entry_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
+
+class HistoryOperations:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def query_history(self,
+                      table_names: Optional[List[str]] = None,
+                      record_id: Optional[int] = None,
+                      user_id: Optional[int] = None,
+                      action: Optional[str] = None,
+                      start_date: Optional[datetime] = None,
+                      end_date: Optional[datetime] = None,
+                      cursor: Optional[str] = None,
+                      limit: int = DEFAULT_HISTORY_LIMIT) -> Dict:
+        """
+        Historique filtré, toutes tables ou plusieurs tables, du plus récent au plus
+        ancien. Pagination par clé (timestamp, id) : chaque page est un parcours
+        d'index borné, quelle que soit sa profondeur. Une fois la base épuisée,
+        la suite est lue dans les segments archivés.
+        """
+        position = decode_history_cursor(cursor)
+        try:
+            action_type = ActionType(action) if action else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid action: {action}")
+
+        entries = self._fetch_page(
+            table_names, record_id, user_id, action_type, start_date, end_date, position, limit
+        )
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        last = entries[-1] if entries else None
+        user_directory.prefetch(self.db, {entry.user_id for entry in entries})
+        return {
+            "items": [
+                {
+                    **serialize_entry(entry),
+                    "batch_id": entry.batch_id,
+                    "user": user_directory.get_user_info(self.db, entry.user_id),
+                }
+                for entry in entries
+            ],
+            "next_cursor": encode_history_cursor(last.timestamp, last.id) if has_more else None,
+        }
+
+    def query_field_changes(self,
+                            field: str,
+                            new: Optional[str] = None,
+                            old: Optional[str] = None,
+                            table_names: Optional[List[str]] = None,
+                            record_id: Optional[int] = None,
+                            user_id: Optional[int] = None,
+                            start_date: Optional[datetime] = None,
+                            end_date: Optional[datetime] = None,
+                            cursor: Optional[str] = None,
+                            limit: int = DEFAULT_HISTORY_LIMIT) -> Dict:
+        """
+        Modifications d'un champ (ex. localisation passée à Lyon le mois dernier),
+        du plus récent au plus ancien, lues dans l'index audit_field_changes.
+        Les valeurs sont comparées sous leur forme texte (field_value_text).
+        """
+        position = decode_history_cursor(cursor)
+        query = self.db.query(AuditFieldChange).filter(AuditFieldChange.field == field)
+        if new is not None:
+            query = query.filter(AuditFieldChange.new == field_value_text(new))
+        if old is not None:
+            query = query.filter(AuditFieldChange.old == field_value_text(old))
+        if table_names:
+            query = query.filter(AuditFieldChange.table_name.in_(table_names))
+        if record_id is not None:
+            query = query.filter(AuditFieldChange.record_id == record_id)
+        if user_id:
+            query = query.filter(AuditFieldChange.user_id == user_id)
+        if start_date:
+            query = query.filter(AuditFieldChange.timestamp >= start_date)
+        if end_date:
+            query = query.filter(AuditFieldChange.timestamp <= end_date)
+        if position:
+            query = query.filter(tuple_(AuditFieldChange.timestamp, AuditFieldChange.id) < tuple_(*position))
+
+        try:
+            changes = query.order_by(
+                AuditFieldChange.timestamp.desc(), AuditFieldChange.id.desc()
+            ).limit(limit + 1).all()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        last = changes[-1] if changes else None
+        user_directory.prefetch(self.db, {change.user_id for change in changes})
+        return {
+            "items": [
+                {
+                    "audit_log_id": change.audit_log_id,
+                    "table_name": change.table_name,
+                    "record_id": change.record_id,
+                    "field": change.field,
+                    "old": change.old,
+                    "new": change.new,
+                    "timestamp": change.timestamp.isoformat(),
+                    "user": user_directory.get_user_info(self.db, change.user_id),
+                }
+                for change in changes
+            ],
+            "next_cursor": encode_history_cursor(last.timestamp, last.id) if has_more else None,
+        }
+
+    def record_history_page(self,
+                            table_name: str,
+                            record_id: int,
+                            limit: int = DEFAULT_HISTORY_LIMIT) -> Dict:
+        """
+        Première page de l'historique mis en forme d'un article, lue tant que la
+        session est ouverte ; la suite s'obtient avec next_cursor sur /history
+        """
+        items, last, has_more = [], None, False
+        for entry, formatted in self.iter_record_history(table_name, record_id, None, limit + 1):
+            if len(items) == limit:
+                has_more = True
+                break
+            items.append(formatted)
+            last = entry
+        return {
+            "items": items,
+            "next_cursor": encode_history_cursor(last.timestamp, last.id) if has_more else None,
+        }
+
+    def iter_record_history(self,
+                            table_name: str,
+                            record_id: int,
+                            position: Optional[Tuple[datetime, int]] = None,
+                            limit: Optional[int] = None) -> Iterator[Tuple[AuditLog, Dict]]:
+        """
+        Historique d'un article, du plus récent au plus ancien, lu par blocs de
+        HISTORY_CHUNK_SIZE : seules les entrées effectivement consommées sont lues
+        et mises en forme (différences calculées à la demande).
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = HISTORY_CHUNK_SIZE if remaining is None else min(HISTORY_CHUNK_SIZE, remaining)
+            page = self._fetch_page([table_name], record_id, None, None, None, None, position, size)
+            entries = page[:size]
+            if not entries:
+                return
+            user_directory.prefetch(self.db, {entry.user_id for entry in entries})
+            for entry in entries:
+                yield entry, format_history_entry(self.db, entry)
+            position = (entries[-1].timestamp, entries[-1].id)
+            if remaining is not None:
+                remaining -= len(entries)
+            if len(page) <= size:
+                return
+
+    def _fetch_page(self,
+                    table_names: Optional[List[str]],
+                    record_id: Optional[int],
+                    user_id: Optional[int],
+                    action_type: Optional[ActionType],
+                    start_date: Optional[datetime],
+                    end_date: Optional[datetime],
+                    position: Optional[Tuple[datetime, int]],
+                    limit: int) -> List[AuditLog]:
+        """Jusqu'à limit + 1 entrées après position : base d'abord, puis archive"""
+        query = self.db.query(AuditLog)
+        if table_names:
+            query = query.filter(AuditLog.table_name.in_(table_names))
+        if record_id is not None:
+            query = query.filter(AuditLog.record_id == record_id)
+        if user_id:
+            query = query.filter(AuditLog.user_id == user_id)
+        if action_type:
+            query = query.filter(AuditLog.action == action_type)
+        if start_date:
+            query = query.filter(AuditLog.timestamp >= start_date)
+        if end_date:
+            query = query.filter(AuditLog.timestamp <= end_date)
+        if position:
+            query = query.filter(tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(*position))
+
+        try:
+            entries = query.order_by(
+                AuditLog.timestamp.desc(), AuditLog.id.desc()
+            ).limit(limit + 1).all()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+        if len(entries) <= limit:
+            entries += self._archived_page(
+                entries, table_names, record_id, user_id, action_type, start_date, end_date, position, limit
+            )
+        return entries
+
+    def _archived_page(self,
+                       entries: List[AuditLog],
+                       table_names: Optional[List[str]],
+                       record_id: Optional[int],
+                       user_id: Optional[int],
+                       action_type: Optional[ActionType],
+                       start_date: Optional[datetime],
+                       end_date: Optional[datetime],
+                       position: Optional[Tuple[datetime, int]],
+                       limit: int) -> List[AuditLog]:
+        """Entrées archivées qui suivent la page courante, au plus limit + 1 - len(entries)"""
+        wanted = limit + 1 - len(entries)
+        if entries:
+            position = (entries[-1].timestamp, entries[-1].id)
+
+        # Une entrée archivée mais pas encore supprimée peut figurer dans la page,
+        # et un lot repris après un arrêt peut figurer dans deux segments
+        seen = {entry.id for entry in entries}
+        archived = []
+        for table_name in table_names or audit_archive.table_names():
+            newest = audit_archive.newest_timestamp(table_name)
+            if newest is None or (start_date and start_date > newest):
+                continue
+            for row in audit_archive.query(
+                table_name, record_id, start_date, end_date, user_id,
+                action_type.value if action_type else None,
+                before=position, limit=wanted
+            ):
+                if row["id"] in seen:
+                    continue
+                seen.add(row["id"])
+                archived.append(AuditLog(**{**row, "action": ActionType(row["action"])}))
+
+        archived.sort(key=lambda entry: (entry.timestamp, entry.id), reverse=True)
+        return archived[:wanted]
+
+
+def stream_record_history(table_name: str,
+                          record_id: int,
+                          cursor: Optional[str] = None,
+                          limit: int = DEFAULT_HISTORY_LIMIT) -> Iterator[bytes]:
+    """
+    Corps JSON {"items": [...], "next_cursor": ...} produit entrée par entrée pour
+    une StreamingResponse. La session est propre au flux : celle de la requête
+    est fermée avant l'envoi de la réponse.
+    """
+    position = decode_history_cursor(cursor)
+    db = SessionLocal()
+    try:
+        yield b'{"items":['
+        last, emitted, has_more = None, 0, False
+        # Une entrée de plus que demandé indique s'il existe une page suivante
+        for entry, formatted in HistoryOperations(db).iter_record_history(table_name, record_id, position, limit + 1):
+            if emitted == limit:
+                has_more = True
+                break
+            yield (b"," if emitted else b"") + fast_json.dumps(formatted)
+            last, emitted = entry, emitted + 1
+        next_cursor = encode_history_cursor(last.timestamp, last.id) if has_more else None
+        yield b'],"next_cursor":' + fast_json.dumps(next_cursor) + b"}"
+    finally:
+        db.close()
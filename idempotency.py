@@ -0,0 +1,293 @@
+from typing import List, Optional
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import logging
+import threading
+import uuid
+
+from .database import get_service_session
+from .models import IdempotencyKeyDB
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENT_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+IDEMPOTENCY_TTL_HOURS = 24
+# Bail d'une exécution en cours, prolongé toutes les IDEMPOTENCY_LEASE_SECONDS / 3
+IDEMPOTENCY_LEASE_SECONDS = 60
+CLEANUP_INTERVAL_SECONDS = 60 * 60
+CLEANUP_CHUNK_SIZE = 5000
+MAX_KEY_LENGTH = 255
+
+
+def _request_hash(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.method.encode("utf-8"))
+    digest.update(request.url.path.encode("utf-8"))
+    digest.update(request.url.query.encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _reserve(key: str, request_hash: str, method: str, path: str, owner: str) -> Optional[IdempotencyKeyDB]:
+    """
+    Réserve la clé pour owner. Renvoie None si la requête doit s'exécuter (clé
+    nouvelle, expirée, ou en cours dont le bail n'a pas été prolongé), sinon
+    l'entrée existante.
+    """
+    db = get_service_session()
+    try:
+        for _ in range(2):
+            now = datetime.utcnow()
+            db.add(IdempotencyKeyDB(
+                key=key, request_hash=request_hash, method=method, path=path,
+                owner=owner, expires_at=now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+            ))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+
+            existing = db.get(IdempotencyKeyDB, key)
+            if existing is None:
+                continue
+            if existing.date_creation < now - timedelta(hours=IDEMPOTENCY_TTL_HOURS):
+                db.delete(existing)
+                db.commit()
+                continue
+            if (
+                existing.status_code is None
+                and existing.request_hash == request_hash
+                and (existing.expires_at is None or existing.expires_at < now)
+            ):
+                # Exécution abandonnée (processus arrêté) : la clé est reprise,
+                # une seule tentative gagne la mise à jour conditionnelle
+                taken = db.execute(
+                    update(IdempotencyKeyDB).where(
+                        IdempotencyKeyDB.key == key,
+                        IdempotencyKeyDB.status_code.is_(None),
+                        IdempotencyKeyDB.owner == existing.owner,
+                    ).values(owner=owner, expires_at=now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                if taken.rowcount == 1:
+                    logger.warning(f"Took over stale idempotency key {key}")
+                    return None
+                db.expire_all()
+                existing = db.get(IdempotencyKeyDB, key)
+                if existing is None:
+                    continue
+            db.expunge(existing)
+            return existing
+        return None
+    finally:
+        db.close()
+
+
+def _extend(key: str, owner: str) -> bool:
+    """Prolonge le bail de la clé ; False si elle a été reprise par une autre exécution"""
+    db = get_service_session()
+    try:
+        extended = db.execute(
+            update(IdempotencyKeyDB).where(
+                IdempotencyKeyDB.key == key,
+                IdempotencyKeyDB.owner == owner,
+                IdempotencyKeyDB.status_code.is_(None),
+            ).values(expires_at=datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS))
+        )
+        db.commit()
+        return extended.rowcount == 1
+    finally:
+        db.close()
+
+
+def _complete(key: str, owner: str, status_code: int, content_type: Optional[str],
+              headers: List[List[str]], body: bytes):
+    db = get_service_session()
+    try:
+        db.execute(
+            update(IdempotencyKeyDB).where(
+                IdempotencyKeyDB.key == key,
+                IdempotencyKeyDB.owner == owner,
+                IdempotencyKeyDB.status_code.is_(None),
+            ).values(
+                status_code=status_code,
+                content_type=content_type,
+                response_headers=headers,
+                response_body=body,
+                expires_at=None,
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _release(key: str, owner: str):
+    """Libère la clé après un échec serveur pour qu'un nouvel essai s'exécute"""
+    db = get_service_session()
+    try:
+        db.execute(delete(IdempotencyKeyDB).where(
+            IdempotencyKeyDB.key == key,
+            IdempotencyKeyDB.owner == owner,
+            IdempotencyKeyDB.status_code.is_(None),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _stored_headers(response: Response) -> List[List[str]]:
+    """En-têtes à rejouer (ETag, Location...) ; longueur et type sont recalculés"""
+    return [
+        [name, value] for name, value in response.headers.items()
+        if name.lower() not in ("content-length", "content-type")
+    ]
+
+
+def _build_response(body: bytes, status_code: int, content_type: Optional[str],
+                    headers: List[List[str]]) -> Response:
+    response = Response(content=body, status_code=status_code, media_type=content_type)
+    for name, value in headers:
+        response.headers.append(name, value)
+    return response
+
+
+async def _keep_lease(key: str, owner: str):
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+        try:
+            if not await run_in_threadpool(_extend, key, owner):
+                return
+        except SQLAlchemyError as e:
+            logger.error(f"Idempotency lease renewal failed: {str(e)}")
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """
+    Les écritures portant un en-tête Idempotency-Key ne sont exécutées qu'une fois :
+    une nouvelle tentative identique reçoit la réponse mémorisée (une lecture par clé
+    primaire), une réutilisation de la clé pour une autre requête est refusée.
+    Une exécution en cours détient la clé par un bail prolongé tant qu'elle tourne.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or request.method not in IDEMPOTENT_METHODS:
+            return await call_next(request)
+        if len(key) > MAX_KEY_LENGTH:
+            return JSONResponse(status_code=400, content={"detail": "Idempotency-Key is too long"})
+
+        body = await request.body()
+        request_hash = _request_hash(request, body)
+        owner = str(uuid.uuid4())
+        try:
+            existing = await run_in_threadpool(_reserve, key, request_hash, request.method, request.url.path, owner)
+        except SQLAlchemyError as e:
+            logger.error(f"Idempotency key lookup failed: {str(e)}")
+            return await call_next(request)
+
+        if existing is not None:
+            if existing.request_hash != request_hash:
+                return JSONResponse(
+                    status_code=422,
+                    content={"detail": "Idempotency-Key was already used for a different request"}
+                )
+            if existing.status_code is None:
+                return JSONResponse(
+                    status_code=409,
+                    content={"detail": "A request with this Idempotency-Key is still in progress"},
+                    headers={"Retry-After": "1"}
+                )
+            response = _build_response(
+                existing.response_body or b"", existing.status_code,
+                existing.content_type, existing.response_headers or []
+            )
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        lease = asyncio.ensure_future(_keep_lease(key, owner))
+        try:
+            try:
+                response = await call_next(request)
+            except Exception:
+                await run_in_threadpool(_release, key, owner)
+                raise
+
+            response_body = b"".join([chunk async for chunk in response.body_iterator])
+        finally:
+            lease.cancel()
+
+        headers = _stored_headers(response)
+        content_type = response.headers.get("content-type")
+        if response.status_code >= 500:
+            await run_in_threadpool(_release, key, owner)
+        else:
+            await run_in_threadpool(
+                _complete, key, owner, response.status_code, content_type, headers, response_body
+            )
+
+        return _build_response(response_body, response.status_code, content_type, headers)
+
+
+def cleanup_expired_keys() -> int:
+    """Supprime par lots les clés plus anciennes que la durée de conservation"""
+    cutoff = datetime.utcnow() - timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    db = get_service_session()
+    removed = 0
+    try:
+        while True:
+            keys = db.execute(
+                select(IdempotencyKeyDB.key).where(IdempotencyKeyDB.date_creation < cutoff).limit(CLEANUP_CHUNK_SIZE)
+            ).scalars().all()
+            if not keys:
+                break
+            db.execute(delete(IdempotencyKeyDB).where(IdempotencyKeyDB.key.in_(keys)))
+            db.commit()
+            removed += len(keys)
+        if removed:
+            logger.info(f"Removed {removed} expired idempotency keys")
+        return removed
+    finally:
+        db.close()
+
+
+class IdempotencyCleaner:
+    """Thread de fond qui purge régulièrement les clés expirées"""
+
+    def __init__(self, interval_seconds: int = CLEANUP_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                cleanup_expired_keys()
+            except SQLAlchemyError as e:
+                logger.error(f"Idempotency key cleanup failed: {str(e)}")
+            self._stop_event.wait(self.interval_seconds)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="idempotency-cleanup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+idempotency_cleaner = IdempotencyCleaner()
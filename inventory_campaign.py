@@ -0,0 +1,387 @@
+from fastapi import HTTPException
+from typing import Dict, List, Tuple
+from sqlalchemy import select, insert, update, func
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from collections import defaultdict
+from datetime import date, datetime
+import logging
+import threading
+import uuid
+
+from .database import get_service_session
+from .models import (
+    INVENTORY_MODELS, MacItemDB, InventoryCampaignDB, CampaignScanDB, CampaignProgressDB
+)
+from audit_manager import AuditManager, ActionType
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_OPEN = "Ouverte"
+CAMPAIGN_CLOSED = "Clôturée"
+
+# Nombre de scans en attente déclenchant l'application d'un lot dans la requête,
+# délai maximal avant qu'un lot incomplet soit appliqué, et taille d'un lot
+FLUSH_THRESHOLD = 500
+FLUSH_INTERVAL_SECONDS = 5
+FLUSH_BATCH_SIZE = 5000
+IN_CHUNK_SIZE = 1000
+
+
+def _chunks(values: List[str], size: int = IN_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class CampaignOperations:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def open_campaign(self, campaign_data: dict) -> "InventoryCampaignDB":
+        try:
+            campaign = InventoryCampaignDB(**campaign_data, statut=CAMPAIGN_OPEN)
+            self.db.add(campaign)
+            self.db.commit()
+            self.db.refresh(campaign)
+            logger.info(f"Opened inventory campaign {campaign.id_campagne}: {campaign.nom}")
+            return campaign
+
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def get_campaign(self, campaign_id: int) -> "InventoryCampaignDB":
+        try:
+            campaign = self.db.query(InventoryCampaignDB).filter(
+                InventoryCampaignDB.id_campagne == campaign_id
+            ).first()
+            if not campaign:
+                logger.warning(f"Inventory campaign not found with ID: {campaign_id}")
+                raise HTTPException(status_code=404, detail="Inventory campaign not found")
+            return campaign
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def _lock_campaign(self, campaign_id: int, read: bool = False) -> "InventoryCampaignDB":
+        """
+        Verrouille la campagne : partagé pour l'ajout de scans, exclusif pour
+        l'application des lots et la clôture, qui s'excluent ainsi mutuellement
+        """
+        campaign = self.db.query(InventoryCampaignDB).filter(
+            InventoryCampaignDB.id_campagne == campaign_id
+        ).with_for_update(read=read).first()
+        if not campaign:
+            logger.warning(f"Inventory campaign not found with ID: {campaign_id}")
+            raise HTTPException(status_code=404, detail="Inventory campaign not found")
+        return campaign
+
+    def add_scans(self, campaign_id: int, localisation: str, serials: List[str], user_id: int) -> Dict:
+        """
+        Enregistre les scans (non appliqués) avant de répondre : un scan accepté
+        survit à l'arrêt du worker et reste visible de tous les workers. Un numéro
+        dont le dernier scan de la campagne est à la même localisation est ignoré
+        (doublon, lot renvoyé par le client) ; scanné ailleurs, il est enregistré
+        à nouveau et ce dernier scan fait foi.
+        """
+        received = [serial.strip() for serial in serials if serial and serial.strip()]
+        serials = list(dict.fromkeys(received))
+        try:
+            campaign = self._lock_campaign(campaign_id, read=True)
+            if campaign.statut != CAMPAIGN_OPEN:
+                raise HTTPException(status_code=409, detail="Inventory campaign is closed")
+            accepted = self._stage(campaign_id, localisation, serials, user_id)
+            self.db.commit()
+            pending = self._pending_count(campaign_id)
+
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+        applied = self.flush(campaign_id) if pending >= FLUSH_THRESHOLD else 0
+        return {
+            "accepted": accepted,
+            "duplicates": len(received) - accepted,
+            "applied": applied,
+            "pending": max(pending - applied, 0),
+        }
+
+    def _stage(self, campaign_id: int, localisation: str, serials: List[str], user_id: int) -> int:
+        scan_time = datetime.utcnow()
+        staged = 0
+        for chunk in _chunks(serials):
+            # Localisation du dernier scan de chaque numéro dans la campagne
+            last_location = dict(self.db.execute(
+                select(CampaignScanDB.numero_serie, CampaignScanDB.localisation).where(
+                    CampaignScanDB.id_campagne == campaign_id,
+                    CampaignScanDB.numero_serie.in_(chunk),
+                ).order_by(CampaignScanDB.id_scan)
+            ).all())
+            rows = [
+                {
+                    "id_campagne": campaign_id,
+                    "numero_serie": serial,
+                    "localisation": localisation,
+                    "date_scan": scan_time,
+                    "applique": False,
+                    "user_id": user_id,
+                }
+                for serial in chunk if last_location.get(serial) != localisation
+            ]
+            if rows:
+                self.db.execute(insert(CampaignScanDB), rows)
+                staged += len(rows)
+        return staged
+
+    def _pending_count(self, campaign_id: int) -> int:
+        return self.db.query(func.count(CampaignScanDB.id_scan)).filter(
+            CampaignScanDB.id_campagne == campaign_id,
+            CampaignScanDB.applique.is_(False),
+        ).scalar() or 0
+
+    def flush(self, campaign_id: int) -> int:
+        """Applique les scans en attente, par lots, tant que la campagne est ouverte"""
+        applied = 0
+        while True:
+            try:
+                campaign = self._lock_campaign(campaign_id)
+                if campaign.statut != CAMPAIGN_OPEN:
+                    self.db.rollback()
+                    return applied
+                count = self._apply_pending(campaign_id)
+                self.db.commit()
+
+            except SQLAlchemyError as e:
+                self.db.rollback()
+                logger.error(f"Database error: {str(e)}")
+                raise HTTPException(status_code=500, detail="Database operation failed")
+
+            applied += count
+            if count < FLUSH_BATCH_SIZE:
+                return applied
+
+    def _locate(self, serials: List[str]) -> Dict[str, Tuple[str, int, str]]:
+        """numero_serie -> (table, id, localisation actuelle) pour les numéros connus"""
+        located = {}
+        for table_name, model in INVENTORY_MODELS.items():
+            pk = model.__mapper__.primary_key[0]
+            for chunk in _chunks(serials):
+                rows = self.db.execute(
+                    select(model.numero_serie, pk, model.localisation).where(model.numero_serie.in_(chunk))
+                )
+                for numero_serie, record_id, localisation in rows:
+                    located[numero_serie] = (table_name, record_id, localisation)
+        return located
+
+    def _apply_pending(self, campaign_id: int) -> int:
+        """
+        Applique un lot de scans en attente avec des requêtes ensemblistes : une
+        recherche IN par table, puis un UPDATE par table et par localisation au lieu
+        d'une mise à jour par article. Un numéro scanné plusieurs fois dans le lot
+        n'est déplacé que vers la localisation de son dernier scan. Les déplacements
+        sont historisés sous un batch_id commun, au nom de l'utilisateur ayant scanné.
+        """
+        pending = self.db.execute(
+            select(
+                CampaignScanDB.id_scan, CampaignScanDB.numero_serie,
+                CampaignScanDB.localisation, CampaignScanDB.user_id,
+            ).where(
+                CampaignScanDB.id_campagne == campaign_id,
+                CampaignScanDB.applique.is_(False),
+            ).order_by(CampaignScanDB.id_scan).limit(FLUSH_BATCH_SIZE)
+        ).all()
+        if not pending:
+            return 0
+
+        located = self._locate(list({scan.numero_serie for scan in pending}))
+        latest_scan = {scan.numero_serie: scan.id_scan for scan in pending}
+        today = date.today()
+        by_location = defaultdict(list)
+        for scan in pending:
+            by_location[scan.localisation].append(scan)
+
+        scan_updates = []
+        moves = defaultdict(list)
+        for localisation, scans in by_location.items():
+            found_by_table = defaultdict(list)
+            found_count = 0
+            for scan in scans:
+                table_name, record_id, previous_location = located.get(scan.numero_serie, (None, None, None))
+                scan_updates.append({
+                    "id_scan": scan.id_scan,
+                    "table_name": table_name,
+                    "localisation_attendue": previous_location,
+                    "applique": True,
+                })
+                if table_name:
+                    found_count += 1
+                if table_name and latest_scan[scan.numero_serie] == scan.id_scan:
+                    found_by_table[table_name].append(scan.numero_serie)
+                    if previous_location != localisation:
+                        moves[(table_name, scan.user_id)].append(
+                            (record_id, {"localisation": previous_location}, {"localisation": localisation})
+                        )
+
+            for table_name, found in found_by_table.items():
+                model = INVENTORY_MODELS[table_name]
+                values = {"localisation": localisation}
+                if model is MacItemDB:
+                    values["date_dernier_inventaire"] = today
+                for chunk in _chunks(found):
+                    self.db.execute(
+                        update(model).where(model.numero_serie.in_(chunk)).values(**values, version=model.version + 1)
+                    )
+
+            self._increment_progress(campaign_id, localisation, len(scans), found_count)
+
+        self.db.execute(update(CampaignScanDB), scan_updates)
+
+        batch_id = str(uuid.uuid4())
+        audit_manager = AuditManager(self.db)
+        for (table_name, user_id), changes in moves.items():
+            audit_manager.log_changes_bulk(
+                table_name=table_name,
+                action=ActionType.UPDATE,
+                changes=changes,
+                batch_id=batch_id,
+                user_id=user_id,
+                commit=False,
+            )
+        logger.info(f"Applied {len(pending)} scans to inventory campaign {campaign_id} (batch {batch_id})")
+        return len(pending)
+
+    def _increment_progress(self, campaign_id: int, localisation: str, scanned: int, found: int):
+        values = {
+            "scannes": CampaignProgressDB.scannes + scanned,
+            "trouves": CampaignProgressDB.trouves + found,
+            "inconnus": CampaignProgressDB.inconnus + (scanned - found),
+        }
+        counters = update(CampaignProgressDB).where(
+            CampaignProgressDB.id_campagne == campaign_id,
+            CampaignProgressDB.localisation == localisation,
+        ).values(**values)
+
+        if self.db.execute(counters).rowcount:
+            return
+        try:
+            # Première localisation vue : la ligne de compteurs est créée sous savepoint,
+            # un autre worker peut la créer en même temps
+            with self.db.begin_nested():
+                self.db.execute(insert(CampaignProgressDB).values(
+                    id_campagne=campaign_id, localisation=localisation,
+                    scannes=scanned, trouves=found, inconnus=scanned - found,
+                ))
+        except IntegrityError:
+            self.db.execute(counters)
+
+    def get_progress(self, campaign_id: int) -> Dict:
+        campaign = self.get_campaign(campaign_id)
+        try:
+            pending = dict(self.db.query(CampaignScanDB.localisation, func.count(CampaignScanDB.id_scan)).filter(
+                CampaignScanDB.id_campagne == campaign_id,
+                CampaignScanDB.applique.is_(False),
+            ).group_by(CampaignScanDB.localisation).all())
+            rows = self.db.query(CampaignProgressDB).filter(
+                CampaignProgressDB.id_campagne == campaign_id
+            ).order_by(CampaignProgressDB.localisation).all()
+
+            localisations = {}
+            for row in rows:
+                localisations[row.localisation] = {
+                    "scannes": row.scannes,
+                    "trouves": row.trouves,
+                    "inconnus": row.inconnus,
+                    "en_attente": pending.pop(row.localisation, 0),
+                }
+            for localisation, count in pending.items():
+                localisations[localisation] = {"scannes": 0, "trouves": 0, "inconnus": 0, "en_attente": count}
+
+            return {
+                "id_campagne": campaign.id_campagne,
+                "statut": campaign.statut,
+                "total_scannes": sum(loc["scannes"] for loc in localisations.values()),
+                "localisations": localisations,
+            }
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def close_campaign(self, campaign_id: int) -> "InventoryCampaignDB":
+        """Applique les derniers scans et clôture dans la même transaction, campagne verrouillée"""
+        try:
+            campaign = self._lock_campaign(campaign_id)
+            if campaign.statut != CAMPAIGN_OPEN:
+                raise HTTPException(status_code=409, detail="Inventory campaign is already closed")
+
+            while self._apply_pending(campaign_id) == FLUSH_BATCH_SIZE:
+                pass
+            campaign.statut = CAMPAIGN_CLOSED
+            campaign.date_cloture = datetime.utcnow()
+            self.db.commit()
+            self.db.refresh(campaign)
+            logger.info(f"Closed inventory campaign {campaign_id}")
+            return campaign
+
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+        except HTTPException:
+            self.db.rollback()
+            raise
+
+
+class ScanFlusher:
+    """Applique périodiquement les scans en attente, quel que soit le worker qui les a reçus"""
+
+    def __init__(self, interval_seconds: int = FLUSH_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def flush_all(self):
+        db = get_service_session()
+        try:
+            campaign_ids = [
+                campaign_id for (campaign_id,) in
+                db.query(CampaignScanDB.id_campagne).join(
+                    InventoryCampaignDB, InventoryCampaignDB.id_campagne == CampaignScanDB.id_campagne
+                ).filter(
+                    CampaignScanDB.applique.is_(False),
+                    InventoryCampaignDB.statut == CAMPAIGN_OPEN,
+                ).distinct().all()
+            ]
+            db.rollback()
+            ops = CampaignOperations(db)
+            for campaign_id in campaign_ids:
+                try:
+                    ops.flush(campaign_id)
+                except HTTPException as e:
+                    logger.error(f"Scan flush failed for campaign {campaign_id}: {e.detail}")
+        except SQLAlchemyError as e:
+            logger.error(f"Could not list campaigns with pending scans: {str(e)}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            self.flush_all()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="campaign-scan-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+scan_flusher = ScanFlusher()
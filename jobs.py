@@ -0,0 +1,413 @@
+from fastapi import HTTPException
+from typing import Any, Callable, Dict, List, Optional, Set
+from sqlalchemy import update, or_, and_
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+from .database import get_job_session
+from .models import JobDB
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "En attente"
+JOB_RUNNING = "En cours"
+JOB_DONE = "Terminé"
+JOB_FAILED = "Échec"
+JOB_CANCELLED = "Annulé"
+
+JOB_THREAD_WORKERS = int(os.getenv("JOB_THREAD_WORKERS", "2"))
+JOB_RESULTS_DIR = os.getenv("JOB_RESULTS_DIR", os.path.join(tempfile.gettempdir(), "inventaire-jobs"))
+# Fréquence maximale des écritures de progression et des lectures d'annulation
+PROGRESS_INTERVAL_SECONDS = 1.0
+# Une tâche en cours dont le bail n'est pas renouvelé pendant JOB_LEASE_SECONDS
+# (worker arrêté brutalement) peut être reprise par un autre worker
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = 15
+
+_handlers: Dict[str, Callable[["JobContext"], Optional[Dict]]] = {}
+# Types de tâches dont une seule exécution peut être active à la fois
+_exclusive: Set[str] = set()
+
+
+def register_job(job_type: str, exclusive: bool = False):
+    """Décorateur enregistrant le traitement d'un type de tâche"""
+    def decorator(func):
+        _handlers[job_type] = func
+        if exclusive:
+            _exclusive.add(job_type)
+        return func
+    return decorator
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobInterrupted(Exception):
+    """Arrêt du service : la tâche sera reprise au prochain démarrage"""
+    pass
+
+
+def _update_job(job_id: str, worker_id: Optional[str] = None, **values) -> bool:
+    """
+    Mise à jour de l'état d'une tâche dans une session courte, indépendante du
+    traitement. Avec worker_id, seulement si ce worker détient toujours la tâche.
+    """
+    db = get_job_session()
+    try:
+        conditions = [JobDB.id == job_id]
+        if worker_id is not None:
+            conditions.append(JobDB.owner == worker_id)
+        result = db.execute(update(JobDB).where(*conditions).values(**values))
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+
+def claimable():
+    """Tâches pouvant être prises : en attente, ou en cours avec un bail expiré"""
+    expired = datetime.utcnow() - timedelta(seconds=JOB_LEASE_SECONDS)
+    return or_(
+        JobDB.statut == JOB_PENDING,
+        and_(JobDB.statut == JOB_RUNNING, or_(JobDB.heartbeat.is_(None), JobDB.heartbeat < expired)),
+    )
+
+
+def running_elsewhere(db: Session, job_type: str, job_id: str) -> bool:
+    """Vrai si une autre tâche du même type est en cours avec un bail valide"""
+    live = datetime.utcnow() - timedelta(seconds=JOB_LEASE_SECONDS)
+    return db.query(JobDB.id).filter(
+        JobDB.type == job_type,
+        JobDB.id != job_id,
+        JobDB.statut == JOB_RUNNING,
+        JobDB.heartbeat >= live,
+    ).first() is not None
+
+
+def claim_job(db: Session, job_id: str, worker_id: str) -> bool:
+    """
+    Prend la tâche par un UPDATE conditionnel : quand plusieurs workers tentent
+    de la prendre, un seul modifie la ligne.
+    """
+    now = datetime.utcnow()
+    result = db.execute(
+        update(JobDB).where(JobDB.id == job_id, claimable())
+        .values(statut=JOB_RUNNING, owner=worker_id, heartbeat=now, date_debut=now, error=None)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+class JobContext:
+    """Ce que reçoit un traitement : paramètres, session, progression, annulation, fichier résultat"""
+
+    def __init__(self, runner: "JobRunner", job: JobDB, db: Session):
+        self.runner = runner
+        self.job_id = job.id
+        self.params = job.params or {}
+        self.db = db
+        self.result_path = None
+        self.result_content_type = None
+        self._last_check = 0.0
+
+    def progress(self, percent: int, message: Optional[str] = None):
+        """Enregistre la progression (limitée à une écriture par seconde) et vérifie l'annulation"""
+        now = time.monotonic()
+        if percent < 100 and now - self._last_check < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_check = now
+        values = {"progression": max(0, min(100, int(percent)))}
+        if message is not None:
+            values["message"] = message[:255]
+        _update_job(self.job_id, **values)
+        self.check_cancelled(force=True)
+
+    def check_cancelled(self, force: bool = False):
+        if self.runner.stopping:
+            raise JobInterrupted()
+        now = time.monotonic()
+        if not force and now - self._last_check < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_check = now
+        db = get_job_session()
+        try:
+            state = db.query(JobDB.annulation_demandee, JobDB.owner).filter(JobDB.id == self.job_id).first()
+        finally:
+            db.close()
+        if state is None or state.owner != self.runner.worker_id:
+            # Bail perdu : un autre worker a repris la tâche
+            raise JobInterrupted()
+        if state.annulation_demandee:
+            raise JobCancelled()
+
+    def result_file(self, filename: str, content_type: str) -> str:
+        """Chemin du fichier résultat de la tâche, servi ensuite par /jobs/{id}/result"""
+        directory = os.path.join(JOB_RESULTS_DIR, self.job_id)
+        os.makedirs(directory, exist_ok=True)
+        self.result_path = os.path.join(directory, filename)
+        self.result_content_type = content_type
+        return self.result_path
+
+
+class JobRunner:
+    """
+    Exécute les tâches dans un pool de threads (E/S base et fichiers). Les tâches
+    utilisent le pool de connexions dédié (database.job_engine).
+
+    Plusieurs workers partagent la table jobs : une tâche n'est exécutée qu'après
+    avoir été prise (claim_job), et son bail est renouvelé par un thread de
+    battement qui reprend aussi les tâches abandonnées par un worker disparu.
+    """
+
+    def __init__(self, max_workers: int = JOB_THREAD_WORKERS):
+        self.max_workers = max_workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = None
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_event.is_set()
+
+    def start(self):
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._stop_event.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, job_id: str):
+        with self._lock:
+            if self._executor is None:
+                raise HTTPException(status_code=503, detail="Job runner is not running")
+            if job_id in self._queued:
+                return
+            self._queued.add(job_id)
+            self._executor.submit(self._execute, job_id)
+
+    def _run(self):
+        # Premier passage immédiat : reprise des tâches en attente au démarrage
+        while True:
+            self.heartbeat()
+            self.resume_claimable()
+            if self._stop_event.wait(JOB_HEARTBEAT_SECONDS):
+                return
+
+    def heartbeat(self):
+        """Renouvelle le bail des tâches exécutées par ce worker"""
+        db = get_job_session()
+        try:
+            db.execute(
+                update(JobDB).where(JobDB.owner == self.worker_id, JobDB.statut == JOB_RUNNING)
+                .values(heartbeat=datetime.utcnow())
+            )
+            db.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Could not renew job leases: {str(e)}")
+        finally:
+            db.close()
+
+    def resume_claimable(self):
+        """Soumet les tâches en attente et celles dont le bail a expiré"""
+        db = get_job_session()
+        try:
+            job_ids = [
+                job_id for (job_id,) in
+                db.query(JobDB.id).filter(claimable()).order_by(JobDB.date_creation).all()
+            ]
+        except SQLAlchemyError as e:
+            logger.error(f"Could not list pending jobs: {str(e)}")
+            return
+        finally:
+            db.close()
+        for job_id in job_ids:
+            try:
+                self.submit(job_id)
+            except HTTPException:
+                return
+
+    def _execute(self, job_id: str):
+        with self._lock:
+            self._queued.discard(job_id)
+        db = get_job_session()
+        try:
+            if not claim_job(db, job_id, self.worker_id):
+                return
+            job = db.query(JobDB).filter(JobDB.id == job_id).first()
+            if job.annulation_demandee:
+                _update_job(job_id, self.worker_id, statut=JOB_CANCELLED, date_fin=datetime.utcnow())
+                return
+            handler = _handlers.get(job.type)
+            if handler is None:
+                _update_job(job_id, self.worker_id, statut=JOB_FAILED, error=f"Unknown job type: {job.type}",
+                            date_fin=datetime.utcnow())
+                return
+            if job.type in _exclusive and running_elsewhere(db, job.type, job_id):
+                _update_job(job_id, self.worker_id, statut=JOB_FAILED,
+                            error=f"Another {job.type} job is already running", date_fin=datetime.utcnow())
+                return
+
+            context = JobContext(self, job, db)
+            logger.info(f"Job {job_id} ({job.type}) started")
+            try:
+                result = handler(context)
+            except JobInterrupted:
+                db.rollback()
+                if _update_job(job_id, self.worker_id, statut=JOB_PENDING, owner=None, heartbeat=None,
+                               message="Interrompue, reprise au redémarrage"):
+                    logger.info(f"Job {job_id} interrupted by shutdown")
+                else:
+                    logger.warning(f"Job {job_id} lease lost, taken over by another worker")
+                return
+            except JobCancelled:
+                db.rollback()
+                _remove_results(job_id)
+                _update_job(job_id, self.worker_id, statut=JOB_CANCELLED, date_fin=datetime.utcnow())
+                logger.info(f"Job {job_id} cancelled")
+                return
+            except Exception as e:
+                db.rollback()
+                _remove_results(job_id)
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                _update_job(job_id, self.worker_id, statut=JOB_FAILED, error=str(detail),
+                            date_fin=datetime.utcnow())
+                logger.error(f"Job {job_id} failed: {detail}")
+                return
+
+            _update_job(
+                job_id,
+                self.worker_id,
+                statut=JOB_DONE,
+                progression=100,
+                result=result,
+                result_path=context.result_path,
+                result_content_type=context.result_content_type,
+                date_fin=datetime.utcnow(),
+            )
+            logger.info(f"Job {job_id} ({job.type}) finished")
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in job {job_id}: {str(e)}")
+        finally:
+            db.close()
+
+
+def _remove_results(job_id: str):
+    shutil.rmtree(os.path.join(JOB_RESULTS_DIR, job_id), ignore_errors=True)
+
+
+job_runner = JobRunner()
+
+
+class JobOperations:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def prepare_job(self, job_type: str, params: Dict[str, Any]) -> JobDB:
+        """Ajoute la tâche à la session sans la valider : à soumettre après le commit de l'appelant"""
+        if job_type not in _handlers:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown job type: {job_type}. Use one of: {', '.join(sorted(_handlers))}"
+            )
+        if job_type in _exclusive and self.db.query(JobDB.id).filter(
+            JobDB.type == job_type, JobDB.statut.in_([JOB_PENDING, JOB_RUNNING])
+        ).first() is not None:
+            raise HTTPException(status_code=409, detail=f"A {job_type} job is already pending or running")
+        job = JobDB(id=str(uuid.uuid4()), type=job_type, statut=JOB_PENDING, params=params)
+        self.db.add(job)
+        return job
+
+    def create_job(self, job_type: str, params: Dict[str, Any]) -> JobDB:
+        job = self.prepare_job(job_type, params)
+        try:
+            self.db.commit()
+            self.db.refresh(job)
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+        job_runner.submit(job.id)
+        return job
+
+    def get_job(self, job_id: str) -> JobDB:
+        try:
+            job = self.db.query(JobDB).filter(JobDB.id == job_id).first()
+            if not job:
+                logger.warning(f"Job not found with ID: {job_id}")
+                raise HTTPException(status_code=404, detail="Job not found")
+            return job
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def list_jobs(self,
+                  job_type: Optional[str] = None,
+                  statut: Optional[str] = None,
+                  skip: int = 0,
+                  limit: int = 100) -> List[JobDB]:
+        try:
+            query = self.db.query(JobDB)
+            if job_type:
+                query = query.filter(JobDB.type == job_type)
+            if statut:
+                query = query.filter(JobDB.statut == statut)
+            return query.order_by(JobDB.date_creation.desc()).offset(skip).limit(limit).all()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def cancel_job(self, job_id: str) -> JobDB:
+        """Une tâche en attente est annulée tout de suite ; une tâche en cours s'arrête à son prochain point de contrôle"""
+        job = self.get_job(job_id)
+        if job.statut not in (JOB_PENDING, JOB_RUNNING):
+            raise HTTPException(status_code=409, detail=f"Job is already {job.statut}")
+        try:
+            job.annulation_demandee = True
+            if job.statut == JOB_PENDING:
+                job.statut = JOB_CANCELLED
+                job.date_fin = datetime.utcnow()
+            self.db.commit()
+            self.db.refresh(job)
+            return job
+
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def get_result_file(self, job_id: str) -> JobDB:
+        job = self.get_job(job_id)
+        if job.statut != JOB_DONE:
+            raise HTTPException(status_code=409, detail=f"Job is {job.statut}")
+        if not job.result_path or not os.path.exists(job.result_path):
+            raise HTTPException(status_code=404, detail="Job has no result file")
+        return job
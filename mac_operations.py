@@ -1,14 +1,23 @@
 from fastapi import HTTPException
 from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List, Optional
 import logging
 from datetime import date
 
 from .database import get_db  # Import get_db from  database module
 from .models import MacItemDB, MacItem  # Import  SQLAlchemy and Pydantic models
-from audit_manager import audit_changes, AuditManager, AuditLog
+from audit_manager import audit_changes, AuditManager, AuditLog, ActionType
+from .serial_bloom import get_serial_filter
+from .fast_json import schema_columns
+from .filter_dsl import plan_query, filter_conditions, FilterPlan
+from .facets import compute_facets
+from .user_directory import user_directory
+from .history_operations import HistoryOperations
+from .concurrency import check_version, precondition_failed
 
 
 # Configure logging
@@ -20,15 +29,30 @@ class MacOperations:
         self.audit_manager = AuditManager(db)
 
     @audit_changes(table_name="mac_inventory")
-    async def create_or_update_mac_item(self, mac_item_data: dict) -> "MacItemDB":
+    async def create_or_update_mac_item(self, mac_item_data: dict, expected_version: Optional[int] = None) -> "MacItemDB":
         try:
             numero_serie = mac_item_data.get("numero_serie")
             if not numero_serie:
                 raise HTTPException(status_code=400, detail="Serial number is required")
 
-            existing_item = self.db.query(MacItemDB).filter(
-                MacItemDB.numero_serie == numero_serie
-            ).first()
+            # Le filtre de Bloom évite la recherche pour un numéro certainement nouveau
+            existing_item = None
+            if expected_version is not None or get_serial_filter().might_contain(numero_serie):
+                existing_item = self._get_by_serial(numero_serie)
+            check_version(existing_item, expected_version)
+
+            if existing_item is None:
+                item = MacItemDB(**mac_item_data)
+                self.db.add(item)
+                try:
+                    self.db.flush()
+                    logger.info(f"Created new MAC item with serial number: {numero_serie}")
+                except IntegrityError:
+                    # Numéro créé par un autre worker depuis le chargement du filtre
+                    self.db.rollback()
+                    existing_item = self._get_by_serial(numero_serie)
+                    if existing_item is None:
+                        raise
 
             if existing_item:
                 for key, value in mac_item_data.items():
@@ -36,70 +60,70 @@ class MacOperations:
                         setattr(existing_item, key, value)
                 item = existing_item
                 logger.info(f"Updated MAC item with serial number: {numero_serie}")
-            else:
-                item = MacItemDB(**mac_item_data)
-                self.db.add(item)
-                logger.info(f"Created new MAC item with serial number: {numero_serie}")
 
             self.db.commit()
+            get_serial_filter().add(numero_serie)
             self.db.refresh(item)
             return item
 
+        except StaleDataError:
+            # Modifié par une autre requête entre la lecture et l'UPDATE
+            self.db.rollback()
+            raise precondition_failed()
         except SQLAlchemyError as e:
             self.db.rollback()
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
         pass
 
-    def get_mac_item(self, item_id: int) ->  Tuple["MacItemDB", List["AuditLog"]] :
+    def _get_by_serial(self, numero_serie: str) -> Optional["MacItemDB"]:
+        return self.db.query(MacItemDB).filter(
+            MacItemDB.numero_serie == numero_serie
+        ).first()
+
+    def get_mac_item(self, item_id: int) -> Tuple["MacItemDB", Dict]:
         try:
             item = self.db.query(MacItemDB).filter(MacItemDB.id_mac == item_id).first()
             if not item:
                 logger.warning(f"MAC item not found with ID: {item_id}")
                 raise HTTPException(status_code=404, detail="MAC item not found")
             
-            # Récupération de l'historique
-            history = self.audit_manager.get_history(
-                table_name="mac_inventory",
-                record_id=item_id
-            )
-            
-            # Formatage de l'historique pour l'affichage
-            formatted_history = []
-            for log in history:
-                formatted_log = {
-                    "date": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "user": self._get_user_info(log.user_id),
-                    "action": log.action.value,
-                    "changes": self._format_changes(log.old_values, log.new_values)
-                }
-                formatted_history.append(formatted_log)
-
-            return item, formatted_history
+            # Première page de l'historique seulement, lue ici dans la session
+            # de la requête ; la suite est servie par /history avec next_cursor
+            history = HistoryOperations(self.db).record_history_page("mac_inventory", item_id)
+
+            return item, history
 
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
         pass
 
+    def _get_user_info(self, user_id: int) -> Dict:
+        """Informations de l'utilisateur, depuis le cache commun au processus"""
+        return user_directory.get_user_info(self.db, user_id)
+
     def list_mac_items(self, skip: int = 0, limit: int = 100) -> List["MacItemDB"]:
         try:
-            items = self.db.query(MacItemDB).offset(skip).limit(limit).all()
+            items = self.db.query(MacItemDB).order_by(MacItemDB.id_mac).offset(skip).limit(limit).all()
             result = []
             
+            # Dernier changement de chaque article de la page, en une requête
+            created = [item.date_creation for item in items]
+            last_changes = self.audit_manager.get_last_changes(
+                "mac_inventory",
+                [item.id_mac for item in items],
+                created_since=min(created) if items and None not in created else None
+            )
+            user_directory.prefetch(self.db, {change.user_id for change in last_changes.values()})
+
             for item in items:
-                # Récupère uniquement le dernier changement pour la liste
-                last_change = self.audit_manager.get_history(
-                    table_name="mac_inventory",
-                    record_id=item.id_mac,
-                    limit=1
-                )
-                
                 item_dict = self._model_to_dict(item)
+                last_change = last_changes.get(item.id_mac)
                 item_dict["last_modification"] = {
-                    "date": last_change[0].timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "user": self._get_user_info(last_change[0].user_id),
-                    "action": last_change[0].action.value
+                    "date": last_change.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                    "user": self._get_user_info(last_change.user_id),
+                    "action": last_change.action.value
                 } if last_change else None
                 
                 result.append(item_dict)
@@ -110,14 +134,18 @@ class MacOperations:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
-    def delete_mac_item(self, item_id: int) -> bool:
+    def delete_mac_item(self, item_id: int, user_id: int) -> bool:
         try:
             item = self.db.query(MacItemDB).filter(MacItemDB.id_mac == item_id).first()
             if not item:
                 raise HTTPException(status_code=404, detail="MAC item not found")
             
+            # La suppression et son entrée d'audit sont validées ensemble (lue par /sync)
+            old_values = self.audit_manager._serialize_model(item)
             self.db.delete(item)
-            self.db.commit()
+            self.audit_manager.log_change(
+                "mac_inventory", item_id, ActionType.DELETE, old_values=old_values, user_id=user_id
+            )
             logger.info(f"Deleted MAC item with ID: {item_id}")
             return True
 
@@ -129,19 +157,93 @@ class MacOperations:
     def search_mac_items(self, 
                         numero_serie: Optional[str] = None,
                         modele: Optional[str] = None,
-                        statut: Optional[str] = None) -> List["MacItemDB"]:
+                        statut: Optional[str] = None,
+                        filters: Optional[List[str]] = None,
+                        sort: Optional[str] = None,
+                        skip: int = 0,
+                        limit: Optional[int] = None) -> List["MacItemDB"]:
+        plan = self._plan_search(numero_serie, modele, statut, filters, sort, skip, limit)
         try:
-            query = self.db.query(MacItemDB)
-            
-            if numero_serie:
-                query = query.filter(MacItemDB.numero_serie.ilike(f"%{numero_serie}%"))
-            if modele:
-                query = query.filter(MacItemDB.modele.ilike(f"%{modele}%"))
-            if statut:
-                query = query.filter(MacItemDB.statut == statut)
+            return plan.apply(self.db.query(MacItemDB)).all()
 
-            return query.all()
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def _search_filters(self,
+                        numero_serie: Optional[str] = None,
+                        modele: Optional[str] = None,
+                        statut: Optional[str] = None) -> list:
+        filters = []
+        if numero_serie:
+            filters.append(MacItemDB.numero_serie.ilike(f"%{numero_serie}%"))
+        if modele:
+            filters.append(MacItemDB.modele.ilike(f"%{modele}%"))
+        if statut:
+            filters.append(MacItemDB.statut == statut)
+        return filters
+
+    def _plan_search(self,
+                     numero_serie: Optional[str] = None,
+                     modele: Optional[str] = None,
+                     statut: Optional[str] = None,
+                     filters: Optional[List[str]] = None,
+                     sort: Optional[str] = None,
+                     skip: int = 0,
+                     limit: Optional[int] = None) -> FilterPlan:
+        # Seule l'égalité sur statut peut utiliser un index, pas les recherches %...%
+        return plan_query(
+            self.db, MacItemDB, filters, sort, skip, limit,
+            extra_conditions=self._search_filters(numero_serie, modele, statut),
+            extra_indexed=bool(statut),
+        )
+
+    def search_mac_facets(self,
+                        facet_fields: List[str],
+                        numero_serie: Optional[str] = None,
+                        modele: Optional[str] = None,
+                        statut: Optional[str] = None,
+                        filters: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """Comptes par valeur des colonnes demandées, pour l'ensemble filtré (sans pagination)"""
+        conditions = filter_conditions(MacItemDB, filters, self._search_filters(numero_serie, modele, statut))
+        return compute_facets(self.db, MacItemDB, conditions, facet_fields)
+
+    def _fetch_rows(self, query) -> Tuple[List[str], List[tuple]]:
+        try:
+            result = self.db.execute(query)
+            return list(result.keys()), result.all()
 
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def search_mac_rows(self,
+                        numero_serie: Optional[str] = None,
+                        modele: Optional[str] = None,
+                        statut: Optional[str] = None,
+                        columns: Optional[list] = None,
+                        filters: Optional[List[str]] = None,
+                        sort: Optional[str] = None,
+                        skip: int = 0,
+                        limit: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        """Variante de search_mac_items renvoyant des tuples (colonnes de MacItem), sans ORM"""
+        plan = self._plan_search(numero_serie, modele, statut, filters, sort, skip, limit)
+        query = plan.apply(select(*(columns or schema_columns(MacItemDB, MacItem))))
+        return self._fetch_rows(query)
+
+    def list_mac_rows(self, skip: int = 0, limit: int = 100,
+                      columns: Optional[list] = None) -> Tuple[List[str], List[tuple]]:
+        query = select(*(columns or schema_columns(MacItemDB, MacItem))).order_by(
+            MacItemDB.id_mac
+        ).offset(skip).limit(limit)
+        return self._fetch_rows(query)
+
+    def get_mac_row(self, item_id: int, columns: Optional[list] = None) -> Tuple[List[str], tuple]:
+        query = select(*(columns or schema_columns(MacItemDB, MacItem))).where(
+            MacItemDB.id_mac == item_id
+        )
+        keys, rows = self._fetch_rows(query)
+        if not rows:
+            logger.warning(f"MAC item not found with ID: {item_id}")
+            raise HTTPException(status_code=404, detail="MAC item not found")
+        return keys, rows[0]
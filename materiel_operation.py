@@ -1,13 +1,38 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, noload
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from fastapi import HTTPException
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 import logging
 from . import models, schemas
-from audit_manager import audit_changes, AuditManager, AuditLog
+from audit_manager import audit_changes, AuditManager, AuditLog, ActionType
+from .serial_bloom import get_serial_filter
+from .filter_dsl import plan_query, filter_conditions
+from .facets import compute_facets
+from .concurrency import check_version, precondition_failed
 
 # Configuration du logger
 logger = logging.getLogger(__name__)
 
+# Relations pouvant être chargées avec ?include=
+EQUIPEMENT_INCLUDES = {"categorie", "details"}
+
+def parse_includes(include: Optional[str]) -> Optional[Set[str]]:
+    """None sans paramètre include : le chargement par défaut des relations est conservé"""
+    if include is None:
+        return None
+    if not include:
+        return set()
+    includes = {part.strip() for part in include.split(",") if part.strip()}
+    unknown = includes - EQUIPEMENT_INCLUDES
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown include: {', '.join(sorted(unknown))}"
+        )
+    return includes
+
 class CategorieOperations:
     def __init__(self, db: Session):
         self.db = db
@@ -56,6 +81,34 @@ class CategorieOperations:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
+    def update_categorie(self, categorie_id: int, categorie_data: dict, expected_version: Optional[int] = None) -> "models.CategorieDB":
+        """Mise à jour par identifiant ; avec If-Match, refusée (412) si la version a changé"""
+        try:
+            categorie = self.db.query(models.CategorieDB).filter(
+                models.CategorieDB.id_categorie == categorie_id
+            ).first()
+            if not categorie:
+                logger.warning(f"Category not found with ID: {categorie_id}")
+                raise HTTPException(status_code=404, detail="Category not found")
+            check_version(categorie, expected_version)
+
+            for key, value in categorie_data.items():
+                if hasattr(categorie, key) and value is not None:
+                    setattr(categorie, key, value)
+
+            self.db.commit()
+            self.db.refresh(categorie)
+            logger.info(f"Updated category with ID: {categorie_id}")
+            return categorie
+
+        except StaleDataError:
+            self.db.rollback()
+            raise precondition_failed()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
     def get_all_categories(self, skip: int = 0, limit: int = 100) -> list["models.Categorie"]:
         try:
             categories = self.db.query(models.Categorie).offset(skip).limit(limit).all()
@@ -65,11 +118,15 @@ class CategorieOperations:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
-    def delete_categorie(self, categorie_id: int) -> "models.Categorie":
+    def delete_categorie(self, categorie_id: int, user_id: int) -> "models.Categorie":
         try:
             categorie = self.get_categorie(categorie_id)
+            audit_manager = AuditManager(self.db)
+            old_values = audit_manager._serialize_model(categorie)
             self.db.delete(categorie)
-            self.db.commit()
+            audit_manager.log_change(
+                "categories", categorie_id, ActionType.DELETE, old_values=old_values, user_id=user_id
+            )
             logger.info(f"Deleted category with ID: {categorie_id}")
             return categorie
 
@@ -83,16 +140,41 @@ class EquipementOperations:
     def __init__(self, db: Session):
         self.db = db
 
-    def create_or_update_equipement(self, equipement_data: dict, detail_data: dict = None) -> "models.Equipement":
+    def create_or_update_equipement(self, equipement_data: dict, detail_data: dict = None, expected_version: Optional[int] = None) -> "models.Equipement":
         try:
             numero_serie = equipement_data.get("numero_serie")
             if not numero_serie:
                 raise HTTPException(status_code=400, detail="Serial number is required")
 
-            # Recherche de l'équipement existant
-            existing_equipement = self.db.query(models.Equipement).filter(
-                models.Equipement.numero_serie == numero_serie
-            ).first()
+            # Recherche de l'équipement existant, sautée si le filtre de Bloom
+            # garantit que le numéro de série est nouveau
+            existing_equipement = None
+            if expected_version is not None or get_serial_filter().might_contain(numero_serie):
+                existing_equipement = self._get_by_serial(numero_serie)
+            check_version(existing_equipement, expected_version)
+
+            if existing_equipement is None:
+                # Création d'un nouvel équipement
+                equipement = models.Equipement(**equipement_data)
+                self.db.add(equipement)
+                try:
+                    self.db.commit()
+                except IntegrityError:
+                    # Numéro créé par un autre worker depuis le chargement du filtre
+                    self.db.rollback()
+                    existing_equipement = self._get_by_serial(numero_serie)
+                    if existing_equipement is None:
+                        raise
+                else:
+                    self.db.refresh(equipement)
+                    logger.info(f"Created new equipment with serial number: {numero_serie}")
+
+                    # Création des détails si fournis
+                    if detail_data:
+                        detail_data["id_equipement"] = equipement.id_equipement
+                        detail = models.DetailEquipement(**detail_data)
+                        self.db.add(detail)
+                        logger.info(f"Created new equipment detail with equipment ID: {equipement.id_equipement}")
 
             if existing_equipement:
                 # Mise à jour de l'équipement existant
@@ -116,75 +198,140 @@ class EquipementOperations:
                         detail_data["id_equipement"] = equipement.id_equipement
                         detail = models.DetailEquipement(**detail_data)
                         self.db.add(detail)
-            else:
-                # Création d'un nouvel équipement
-                equipement = models.Equipement(**equipement_data)
-                self.db.add(equipement)
-                self.db.commit()
-                self.db.refresh(equipement)
-                logger.info(f"Created new equipment with serial number: {numero_serie}")
-
-                # Création des détails si fournis
-                if detail_data:
-                    detail_data["id_equipement"] = equipement.id_equipement
-                    detail = models.DetailEquipement(**detail_data)
-                    self.db.add(detail)
-                    logger.info(f"Created new equipment detail with equipment ID: {equipement.id_equipement}")
 
             self.db.commit()
+            get_serial_filter().add(numero_serie)
             self.db.refresh(equipement)
             return equipement
 
+        except StaleDataError:
+            # Modifié par une autre requête entre la lecture et l'UPDATE
+            self.db.rollback()
+            raise precondition_failed()
         except SQLAlchemyError as e:
             self.db.rollback()
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
-    def get_equipement_with_details(self, equipement_id: int) -> dict:
+    def _get_by_serial(self, numero_serie: str) -> Optional["models.Equipement"]:
+        return self.db.query(models.Equipement).filter(
+            models.Equipement.numero_serie == numero_serie
+        ).first()
+
+    def _equipement_query(self, includes: Optional[Iterable[str]] = None):
+        """
+        categorie et details sont des relations vers un seul objet : un joinedload
+        les ramène dans la même requête que l'équipement, même avec offset/limit.
+        Avec includes, les relations non demandées ne sont pas chargées (pas de lazy
+        load par ligne) ; sans includes, le chargement par défaut est conservé.
+        """
+        query = self.db.query(models.EquipementDB)
+        if includes is None:
+            return query
+        for relation in EQUIPEMENT_INCLUDES:
+            attribute = getattr(models.EquipementDB, relation)
+            if relation in includes:
+                query = query.options(joinedload(attribute))
+            else:
+                query = query.options(noload(attribute))
+        return query
+
+    def get_equipement(self, equipement_id: int, includes: Optional[Iterable[str]] = None) -> "models.EquipementDB":
         try:
-            equipement = self.db.query(models.Equipement).filter(
-                models.Equipement.id_equipement == equipement_id
+            equipement = self._equipement_query(includes).filter(
+                models.EquipementDB.id_equipement == equipement_id
             ).first()
             if not equipement:
                 logger.warning(f"Equipment not found with ID: {equipement_id}")
                 raise HTTPException(status_code=404, detail="Equipment not found")
+            return equipement
 
-            detail = self.db.query(models.DetailEquipement).filter(
-                models.DetailEquipement.id_equipement == equipement_id
-            ).first()
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def get_equipement_with_details(self, equipement_id: int) -> dict:
+        equipement = self.get_equipement(equipement_id, includes={"details"})
+        return {
+            "equipement": equipement,
+            "details": equipement.details
+        }
 
-            return {
-                "equipement": equipement,
-                "details": detail
-            }
+    def get_all_equipements(self, skip: int = 0, limit: int = 100, includes: Optional[Iterable[str]] = None) -> list["models.EquipementDB"]:
+        try:
+            equipements = self._equipement_query(includes).order_by(
+                models.EquipementDB.id_equipement
+            ).offset(skip).limit(limit).all()
+            return equipements
 
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
-    def get_all_equipements(self, skip: int = 0, limit: int = 100) -> list["models.Equipement"]:
+    def search_equipements(self,
+                           filters: Optional[List[str]] = None,
+                           sort: Optional[str] = None,
+                           skip: int = 0,
+                           limit: Optional[int] = None,
+                           includes: Optional[Iterable[str]] = None) -> list["models.EquipementDB"]:
+        plan = plan_query(self.db, models.EquipementDB, filters, sort, skip, limit)
         try:
-            equipements = self.db.query(models.Equipement).offset(skip).limit(limit).all()
-            return equipements
+            return plan.apply(self._equipement_query(includes)).all()
 
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
-    def delete_equipement(self, equipement_id: int) -> "models.Equipement":
+    def search_equipement_facets(self, facet_fields: List[str], filters: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        conditions = filter_conditions(models.EquipementDB, filters)
+        return compute_facets(self.db, models.EquipementDB, conditions, facet_fields)
+
+    def _fetch_rows(self, query) -> Tuple[List[str], List[tuple]]:
         try:
+            result = self.db.execute(query)
+            return list(result.keys()), result.all()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def list_equipement_rows(self, skip: int = 0, limit: int = 100, columns: list = ()) -> Tuple[List[str], List[tuple]]:
+        """Liste des équipements limitée aux colonnes demandées, sans ORM"""
+        query = select(*columns).order_by(
+            models.EquipementDB.id_equipement
+        ).offset(skip).limit(limit)
+        return self._fetch_rows(query)
+
+    def get_equipement_row(self, equipement_id: int, columns: list = ()) -> Tuple[List[str], tuple]:
+        query = select(*columns).where(models.EquipementDB.id_equipement == equipement_id)
+        keys, rows = self._fetch_rows(query)
+        if not rows:
+            logger.warning(f"Equipment not found with ID: {equipement_id}")
+            raise HTTPException(status_code=404, detail="Equipment not found")
+        return keys, rows[0]
+
+    def delete_equipement(self, equipement_id: int, user_id: int) -> "models.Equipement":
+        try:
+            audit_manager = AuditManager(self.db)
+
             # Suppression des détails associés
             detail = self.db.query(models.DetailEquipement).filter(
                 models.DetailEquipement.id_equipement == equipement_id
             ).first()
             if detail:
+                audit_manager.log_change(
+                    "details_equipement", detail.id_detail, ActionType.DELETE,
+                    old_values=audit_manager._serialize_model(detail), user_id=user_id, commit=False
+                )
                 self.db.delete(detail)
 
-            # Suppression de l'équipement
+            # Suppression de l'équipement ; les entrées d'audit sont validées avec elle
             equipement = self.get_equipement_with_details(equipement_id)["equipement"]
+            old_values = audit_manager._serialize_model(equipement)
             self.db.delete(equipement)
-            
-            self.db.commit()
+            audit_manager.log_change(
+                "equipements", equipement_id, ActionType.DELETE, old_values=old_values, user_id=user_id
+            )
             logger.info(f"Deleted equipment with ID: {equipement_id}")
             return equipement
 
@@ -227,6 +374,34 @@ class DetailEquipementOperations:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
+    def update_detail(self, detail_id: int, detail_data: dict, expected_version: Optional[int] = None) -> "models.DetailEquipementDB":
+        """Mise à jour par identifiant ; avec If-Match, refusée (412) si la version a changé"""
+        try:
+            detail = self.db.query(models.DetailEquipementDB).filter(
+                models.DetailEquipementDB.id_detail == detail_id
+            ).first()
+            if not detail:
+                logger.warning(f"Equipment detail not found with ID: {detail_id}")
+                raise HTTPException(status_code=404, detail="Equipment detail not found")
+            check_version(detail, expected_version)
+
+            for key, value in detail_data.items():
+                if hasattr(detail, key) and value is not None:
+                    setattr(detail, key, value)
+
+            self.db.commit()
+            self.db.refresh(detail)
+            logger.info(f"Updated equipment detail with ID: {detail_id}")
+            return detail
+
+        except StaleDataError:
+            self.db.rollback()
+            raise precondition_failed()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
     def get_detail(self, detail_id: int) -> "models.DetailEquipement":
         try:
             detail = self.db.query(models.DetailEquipement).filter(
@@ -241,11 +416,15 @@ class DetailEquipementOperations:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
 
-    def delete_detail(self, detail_id: int) -> "models.DetailEquipement":
+    def delete_detail(self, detail_id: int, user_id: int) -> "models.DetailEquipement":
         try:
             detail = self.get_detail(detail_id)
+            audit_manager = AuditManager(self.db)
+            old_values = audit_manager._serialize_model(detail)
             self.db.delete(detail)
-            self.db.commit()
+            audit_manager.log_change(
+                "details_equipement", detail_id, ActionType.DELETE, old_values=old_values, user_id=user_id
+            )
             logger.info(f"Deleted equipment detail with ID: {detail_id}")
             return detail
 
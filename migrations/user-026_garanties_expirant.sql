@@ -0,0 +1,27 @@
+-- user-026 : index des dates de garantie et table des garanties arrivant à échéance (PostgreSQL)
+-- MySQL : SERIAL -> INTEGER AUTO_INCREMENT, retirer IF NOT EXISTS des CREATE INDEX
+
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_garantie_expire ON mac_inventory (garantie_expire);
+CREATE INDEX IF NOT EXISTS ix_ecran_garantie_expire ON ecran (garantie_expire);
+CREATE INDEX IF NOT EXISTS ix_equipements_garantie_expire ON equipements (garantie_expire);
+
+CREATE TABLE IF NOT EXISTS garanties_expirant (
+    id SERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INTEGER NOT NULL,
+    numero_serie VARCHAR(50) NOT NULL,
+    marque VARCHAR(100),
+    modele VARCHAR(100),
+    localisation VARCHAR(100),
+    statut VARCHAR(50),
+    garantie_expire DATE NOT NULL,
+    notifie BOOLEAN NOT NULL DEFAULT FALSE,
+    date_notification TIMESTAMP WITHOUT TIME ZONE,
+    date_scan TIMESTAMP WITHOUT TIME ZONE,
+    CONSTRAINT uq_garanties_expirant_record UNIQUE (table_name, record_id)
+);
+CREATE INDEX IF NOT EXISTS ix_garanties_expirant_garantie_expire ON garanties_expirant (garantie_expire);
+
+-- Retour arrière :
+-- DROP TABLE garanties_expirant;
+-- DROP INDEX ix_mac_inventory_garantie_expire, ix_ecran_garantie_expire, ix_equipements_garantie_expire;
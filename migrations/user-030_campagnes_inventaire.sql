@@ -0,0 +1,39 @@
+-- user-030 : campagnes d'inventaire physique, scans et compteurs par localisation (PostgreSQL)
+-- MySQL : SERIAL -> INTEGER AUTO_INCREMENT, retirer IF NOT EXISTS des CREATE INDEX
+
+CREATE TABLE IF NOT EXISTS campagnes_inventaire (
+    id_campagne SERIAL PRIMARY KEY,
+    nom VARCHAR(100) NOT NULL,
+    statut VARCHAR(20) NOT NULL DEFAULT 'Ouverte',
+    date_ouverture TIMESTAMP WITHOUT TIME ZONE,
+    date_cloture TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- Un numéro peut être scanné plusieurs fois : le dernier scan fait foi
+CREATE TABLE IF NOT EXISTS campagne_scans (
+    id_scan SERIAL PRIMARY KEY,
+    id_campagne INTEGER NOT NULL REFERENCES campagnes_inventaire (id_campagne),
+    numero_serie VARCHAR(50) NOT NULL,
+    localisation VARCHAR(100) NOT NULL,
+    table_name VARCHAR(50),
+    localisation_attendue VARCHAR(100),
+    date_scan TIMESTAMP WITHOUT TIME ZONE,
+    applique BOOLEAN NOT NULL DEFAULT TRUE,
+    user_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_campagne_scans_campagne_serie ON campagne_scans (id_campagne, numero_serie, id_scan);
+CREATE INDEX IF NOT EXISTS ix_campagne_scans_campagne_localisation ON campagne_scans (id_campagne, localisation);
+CREATE INDEX IF NOT EXISTS ix_campagne_scans_en_attente ON campagne_scans (id_campagne, applique);
+
+CREATE TABLE IF NOT EXISTS campagne_progression (
+    id SERIAL PRIMARY KEY,
+    id_campagne INTEGER NOT NULL REFERENCES campagnes_inventaire (id_campagne),
+    localisation VARCHAR(100) NOT NULL,
+    scannes INTEGER NOT NULL DEFAULT 0,
+    trouves INTEGER NOT NULL DEFAULT 0,
+    inconnus INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_campagne_progression_localisation UNIQUE (id_campagne, localisation)
+);
+
+-- Retour arrière :
+-- DROP TABLE campagne_progression, campagne_scans, campagnes_inventaire;
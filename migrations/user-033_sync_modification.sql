@@ -0,0 +1,9 @@
+-- user-033 : parcours de /sync dans l'ordre (date_modification, id) (PostgreSQL)
+-- MySQL : retirer IF NOT EXISTS
+
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_modification ON mac_inventory (date_modification, id_mac);
+CREATE INDEX IF NOT EXISTS ix_ecran_modification ON ecran (date_modification, id_ecran);
+CREATE INDEX IF NOT EXISTS ix_equipements_modification ON equipements (date_modification, id_equipement);
+
+-- Retour arrière :
+-- DROP INDEX ix_mac_inventory_modification, ix_ecran_modification, ix_equipements_modification;
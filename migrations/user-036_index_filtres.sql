@@ -0,0 +1,33 @@
+-- user-036 : index des colonnes filtrables et triables des recherches (PostgreSQL)
+-- MySQL : retirer IF NOT EXISTS
+
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_marque ON mac_inventory (marque);
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_modele ON mac_inventory (modele);
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_annee_achat ON mac_inventory (annee_achat);
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_localisation ON mac_inventory (localisation);
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_statut ON mac_inventory (statut);
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_prix ON mac_inventory (prix);
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_ram ON mac_inventory (ram);
+CREATE INDEX IF NOT EXISTS ix_mac_inventory_stockage_type ON mac_inventory (stockage_type);
+
+CREATE INDEX IF NOT EXISTS ix_ecran_marque ON ecran (marque);
+CREATE INDEX IF NOT EXISTS ix_ecran_modele ON ecran (modele);
+CREATE INDEX IF NOT EXISTS ix_ecran_annee_achat ON ecran (annee_achat);
+CREATE INDEX IF NOT EXISTS ix_ecran_localisation ON ecran (localisation);
+CREATE INDEX IF NOT EXISTS ix_ecran_statut ON ecran (statut);
+CREATE INDEX IF NOT EXISTS ix_ecran_prix ON ecran (prix);
+
+CREATE INDEX IF NOT EXISTS ix_equipements_marque ON equipements (marque);
+CREATE INDEX IF NOT EXISTS ix_equipements_modele ON equipements (modele);
+CREATE INDEX IF NOT EXISTS ix_equipements_annee_achat ON equipements (annee_achat);
+CREATE INDEX IF NOT EXISTS ix_equipements_localisation ON equipements (localisation);
+CREATE INDEX IF NOT EXISTS ix_equipements_statut ON equipements (statut);
+CREATE INDEX IF NOT EXISTS ix_equipements_prix ON equipements (prix);
+
+-- Retour arrière :
+-- DROP INDEX ix_mac_inventory_marque, ix_mac_inventory_modele, ix_mac_inventory_annee_achat,
+--     ix_mac_inventory_localisation, ix_mac_inventory_statut, ix_mac_inventory_prix,
+--     ix_mac_inventory_ram, ix_mac_inventory_stockage_type,
+--     ix_ecran_marque, ix_ecran_modele, ix_ecran_annee_achat, ix_ecran_localisation, ix_ecran_statut, ix_ecran_prix,
+--     ix_equipements_marque, ix_equipements_modele, ix_equipements_annee_achat,
+--     ix_equipements_localisation, ix_equipements_statut, ix_equipements_prix;
@@ -0,0 +1,9 @@
+-- user-039 : identifiant de lot des modifications en masse dans l'historique (PostgreSQL)
+-- MySQL : retirer IF NOT EXISTS
+
+ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS batch_id VARCHAR(36);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_batch_id ON audit_logs (batch_id);
+
+-- Retour arrière :
+-- DROP INDEX ix_audit_logs_batch_id;
+-- ALTER TABLE audit_logs DROP COLUMN batch_id;
@@ -0,0 +1,18 @@
+-- user-040 : suivi des annulations de modifications en masse (PostgreSQL)
+
+CREATE TABLE IF NOT EXISTS bulk_reverts (
+    batch_id VARCHAR(36) PRIMARY KEY,
+    revert_batch_id VARCHAR(36) NOT NULL,
+    statut VARCHAR(20) NOT NULL DEFAULT 'En cours',
+    last_audit_id INTEGER NOT NULL DEFAULT 0,
+    reverted INTEGER NOT NULL DEFAULT 0,
+    conflicts INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    user_id INTEGER NOT NULL,
+    error TEXT,
+    date_creation TIMESTAMP WITHOUT TIME ZONE,
+    date_fin TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- Retour arrière :
+-- DROP TABLE bulk_reverts;
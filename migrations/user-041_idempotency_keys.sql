@@ -0,0 +1,20 @@
+-- user-041 : réponses mémorisées des requêtes d'écriture portant un Idempotency-Key (PostgreSQL)
+-- MySQL : BYTEA -> LONGBLOB, key -> `key`, retirer IF NOT EXISTS du CREATE INDEX
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(255) PRIMARY KEY,
+    request_hash VARCHAR(64) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    path VARCHAR(255) NOT NULL,
+    status_code INTEGER,
+    owner VARCHAR(36),
+    expires_at TIMESTAMP WITHOUT TIME ZONE,
+    content_type VARCHAR(100),
+    response_headers JSON,
+    response_body BYTEA,
+    date_creation TIMESTAMP WITHOUT TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_date_creation ON idempotency_keys (date_creation);
+
+-- Retour arrière :
+-- DROP TABLE idempotency_keys;
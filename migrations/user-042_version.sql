@@ -0,0 +1,15 @@
+-- user-042 : compteur de version pour le verrouillage optimiste (PostgreSQL)
+-- MySQL : retirer IF NOT EXISTS
+
+ALTER TABLE mac_inventory ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE ecran ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE equipements ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE details_equipement ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+-- Retour arrière :
+-- ALTER TABLE mac_inventory DROP COLUMN version;
+-- ALTER TABLE ecran DROP COLUMN version;
+-- ALTER TABLE equipements DROP COLUMN version;
+-- ALTER TABLE categories DROP COLUMN version;
+-- ALTER TABLE details_equipement DROP COLUMN version;
@@ -0,0 +1,30 @@
+-- user-044 : tâches d'arrière-plan, et tâche chargée de chaque annulation (PostgreSQL)
+-- Après migrations/user-040_bulk_reverts.sql. MySQL : retirer IF NOT EXISTS
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    type VARCHAR(50) NOT NULL,
+    statut VARCHAR(20) NOT NULL,
+    params JSON,
+    progression INTEGER NOT NULL DEFAULT 0,
+    message VARCHAR(255),
+    annulation_demandee BOOLEAN NOT NULL DEFAULT FALSE,
+    result JSON,
+    result_path VARCHAR(500),
+    result_content_type VARCHAR(100),
+    error TEXT,
+    owner VARCHAR(100),
+    heartbeat TIMESTAMP WITHOUT TIME ZONE,
+    date_creation TIMESTAMP WITHOUT TIME ZONE,
+    date_debut TIMESTAMP WITHOUT TIME ZONE,
+    date_fin TIMESTAMP WITHOUT TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_type ON jobs (type);
+CREATE INDEX IF NOT EXISTS ix_jobs_statut ON jobs (statut);
+CREATE INDEX IF NOT EXISTS ix_jobs_date_creation ON jobs (date_creation);
+
+ALTER TABLE bulk_reverts ADD COLUMN IF NOT EXISTS job_id VARCHAR(36);
+
+-- Retour arrière :
+-- ALTER TABLE bulk_reverts DROP COLUMN job_id;
+-- DROP TABLE jobs;
@@ -0,0 +1,12 @@
+-- user-047 : index composites de l'historique, chacun terminé par (timestamp, id)
+-- pour la pagination par curseur (PostgreSQL). MySQL : retirer IF NOT EXISTS
+
+CREATE INDEX IF NOT EXISTS ix_audit_logs_timestamp_id ON audit_logs (timestamp, id);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_table_timestamp ON audit_logs (table_name, timestamp, id);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_record ON audit_logs (table_name, record_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_user_timestamp ON audit_logs (user_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_action_timestamp ON audit_logs (action, timestamp, id);
+
+-- Retour arrière :
+-- DROP INDEX ix_audit_logs_timestamp_id, ix_audit_logs_table_timestamp, ix_audit_logs_record,
+--     ix_audit_logs_user_timestamp, ix_audit_logs_action_timestamp;
@@ -0,0 +1,9 @@
+-- user-048 : table des utilisateurs référencée par audit_logs.user_id, lue par
+-- l'annuaire des utilisateurs ; elle existe en général déjà (PostgreSQL)
+-- MySQL : SERIAL -> INTEGER AUTO_INCREMENT
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100),
+    email VARCHAR(255) UNIQUE
+);
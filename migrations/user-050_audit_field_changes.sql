@@ -0,0 +1,20 @@
+-- user-050 : index des champs modifiés par entrée d'historique (PostgreSQL)
+-- MySQL : SERIAL -> INTEGER AUTO_INCREMENT, "old"/"new" -> `old`/`new`, retirer IF NOT EXISTS
+
+CREATE TABLE IF NOT EXISTS audit_field_changes (
+    id SERIAL PRIMARY KEY,
+    audit_log_id INTEGER NOT NULL,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INTEGER NOT NULL,
+    field VARCHAR(100) NOT NULL,
+    "old" VARCHAR(255),
+    "new" VARCHAR(255),
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    user_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_audit_field_changes_audit_log_id ON audit_field_changes (audit_log_id);
+CREATE INDEX IF NOT EXISTS ix_audit_field_changes_field_timestamp ON audit_field_changes (field, timestamp, id);
+CREATE INDEX IF NOT EXISTS ix_audit_field_changes_field_new ON audit_field_changes (field, "new", timestamp, id);
+
+-- Retour arrière :
+-- DROP TABLE audit_field_changes;
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Date, Float, Text, Numeric, ForeignKey, DateTime
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, String, Date, Float, Text, Numeric, ForeignKey, DateTime, Boolean, UniqueConstraint, Index, LargeBinary, JSON
+from sqlalchemy.orm import relationship, declarative_base, declared_attr
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import date, datetime
 from decimal import Decimal
 from enum import Enum as PyEnum
@@ -25,28 +25,37 @@ class InventoryBase(Base):
     __abstract__ = True
     
     numero_serie = Column(String(50), unique=True, nullable=False)
-    marque = Column(String(100))
-    modele = Column(String(100))
+    marque = Column(String(100), index=True)
+    modele = Column(String(100), index=True)
     date_creation = Column(DateTime, default=datetime.utcnow)
     date_modification = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    annee_achat = Column(Date)
-    localisation = Column(String(100))
-    statut = Column(String(50))
-    prix = Column(Numeric(10, 2))
+    annee_achat = Column(Date, index=True)
+    localisation = Column(String(100), index=True)
+    statut = Column(String(50), index=True)
+    prix = Column(Numeric(10, 2), index=True)
     fournisseur = Column(String(100))
-    garantie_expire = Column(Date)
+    garantie_expire = Column(Date, index=True)
     commentaires = Column(Text)
+    # Compteur de version : chaque UPDATE ORM vérifie et incrémente la version lue
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.__table__.c.version}
 
 # Modèle SQLAlchemy pour Mac
 class MacItemDB(InventoryBase):
     __tablename__ = "mac_inventory"
+    __table_args__ = (
+        Index("ix_mac_inventory_modification", "date_modification", "id_mac"),
+    )
 
     id_mac = Column(Integer, primary_key=True, autoincrement=True)
     type_mac = Column(String(50))
     processeur = Column(String(100))
-    ram = Column(Integer)
+    ram = Column(Integer, index=True)
     stockage = Column(Integer)
-    stockage_type = Column(String(50))
+    stockage_type = Column(String(50), index=True)
     ecran_taille = Column(Float)
     resolution_ecran = Column(String(50))
     numero_serie_apple = Column(String(50))
@@ -55,6 +64,9 @@ class MacItemDB(InventoryBase):
 # Modèle SQLAlchemy pour Écran
 class EcranItemDB(InventoryBase):
     __tablename__ = "ecran"
+    __table_args__ = (
+        Index("ix_ecran_modification", "date_modification", "id_ecran"),
+    )
 
     id_ecran = Column(Integer, primary_key=True, index=True)
     type_ecran = Column(String(50))
@@ -75,12 +87,18 @@ class CategorieDB(Base):
     nom_categorie = Column(String(100), unique=True, nullable=False)
     description = Column(Text)
     date_creation = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     equipements = relationship("EquipementDB", back_populates="categorie")
 
+    __mapper_args__ = {"version_id_col": version}
+
 # Modèle SQLAlchemy pour Équipement
 class EquipementDB(InventoryBase):
     __tablename__ = "equipements"
+    __table_args__ = (
+        Index("ix_equipements_modification", "date_modification", "id_equipement"),
+    )
 
     id_equipement = Column(Integer, primary_key=True, autoincrement=True)
     id_categorie = Column(Integer, ForeignKey('categories.id_categorie'))
@@ -101,9 +119,150 @@ class DetailEquipementDB(Base):
     couleur = Column(String(50))
     compatibilite = Column(String(200))
     caracteristiques_specifiques = Column(Text)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     equipement = relationship("EquipementDB", back_populates="details")
 
+    __mapper_args__ = {"version_id_col": version}
+
+# Tables d'inventaire partageant InventoryBase, indexées par nom de table
+INVENTORY_MODELS = {
+    "mac_inventory": MacItemDB,
+    "ecran": EcranItemDB,
+    "equipements": EquipementDB,
+}
+
+# Colonnes communes à toutes les tables d'inventaire
+INVENTORY_COMMON_FIELDS = (
+    "numero_serie", "marque", "modele", "annee_achat", "localisation", "statut",
+    "prix", "fournisseur", "garantie_expire", "commentaires",
+)
+
+# Table matérialisée des garanties arrivant à expiration
+class WarrantyExpiringDB(Base):
+    __tablename__ = "garanties_expirant"
+    __table_args__ = (
+        UniqueConstraint("table_name", "record_id", name="uq_garanties_expirant_record"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    numero_serie = Column(String(50), nullable=False)
+    marque = Column(String(100))
+    modele = Column(String(100))
+    localisation = Column(String(100))
+    statut = Column(String(50))
+    garantie_expire = Column(Date, nullable=False, index=True)
+    notifie = Column(Boolean, default=False, nullable=False)
+    date_notification = Column(DateTime)
+    date_scan = Column(DateTime, default=datetime.utcnow)
+
+# Campagne d'inventaire physique
+class InventoryCampaignDB(Base):
+    __tablename__ = "campagnes_inventaire"
+
+    id_campagne = Column(Integer, primary_key=True, autoincrement=True)
+    nom = Column(String(100), nullable=False)
+    statut = Column(String(20), nullable=False, default="Ouverte")
+    date_ouverture = Column(DateTime, default=datetime.utcnow)
+    date_cloture = Column(DateTime)
+
+# Numéros de série scannés pendant une campagne
+class CampaignScanDB(Base):
+    __tablename__ = "campagne_scans"
+    __table_args__ = (
+        # Un numéro peut être scanné plusieurs fois : le dernier scan fait foi
+        Index("ix_campagne_scans_campagne_serie", "id_campagne", "numero_serie", "id_scan"),
+        Index("ix_campagne_scans_campagne_localisation", "id_campagne", "localisation"),
+        Index("ix_campagne_scans_en_attente", "id_campagne", "applique"),
+    )
+
+    id_scan = Column(Integer, primary_key=True, autoincrement=True)
+    id_campagne = Column(Integer, ForeignKey('campagnes_inventaire.id_campagne'), nullable=False)
+    numero_serie = Column(String(50), nullable=False)
+    localisation = Column(String(100), nullable=False)
+    # Table et localisation connues en base à l'application du scan (None si inconnu)
+    table_name = Column(String(50))
+    localisation_attendue = Column(String(100))
+    date_scan = Column(DateTime, default=datetime.utcnow)
+    # Scan enregistré mais pas encore appliqué à l'inventaire
+    applique = Column(Boolean, nullable=False, default=True)
+    user_id = Column(Integer)
+
+# Compteurs de progression par localisation
+class CampaignProgressDB(Base):
+    __tablename__ = "campagne_progression"
+    __table_args__ = (
+        UniqueConstraint("id_campagne", "localisation", name="uq_campagne_progression_localisation"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_campagne = Column(Integer, ForeignKey('campagnes_inventaire.id_campagne'), nullable=False)
+    localisation = Column(String(100), nullable=False)
+    scannes = Column(Integer, nullable=False, default=0)
+    trouves = Column(Integer, nullable=False, default=0)
+    inconnus = Column(Integer, nullable=False, default=0)
+
+# Suivi de l'annulation d'une opération groupée (reprise possible après incident)
+class BulkRevertDB(Base):
+    __tablename__ = "bulk_reverts"
+
+    batch_id = Column(String(36), primary_key=True)
+    revert_batch_id = Column(String(36), nullable=False)
+    statut = Column(String(20), nullable=False, default="En cours")
+    last_audit_id = Column(Integer, nullable=False, default=0)
+    reverted = Column(Integer, nullable=False, default=0)
+    conflicts = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    # Utilisateur ayant demandé l'annulation, enregistré dans l'historique
+    user_id = Column(Integer, nullable=False)
+    # Tâche chargée de l'annulation : une seule à la fois
+    job_id = Column(String(36))
+    error = Column(Text)
+    date_creation = Column(DateTime, default=datetime.utcnow)
+    date_fin = Column(DateTime)
+
+# Réponses mémorisées des requêtes d'écriture portant un Idempotency-Key
+class IdempotencyKeyDB(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    method = Column(String(10), nullable=False)
+    path = Column(String(255), nullable=False)
+    # status_code vide : requête en cours d'exécution, par owner jusqu'à expires_at ;
+    # passé ce délai sans prolongation, une nouvelle tentative reprend la clé
+    status_code = Column(Integer)
+    owner = Column(String(36))
+    expires_at = Column(DateTime)
+    content_type = Column(String(100))
+    response_headers = Column(JSON)
+    response_body = Column(LargeBinary)
+    date_creation = Column(DateTime, default=datetime.utcnow, index=True)
+
+# Tâches de fond (exports, rapports, archivage)
+class JobDB(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String(36), primary_key=True)
+    type = Column(String(50), nullable=False, index=True)
+    statut = Column(String(20), nullable=False, index=True)
+    params = Column(JSON)
+    progression = Column(Integer, default=0, nullable=False)
+    message = Column(String(255))
+    annulation_demandee = Column(Boolean, default=False, nullable=False)
+    result = Column(JSON)
+    result_path = Column(String(500))
+    result_content_type = Column(String(100))
+    error = Column(Text)
+    # Worker qui exécute la tâche et dernier renouvellement de son bail
+    owner = Column(String(100))
+    heartbeat = Column(DateTime)
+    date_creation = Column(DateTime, default=datetime.utcnow, index=True)
+    date_debut = Column(DateTime)
+    date_fin = Column(DateTime)
+
 # Modèles Pydantic de base
 class InventoryBaseSchema(BaseModel):
     numero_serie: str = Field(..., max_length=50)
@@ -130,6 +289,7 @@ class MacItemCreate(InventoryBaseSchema):
 
 class MacItem(MacItemCreate):
     id_mac: int
+    version: int
 
 # Modèles Pydantic pour Écran
 class EcranItemCreate(InventoryBaseSchema):
@@ -141,6 +301,7 @@ class EcranItemCreate(InventoryBaseSchema):
 
 class EcranItem(EcranItemCreate):
     id_ecran: int
+    version: int
 
 # Modèles Pydantic pour Catégorie
 class CategorieCreate(BaseModel):
@@ -150,6 +311,7 @@ class CategorieCreate(BaseModel):
 class Categorie(CategorieCreate):
     id_categorie: int
     date_creation: datetime
+    version: int
 
 # Modèles Pydantic pour Équipement
 class EquipementCreate(InventoryBaseSchema):
@@ -166,8 +328,107 @@ class DetailEquipementCreate(BaseModel):
 
 class Equipement(EquipementCreate):
     id_equipement: int
+    version: int
+    categorie: Optional[Categorie] = None
     details: Optional[DetailEquipementCreate] = None
 
+# Modèle Pydantic pour la recherche tous types confondus
+class AssetItem(InventoryBaseSchema):
+    table_name: str
+    record_id: int
+    statut: Optional[str] = None
+
+# Modèles Pydantic pour les garanties
+class WarrantyExpiring(BaseModel):
+    table_name: str
+    record_id: int
+    numero_serie: str
+    marque: Optional[str] = None
+    modele: Optional[str] = None
+    localisation: Optional[str] = None
+    statut: Optional[str] = None
+    garantie_expire: date
+
+    class Config:
+        from_attributes = True
+
+class WarrantyExpiringReport(WarrantyExpiring):
+    id: int
+    notifie: bool
+    date_notification: Optional[datetime] = None
+    date_scan: datetime
+
+# Identifiants par requête de lecture groupée
+MAX_BATCH_IDS = 5000
+
+# Requête de lecture groupée par identifiants
+class BatchGetRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+# Résultat d'une recherche avec ?facets= : les articles et les comptes par valeur
+class FacetedSearchResult(BaseModel):
+    items: List[Dict[str, Any]]
+    facets: Dict[str, Dict[str, int]]
+
+# Modification groupée d'articles, sélectionnés par ids et/ou filtres
+class BulkUpdateRequest(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=50000)
+    filters: Optional[List[str]] = None
+    changes: Dict[str, Any]
+
+class BulkRevert(BaseModel):
+    batch_id: str
+    revert_batch_id: str
+    statut: str
+    last_audit_id: int
+    reverted: int
+    conflicts: int
+    skipped: int
+    user_id: Optional[int] = None
+    error: Optional[str] = None
+    date_creation: datetime
+    date_fin: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Modèles Pydantic pour les campagnes d'inventaire
+class CampaignCreate(BaseModel):
+    nom: str = Field(..., max_length=100)
+
+class Campaign(CampaignCreate):
+    id_campagne: int
+    statut: str
+    date_ouverture: datetime
+    date_cloture: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ScanBatch(BaseModel):
+    localisation: str = Field(..., max_length=100)
+    numeros_serie: List[str] = Field(..., min_length=1, max_length=10000)
+
+# Modèles Pydantic pour les tâches de fond
+class JobCreate(BaseModel):
+    type: str = Field(..., max_length=50)
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+class Job(JobCreate):
+    id: str
+    statut: str
+    progression: int
+    message: Optional[str] = None
+    annulation_demandee: bool
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    date_creation: datetime
+    date_debut: Optional[datetime] = None
+    date_fin: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # Fonction pour créer toutes les tables
 def create_tables(engine):
     Base.metadata.create_all(bind=engine)
\ No newline at end of file
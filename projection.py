@@ -0,0 +1,26 @@
+from fastapi import HTTPException
+from typing import List, Optional, Type
+from pydantic import BaseModel
+
+from .fast_json import schema_columns
+
+
+def parse_fields(model, schema: Type[BaseModel], fields: Optional[str]) -> Optional[List]:
+    """
+    Traduit ?fields=a,b,c en colonnes de la table, validées contre le schéma de réponse.
+    La clé primaire est toujours renvoyée en premier. None si aucun champ n'est demandé.
+    """
+    if not fields:
+        return None
+
+    requested = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    allowed = {column.name: column for column in schema_columns(model, schema)}
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+
+    pk = model.__mapper__.primary_key[0]
+    return [pk] + [allowed[name] for name in requested if name != pk.name]
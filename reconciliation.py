@@ -0,0 +1,151 @@
+from fastapi import HTTPException
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import select, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from collections import defaultdict
+import csv
+import logging
+
+from .models import INVENTORY_MODELS, CampaignScanDB, Status
+from .inventory_campaign import CampaignOperations
+from .jobs import register_job, JobContext
+from .filter_dsl import estimate_rows
+
+logger = logging.getLogger(__name__)
+
+MISSING = "manquant"
+UNEXPECTED = "inattendu"
+MISPLACED = "mal_place"
+
+REPORT_COLUMNS = ["localisation", "ecart", "numero_serie", "table_name", "localisation_attendue"]
+STREAM_BATCH_SIZE = 10000
+
+
+class ReconciliationEngine:
+    """
+    Compare les numéros scannés d'une campagne à la base, par localisation :
+    - manquant : attendu en base à une localisation mais jamais scanné
+    - inattendu : scanné mais absent de l'inventaire actif
+    - mal_place : scanné à une autre localisation que celle connue en base
+
+    Les scans sont chargés dans un dictionnaire (différence d'ensembles par hachage),
+    puis les tables d'inventaire sont parcourues en flux sous forme de tuples,
+    sans hydrater d'objets ORM. Le hachage évite de dépendre de la collation
+    de la base, qu'un tri-fusion devrait reproduire exactement côté Python.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _load_scans(self, campaign_id: int) -> Dict[str, List]:
+        """numero_serie -> [localisation scannée, table, localisation attendue, trouvé]"""
+        scanned = {}
+        rows = self.db.execute(
+            select(
+                CampaignScanDB.numero_serie,
+                CampaignScanDB.localisation,
+                CampaignScanDB.table_name,
+                CampaignScanDB.localisation_attendue,
+            ).where(CampaignScanDB.id_campagne == campaign_id)
+            .order_by(CampaignScanDB.id_scan)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        for numero_serie, localisation, table_name, expected in rows:
+            entry = scanned.get(numero_serie)
+            if entry is None:
+                scanned[numero_serie] = [localisation, table_name, expected, False]
+            else:
+                # Scan répété : la localisation attendue reste celle d'avant la campagne
+                entry[0] = localisation
+        return scanned
+
+    def _stream_inventory(self, on_rows: Optional[Callable[[int], None]] = None) -> Iterator[Tuple[str, str, str]]:
+        """
+        (table, numero_serie, localisation) des articles actifs, en flux ;
+        on_rows reçoit le nombre de lignes lues toutes les STREAM_BATCH_SIZE lignes
+        """
+        read = 0
+        for table_name, model in INVENTORY_MODELS.items():
+            rows = self.db.execute(
+                select(model.numero_serie, model.localisation)
+                .where(or_(model.statut.is_(None), model.statut != Status.VENDU.value))
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            for numero_serie, localisation in rows:
+                yield table_name, numero_serie, localisation
+                read += 1
+                if on_rows and read % STREAM_BATCH_SIZE == 0:
+                    on_rows(read)
+
+    def iter_entries(self,
+                     campaign_id: int,
+                     on_rows: Optional[Callable[[int], None]] = None) -> Iterator[Tuple[str, str, str, str, str]]:
+        """Produit les écarts sous la forme (localisation, ecart, numero_serie, table, attendue)"""
+        try:
+            scanned = self._load_scans(campaign_id)
+
+            for table_name, numero_serie, localisation in self._stream_inventory(on_rows):
+                entry = scanned.get(numero_serie)
+                if entry is None:
+                    yield localisation, MISSING, numero_serie, table_name, localisation
+                else:
+                    entry[3] = True
+
+            for numero_serie, (localisation, table_name, expected, found) in scanned.items():
+                if not found:
+                    yield localisation, UNEXPECTED, numero_serie, table_name, expected
+                elif expected is not None and expected != localisation:
+                    yield localisation, MISPLACED, numero_serie, table_name, expected
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def summary(self, campaign_id: int) -> Dict:
+        counts = defaultdict(lambda: {MISSING: 0, UNEXPECTED: 0, MISPLACED: 0})
+        for localisation, ecart, *_ in self.iter_entries(campaign_id):
+            counts[localisation][ecart] += 1
+        return {
+            "id_campagne": campaign_id,
+            "localisations": dict(sorted(counts.items(), key=lambda item: item[0] or "")),
+        }
+
+    def write_csv(self, campaign_id: int, output, on_rows: Optional[Callable[[int], None]] = None) -> int:
+        """Écrit le rapport ; on_rows suit le parcours de l'inventaire (voir _stream_inventory)"""
+        writer = csv.writer(output)
+        writer.writerow(REPORT_COLUMNS)
+        count = 0
+        for entry in self.iter_entries(campaign_id, on_rows):
+            writer.writerow(entry)
+            count += 1
+        logger.info(f"Reconciliation report for campaign {campaign_id}: {count} discrepancies")
+        return count
+
+
+@register_job("reconciliation")
+def run_reconciliation_job(context: JobContext) -> Dict:
+    """
+    Rapport CSV complet des écarts d'une campagne, écrit dans le fichier résultat
+    de la tâche. La progression suit le parcours de l'inventaire, rapporté à
+    l'estimation du nombre de lignes des tables.
+    """
+    campaign_id = context.params.get("campaign_id")
+    if not isinstance(campaign_id, int):
+        raise HTTPException(status_code=400, detail="campaign_id is required")
+
+    ops = CampaignOperations(context.db)
+    ops.get_campaign(campaign_id)
+    ops.flush(campaign_id)
+
+    total = sum(estimate_rows(context.db, model) for model in INVENTORY_MODELS.values())
+
+    def on_rows(read: int):
+        # Estimation éventuellement dépassée : 100 % n'est posé qu'à la fin
+        percent = min(read * 100 // total, 99) if total else 0
+        context.progress(percent, f"{read} inventory rows compared")
+
+    path = context.result_file(f"reconciliation_{campaign_id}.csv", "text/csv")
+    with open(path, "w", newline="") as output:
+        count = ReconciliationEngine(context.db).write_csv(campaign_id, output, on_rows)
+    return {"id_campagne": campaign_id, "ecarts": count}
@@ -0,0 +1,298 @@
+from fastapi import HTTPException
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from collections import defaultdict
+from datetime import datetime
+import json
+import logging
+import uuid
+
+from .database import get_job_session
+from .models import INVENTORY_MODELS, BulkRevertDB, JobDB
+from .filter_dsl import coerce_json_value
+from .jobs import (
+    register_job, job_runner, JobContext, JobCancelled, JobInterrupted, JobOperations, JOB_PENDING, JOB_RUNNING
+)
+from audit_manager import AuditManager, AuditLog, ActionType
+
+logger = logging.getLogger(__name__)
+
+REVERT_RUNNING = "En cours"
+REVERT_DONE = "Terminé"
+REVERT_FAILED = "Échec"
+REVERT_CHUNK_SIZE = 1000
+
+
+def _matches(model, values: Dict) -> list:
+    """Conditions vérifiant que les colonnes ont encore les valeurs données"""
+    conditions = []
+    for field, value in values.items():
+        column = getattr(model, field)
+        restored = coerce_json_value(model.__table__.columns[field], value)
+        conditions.append(column.is_(None) if restored is None else column == restored)
+    return conditions
+
+
+def _still_matches(model, row, values: Dict) -> bool:
+    """Vérifie, sur une ligne chargée, que les colonnes ont encore les valeurs données"""
+    columns = model.__table__.columns
+    return all(
+        getattr(row, field) == coerce_json_value(columns[field], value)
+        for field, value in values.items()
+        if field in columns
+    )
+
+
+class RevertOperations:
+    def __init__(self, db: Session):
+        self.db = db
+        self.audit_manager = AuditManager(db)
+
+    def get_revert(self, batch_id: str) -> "BulkRevertDB":
+        try:
+            revert = self.db.query(BulkRevertDB).filter(BulkRevertDB.batch_id == batch_id).first()
+            if not revert:
+                raise HTTPException(status_code=404, detail="No revert found for this batch")
+            return revert
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def start_revert(self, batch_id: str, user_id: int) -> "BulkRevertDB":
+        """
+        Crée le suivi d'annulation, ou relance une annulation échouée, avec sa tâche
+        de fond. La tâche est rattachée au suivi dans la même transaction.
+        """
+        try:
+            revert = self.db.query(BulkRevertDB).filter(BulkRevertDB.batch_id == batch_id).first()
+            if revert is None:
+                exists = self.db.query(AuditLog.id).filter(AuditLog.batch_id == batch_id).first()
+                if not exists:
+                    raise HTTPException(status_code=404, detail="Batch not found in audit log")
+                revert = BulkRevertDB(
+                    batch_id=batch_id, revert_batch_id=str(uuid.uuid4()), statut=REVERT_RUNNING, user_id=user_id
+                )
+                self.db.add(revert)
+            elif revert.statut == REVERT_DONE:
+                raise HTTPException(status_code=409, detail="Batch already reverted")
+            elif revert.statut == REVERT_RUNNING:
+                raise HTTPException(status_code=409, detail="Revert already in progress")
+            else:
+                revert.statut = REVERT_RUNNING
+                revert.error = None
+                revert.user_id = user_id
+
+            revert.job_id = JobOperations(self.db).prepare_job("revert", {"batch_id": batch_id}).id
+            self.db.commit()
+            self.db.refresh(revert)
+
+        except IntegrityError:
+            # Même annulation demandée en même temps par une autre requête
+            self.db.rollback()
+            raise HTTPException(status_code=409, detail="Revert already in progress")
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+        job_runner.submit(revert.job_id)
+        return revert
+
+    def run(self, batch_id: str, checkpoint: Optional[Callable[[], None]] = None):
+        """
+        Annule l'opération par lots d'entrées d'historique. Chaque lot est appliqué
+        avec des requêtes ensemblistes et la progression (last_audit_id) est validée
+        dans la même transaction : après un incident, la reprise repart du lot suivant.
+        checkpoint est appelé après chaque lot validé (annulation de la tâche).
+        """
+        revert = self.get_revert(batch_id)
+        try:
+            while revert.statut == REVERT_RUNNING:
+                entries = self.db.query(AuditLog).filter(
+                    AuditLog.batch_id == batch_id,
+                    AuditLog.id > revert.last_audit_id,
+                ).order_by(AuditLog.id).limit(REVERT_CHUNK_SIZE).all()
+
+                if not entries:
+                    revert.statut = REVERT_DONE
+                    revert.date_fin = datetime.utcnow()
+                else:
+                    self._revert_chunk(revert, entries)
+                    revert.last_audit_id = entries[-1].id
+                self.db.commit()
+                if checkpoint and revert.statut == REVERT_RUNNING:
+                    checkpoint()
+
+            logger.info(
+                f"Reverted batch {batch_id}: {revert.reverted} rows, "
+                f"{revert.conflicts} conflicts, {revert.skipped} skipped"
+            )
+
+        except (JobCancelled, JobInterrupted):
+            raise
+        except Exception as e:
+            # Toute erreur termine l'annulation en échec : elle ne doit pas rester "En cours"
+            self.db.rollback()
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Revert of batch {batch_id} failed: {detail}")
+            revert.statut = REVERT_FAILED
+            revert.error = str(detail)
+            self.db.commit()
+
+    def _revert_chunk(self, revert: BulkRevertDB, entries: List[AuditLog]):
+        # Les entrées partageant table, anciennes et nouvelles valeurs sont annulées ensemble
+        updates = defaultdict(list)
+        creations = defaultdict(list)
+        for entry in entries:
+            if entry.table_name not in INVENTORY_MODELS:
+                revert.skipped += 1
+            elif entry.action == ActionType.UPDATE and entry.old_values:
+                key = (
+                    entry.table_name,
+                    json.dumps(entry.old_values, sort_keys=True),
+                    json.dumps(entry.new_values or {}, sort_keys=True),
+                )
+                updates[key].append(entry.record_id)
+            elif entry.action == ActionType.CREATE and entry.new_values:
+                creations[entry.table_name].append((entry.record_id, entry.new_values))
+            else:
+                # Les suppressions ne sont pas recréées ; une création sans état enregistré
+                # ne peut pas être comparée à la ligne actuelle
+                revert.skipped += 1
+
+        audit_changes = defaultdict(list)
+        for (table_name, old_json, new_json), record_ids in updates.items():
+            model = INVENTORY_MODELS[table_name]
+            pk = model.__mapper__.primary_key[0]
+            old_values, new_values = json.loads(old_json), json.loads(new_json)
+
+            # Seules les lignes encore dans l'état produit par l'opération sont restaurées
+            current = self.db.execute(
+                select(pk).where(pk.in_(record_ids), *_matches(model, new_values)).with_for_update()
+            ).scalars().all()
+            if current:
+                restored = {
+                    field: coerce_json_value(model.__table__.columns[field], value)
+                    for field, value in old_values.items()
+                }
+                self.db.execute(
+                    update(model).where(pk.in_(current)).values(**restored, version=model.version + 1)
+                )
+                audit_changes[table_name].extend((record_id, new_values, old_values) for record_id in current)
+            revert.reverted += len(current)
+            revert.conflicts += len(record_ids) - len(current)
+
+        for table_name, created in creations.items():
+            model = INVENTORY_MODELS[table_name]
+            pk = model.__mapper__.primary_key[0]
+            rows = {
+                getattr(row, pk.key): row
+                for row in self.db.execute(
+                    select(model).where(pk.in_([record_id for record_id, _ in created])).with_for_update()
+                ).scalars()
+            }
+            # Seules les lignes encore dans l'état de leur création sont supprimées
+            deleted = []
+            for record_id, new_values in created:
+                row = rows.get(record_id)
+                if row is not None and _still_matches(model, row, new_values):
+                    deleted.append((record_id, self.audit_manager._serialize_model(row), None))
+            if deleted:
+                self.db.execute(delete(model).where(pk.in_([record_id for record_id, _, _ in deleted])))
+                self.audit_manager.log_changes_bulk(
+                    table_name=table_name,
+                    action=ActionType.DELETE,
+                    changes=deleted,
+                    batch_id=revert.revert_batch_id,
+                    user_id=revert.user_id,
+                    commit=False,
+                )
+            revert.reverted += len(deleted)
+            revert.conflicts += len(created) - len(deleted)
+
+        for table_name, changes in audit_changes.items():
+            self.audit_manager.log_changes_bulk(
+                table_name=table_name,
+                action=ActionType.UPDATE,
+                changes=changes,
+                batch_id=revert.revert_batch_id,
+                user_id=revert.user_id,
+                commit=False,
+            )
+
+
+@register_job("revert")
+def run_revert_job(context: JobContext) -> Dict:
+    """Tâche de fond d'annulation d'un batch_id, avec la session du pool des tâches"""
+    batch_id = context.params.get("batch_id")
+    if not batch_id:
+        raise HTTPException(status_code=400, detail="batch_id is required")
+
+    ops = RevertOperations(context.db)
+    current_job = ops.get_revert(batch_id).job_id
+    if current_job is not None and current_job != context.job_id:
+        raise RuntimeError(f"Revert of batch {batch_id} is handled by job {current_job}")
+    try:
+        ops.run(batch_id, checkpoint=context.check_cancelled)
+    except JobCancelled:
+        # Les lots déjà validés restent annulés ; relancer l'annulation reprend la suite
+        context.db.rollback()
+        revert = ops.get_revert(batch_id)
+        revert.statut = REVERT_FAILED
+        revert.error = "Cancelled"
+        context.db.commit()
+        raise
+
+    revert = ops.get_revert(batch_id)
+    if revert.statut == REVERT_FAILED:
+        raise RuntimeError(revert.error)
+    return {
+        "batch_id": batch_id,
+        "revert_batch_id": revert.revert_batch_id,
+        "reverted": revert.reverted,
+        "conflicts": revert.conflicts,
+        "skipped": revert.skipped,
+    }
+
+
+def resume_pending_reverts():
+    """
+    Au démarrage (après job_runner.start()), crée une tâche pour les annulations
+    restées en cours dont la tâche est terminée ou absente. Les tâches encore en
+    attente ou en cours sont reprises par le job_runner (bail expiré).
+    Le rattachement de la nouvelle tâche est un UPDATE conditionnel sur l'ancienne :
+    si plusieurs workers démarrent ensemble, un seul crée la tâche.
+    """
+    db = get_job_session()
+    try:
+        running = db.query(BulkRevertDB.batch_id, BulkRevertDB.job_id).filter(
+            BulkRevertDB.statut == REVERT_RUNNING
+        ).all()
+        for batch_id, job_id in running:
+            if job_id is not None and db.query(JobDB.id).filter(
+                JobDB.id == job_id, JobDB.statut.in_([JOB_PENDING, JOB_RUNNING])
+            ).first():
+                continue
+
+            job = JobOperations(db).prepare_job("revert", {"batch_id": batch_id})
+            current = BulkRevertDB.job_id.is_(None) if job_id is None else BulkRevertDB.job_id == job_id
+            attached = db.execute(
+                update(BulkRevertDB).where(
+                    BulkRevertDB.batch_id == batch_id, BulkRevertDB.statut == REVERT_RUNNING, current
+                ).values(job_id=job.id)
+            ).rowcount
+            if not attached:
+                db.rollback()
+                continue
+            db.commit()
+            logger.info(f"Resuming revert of batch {batch_id}")
+            job_runner.submit(job.id)
+
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Could not resume pending reverts: {str(e)}")
+    finally:
+        db.close()
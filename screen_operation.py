@@ -1,14 +1,23 @@
 from fastapi import HTTPException
 from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List, Optional
 import logging
 from datetime import date
 
 from .database import get_db
 from .models import EcranItemsDB, EcranItems
-from audit_manager import audit_changes, AuditManager, AuditLog
+from audit_manager import audit_changes, AuditManager, AuditLog, ActionType
+from .serial_bloom import get_serial_filter
+from .fast_json import schema_columns
+from .filter_dsl import plan_query, filter_conditions, FilterPlan
+from .facets import compute_facets
+from .user_directory import user_directory
+from .history_operations import HistoryOperations
+from .concurrency import check_version, precondition_failed
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +27,7 @@ class ScreenOperations:
         self.audit_manager = AuditManager(db)
 
     @audit_changes(table_name="ecran")
-    async def create_or_update_ecran_item(self, screen_item_data: dict) -> "EcranItemsDB":
+    async def create_or_update_ecran_item(self, screen_item_data: dict, expected_version: Optional[int] = None) -> "EcranItemsDB":
         try:
             # Check required fields only for creation (when id_ecran is not present)
             if "id_ecran" not in screen_item_data:
@@ -39,6 +48,7 @@ class ScreenOperations:
                 ).first()
                 if not existing_item:
                     raise HTTPException(status_code=404, detail="Screen item not found")
+                check_version(existing_item, expected_version)
                 
                 # Update existing item
                 for key, value in screen_item_data.items():
@@ -49,9 +59,11 @@ class ScreenOperations:
             else:
                 # Check if serial number already exists
                 numero_serie = screen_item_data.get("numero_serie")
-                existing_item = self.db.query(EcranItemsDB).filter(
-                    EcranItemsDB.numero_serie == numero_serie
-                ).first()
+                existing_item = None
+                if get_serial_filter().might_contain(numero_serie):
+                    existing_item = self.db.query(EcranItemsDB).filter(
+                        EcranItemsDB.numero_serie == numero_serie
+                    ).first()
                 
                 if existing_item:
                     raise HTTPException(
@@ -65,9 +77,22 @@ class ScreenOperations:
                 logger.info(f"Created new screen item with serial number: {numero_serie}")
 
             self.db.commit()
+            get_serial_filter().add(item.numero_serie)
             self.db.refresh(item)
             return item
 
+        except StaleDataError:
+            # Modifié par une autre requête entre la lecture et l'UPDATE
+            self.db.rollback()
+            raise precondition_failed()
+        except IntegrityError as e:
+            # Numéro absent du filtre de Bloom mais déjà présent en base
+            self.db.rollback()
+            logger.error(f"Integrity error: {str(e)}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Screen with serial number {screen_item_data.get('numero_serie')} already exists"
+            )
         except SQLAlchemyError as e:
             self.db.rollback()
             logger.error(f"Database error: {str(e)}")
@@ -75,55 +100,49 @@ class ScreenOperations:
         pass
         
 
-    def get_ecran_item(self, item_id: int) -> Tuple["EcranItemsDB", List["AuditLog"]]:
+    def get_ecran_item(self, item_id: int) -> Tuple["EcranItemsDB", Dict]:
         try:
             item = self.db.query(EcranItemsDB).filter(EcranItemsDB.id_ecran == item_id).first()
             if not item:
                 logger.warning(f"Screen item not found with ID: {item_id}")
                 raise HTTPException(status_code=404, detail="Screen item not found")
             
-            # Récupération de l'historique
-            history = self.audit_manager.get_history(
-                table_name="ecran",
-                record_id=item_id
-            )
-            
-            # Formatage de l'historique pour l'affichage
-            formatted_history = []
-            for log in history:
-                formatted_log = {
-                    "date": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "user": self._get_user_info(log.user_id),
-                    "action": log.action.value,
-                    "changes": self._format_changes(log.old_values, log.new_values)
-                }
-                formatted_history.append(formatted_log)
-            
-            return item, formatted_history
+            # Première page de l'historique seulement, lue ici dans la session
+            # de la requête ; la suite est servie par /history avec next_cursor
+            history = HistoryOperations(self.db).record_history_page("ecran", item_id)
+
+            return item, history
 
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
         pass
 
+    def _get_user_info(self, user_id: int) -> Dict:
+        """Informations de l'utilisateur, depuis le cache commun au processus"""
+        return user_directory.get_user_info(self.db, user_id)
+
     def list_ecran_items(self, skip: int = 0, limit: int = 100) -> List["EcranItemsDB"]:
         try:
-            items = self.db.query(EcranItemsDB).offset(skip).limit(limit).all()
+            items = self.db.query(EcranItemsDB).order_by(EcranItemsDB.id_ecran).offset(skip).limit(limit).all()
             result = []
             
+            # Dernier changement de chaque article de la page, en une requête
+            created = [item.date_creation for item in items]
+            last_changes = self.audit_manager.get_last_changes(
+                "ecran",
+                [item.id_ecran for item in items],
+                created_since=min(created) if items and None not in created else None
+            )
+            user_directory.prefetch(self.db, {change.user_id for change in last_changes.values()})
+
             for item in items:
-                # Récupère uniquement le dernier changement pour la liste
-                last_change = self.audit_manager.get_history(
-                    table_name="ecran",
-                    record_id=item.id_ecran,
-                    limit=1
-                )
-                
                 item_dict = self._model_to_dict(item)
+                last_change = last_changes.get(item.id_ecran)
                 item_dict["last_modification"] = {
-                    "date": last_change[0].timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "user": self._get_user_info(last_change[0].user_id),
-                    "action": last_change[0].action.value
+                    "date": last_change.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                    "user": self._get_user_info(last_change.user_id),
+                    "action": last_change.action.value
                 } if last_change else None
                 
                 result.append(item_dict)
@@ -135,16 +154,19 @@ class ScreenOperations:
             raise HTTPException(status_code=500, detail="Database operation failed")
         pass
 
-    @audit_changes(table_name="ecran")
-    async def delete_ecran_item(self, item_id: int) -> bool:
+    def delete_ecran_item(self, item_id: int, user_id: int) -> bool:
         try:
             item = self.db.query(EcranItemsDB).filter(EcranItemsDB.id_ecran == item_id).first()
             if not item:
                 logger.warning(f"Screen item not found with ID: {item_id}")
                 raise HTTPException(status_code=404, detail="Screen item not found")
             
+            # La suppression et son entrée d'audit sont validées ensemble (lue par /sync)
+            old_values = self.audit_manager._serialize_model(item)
             self.db.delete(item)
-            self.db.commit()
+            self.audit_manager.log_change(
+                "ecran", item_id, ActionType.DELETE, old_values=old_values, user_id=user_id
+            )
             logger.info(f"Deleted screen item with ID: {item_id}")
             return True
 
@@ -157,23 +179,97 @@ class ScreenOperations:
     def search_ecran_items(self, 
                         numero_serie: Optional[str] = None,
                         modele: Optional[str] = None,
-                        statut: Optional[str] = None) -> List["EcranItemsDB"]:
+                        statut: Optional[str] = None,
+                        filters: Optional[List[str]] = None,
+                        sort: Optional[str] = None,
+                        skip: int = 0,
+                        limit: Optional[int] = None) -> List["EcranItemsDB"]:
+        plan = self._plan_search(numero_serie, modele, statut, filters, sort, skip, limit)
         try:
-            query = self.db.query(EcranItemsDB)
-            
-            if numero_serie:
-                query = query.filter(EcranItemsDB.numero_serie.ilike(f"%{numero_serie}%"))
-                logger.info(f"Searching for screen with serial number containing: {numero_serie}")
-            if modele:
-                query = query.filter(EcranItemsDB.modele.ilike(f"%{modele}%"))
-                logger.info(f"Filtering by model containing: {modele}")
-            if statut:
-                query = query.filter(EcranItemsDB.statut == statut)
-                logger.info(f"Filtering by status: {statut}")
-
-            return query.all()
+            return plan.apply(self.db.query(EcranItemsDB)).all()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+        pass
+
+    def _search_filters(self,
+                        numero_serie: Optional[str] = None,
+                        modele: Optional[str] = None,
+                        statut: Optional[str] = None) -> list:
+        filters = []
+        if numero_serie:
+            filters.append(EcranItemsDB.numero_serie.ilike(f"%{numero_serie}%"))
+            logger.info(f"Searching for screen with serial number containing: {numero_serie}")
+        if modele:
+            filters.append(EcranItemsDB.modele.ilike(f"%{modele}%"))
+            logger.info(f"Filtering by model containing: {modele}")
+        if statut:
+            filters.append(EcranItemsDB.statut == statut)
+            logger.info(f"Filtering by status: {statut}")
+        return filters
+
+    def _plan_search(self,
+                     numero_serie: Optional[str] = None,
+                     modele: Optional[str] = None,
+                     statut: Optional[str] = None,
+                     filters: Optional[List[str]] = None,
+                     sort: Optional[str] = None,
+                     skip: int = 0,
+                     limit: Optional[int] = None) -> FilterPlan:
+        # Seule l'égalité sur statut peut utiliser un index, pas les recherches %...%
+        return plan_query(
+            self.db, EcranItemsDB, filters, sort, skip, limit,
+            extra_conditions=self._search_filters(numero_serie, modele, statut),
+            extra_indexed=bool(statut),
+        )
+
+    def search_ecran_facets(self,
+                        facet_fields: List[str],
+                        numero_serie: Optional[str] = None,
+                        modele: Optional[str] = None,
+                        statut: Optional[str] = None,
+                        filters: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """Comptes par valeur des colonnes demandées, pour l'ensemble filtré (sans pagination)"""
+        conditions = filter_conditions(EcranItemsDB, filters, self._search_filters(numero_serie, modele, statut))
+        return compute_facets(self.db, EcranItemsDB, conditions, facet_fields)
+
+    def _fetch_rows(self, query) -> Tuple[List[str], List[tuple]]:
+        try:
+            result = self.db.execute(query)
+            return list(result.keys()), result.all()
 
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database operation failed")
-        pass
\ No newline at end of file
+
+    def search_ecran_rows(self,
+                        numero_serie: Optional[str] = None,
+                        modele: Optional[str] = None,
+                        statut: Optional[str] = None,
+                        columns: Optional[list] = None,
+                        filters: Optional[List[str]] = None,
+                        sort: Optional[str] = None,
+                        skip: int = 0,
+                        limit: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        """Variante de search_ecran_items renvoyant des tuples (colonnes de EcranItems), sans ORM"""
+        plan = self._plan_search(numero_serie, modele, statut, filters, sort, skip, limit)
+        query = plan.apply(select(*(columns or schema_columns(EcranItemsDB, EcranItems))))
+        return self._fetch_rows(query)
+
+    def list_ecran_rows(self, skip: int = 0, limit: int = 100,
+                      columns: Optional[list] = None) -> Tuple[List[str], List[tuple]]:
+        query = select(*(columns or schema_columns(EcranItemsDB, EcranItems))).order_by(
+            EcranItemsDB.id_ecran
+        ).offset(skip).limit(limit)
+        return self._fetch_rows(query)
+
+    def get_ecran_row(self, item_id: int, columns: Optional[list] = None) -> Tuple[List[str], tuple]:
+        query = select(*(columns or schema_columns(EcranItemsDB, EcranItems))).where(
+            EcranItemsDB.id_ecran == item_id
+        )
+        keys, rows = self._fetch_rows(query)
+        if not rows:
+            logger.warning(f"Screen item not found with ID: {item_id}")
+            raise HTTPException(status_code=404, detail="Screen item not found")
+        return keys, rows[0]
@@ -0,0 +1,177 @@
+from typing import Iterable, Optional
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from datetime import datetime
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+
+from .database import get_service_session
+from .models import INVENTORY_MODELS
+
+logger = logging.getLogger(__name__)
+
+SERIAL_BLOOM_PATH = os.getenv("SERIAL_BLOOM_PATH", "serial_bloom.bin")
+DEFAULT_CAPACITY = 1_000_000
+DEFAULT_ERROR_RATE = 0.01
+
+
+class SerialBloomFilter:
+    """
+    Filtre de Bloom des numéros de série de toutes les tables d'inventaire.
+    Un résultat négatif est certain (le numéro n'existe pas), un résultat positif
+    doit être confirmé par une requête. Tant que le filtre n'est pas chargé,
+    might_contain répond toujours True pour ne jamais sauter une vérification.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.watermark: Optional[datetime] = None
+        self.ready = False
+        self._lock = threading.Lock()
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value: Optional[str]):
+        if not value:
+            return
+        with self._lock:
+            added = False
+            for position in self._positions(value):
+                mask = 1 << (position & 7)
+                if not self.bits[position >> 3] & mask:
+                    self.bits[position >> 3] |= mask
+                    added = True
+            # Un numéro déjà présent (mise à jour, rattrapage) ne remplit pas le filtre
+            if added:
+                self.count += 1
+
+    def add_many(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def might_contain(self, value: str) -> bool:
+        if not self.ready:
+            return True
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def save(self, path: str = SERIAL_BLOOM_PATH):
+        header = {
+            "capacity": self.capacity,
+            "size": self.size,
+            "hash_count": self.hash_count,
+            "count": self.count,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps(header).encode("utf-8") + b"\n")
+                f.write(self.bits)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved serial Bloom filter ({self.count} serials) to {path}")
+
+    @classmethod
+    def load(cls, path: str = SERIAL_BLOOM_PATH) -> "SerialBloomFilter":
+        with open(path, "rb") as f:
+            header = json.loads(f.readline().decode("utf-8"))
+            bits = f.read()
+
+        bloom = cls.__new__(cls)
+        bloom.capacity = header["capacity"]
+        bloom.size = header["size"]
+        bloom.hash_count = header["hash_count"]
+        bloom.count = header["count"]
+        bloom.watermark = datetime.fromisoformat(header["watermark"]) if header["watermark"] else None
+        bloom.bits = bytearray(bits)
+        bloom.ready = False
+        bloom._lock = threading.Lock()
+        if len(bloom.bits) != (bloom.size + 7) // 8:
+            raise ValueError(f"Corrupted Bloom filter file: {path}")
+        return bloom
+
+
+def _load_serials(db: Session, bloom: SerialBloomFilter, since: Optional[datetime] = None):
+    """Ajoute au filtre les numéros de série (modifiés depuis `since` si fourni)"""
+    watermark = bloom.watermark
+    for model in INVENTORY_MODELS.values():
+        # Le repère est lu avant le parcours : une ligne écrite pendant le
+        # chargement sera rattrapée au prochain démarrage plutôt que perdue
+        latest = db.execute(select(func.max(model.date_modification))).scalar()
+        if latest and (watermark is None or latest > watermark):
+            watermark = latest
+
+        query = select(model.numero_serie)
+        if since is not None:
+            query = query.where(model.date_modification >= since)
+        for numero_serie in db.execute(query.execution_options(yield_per=10000)).scalars():
+            bloom.add(numero_serie)
+    bloom.watermark = watermark
+
+
+def rebuild(db: Session) -> SerialBloomFilter:
+    total = sum(
+        db.execute(select(func.count()).select_from(model)).scalar() or 0
+        for model in INVENTORY_MODELS.values()
+    )
+    bloom = SerialBloomFilter(capacity=max(DEFAULT_CAPACITY, total * 2))
+    _load_serials(db, bloom)
+    bloom.ready = True
+    logger.info(f"Rebuilt serial Bloom filter with {bloom.count} serials")
+    return bloom
+
+
+def warm_start(db: Session, path: str = SERIAL_BLOOM_PATH) -> SerialBloomFilter:
+    """
+    Charge le filtre depuis le fichier local puis rattrape les numéros modifiés
+    depuis sa sauvegarde. Reconstruit entièrement si le fichier est absent,
+    illisible ou trop rempli pour garder le taux de faux positifs prévu.
+    """
+    try:
+        bloom = SerialBloomFilter.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.info(f"No usable serial Bloom filter at {path} ({str(e)}), rebuilding")
+        return rebuild(db)
+
+    if bloom.watermark is None or bloom.count > bloom.capacity:
+        return rebuild(db)
+
+    _load_serials(db, bloom, since=bloom.watermark)
+    bloom.ready = True
+    logger.info(f"Loaded serial Bloom filter with {bloom.count} serials from {path}")
+    return bloom
+
+
+serial_filter = SerialBloomFilter()
+
+
+def init_serial_filter(path: str = SERIAL_BLOOM_PATH):
+    global serial_filter
+    db = get_service_session()
+    try:
+        serial_filter = warm_start(db, path)
+    except Exception as e:
+        # Sans filtre chargé, might_contain répond True : comportement d'origine
+        logger.error(f"Serial Bloom filter initialisation failed: {str(e)}")
+    finally:
+        db.close()
+
+
+def save_serial_filter(path: str = SERIAL_BLOOM_PATH):
+    if serial_filter.ready:
+        serial_filter.save(path)
+
+
+def get_serial_filter() -> SerialBloomFilter:
+    return serial_filter
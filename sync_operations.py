@@ -0,0 +1,178 @@
+from fastapi import HTTPException
+from typing import Dict, Optional
+from sqlalchemy import select, tuple_, and_, text
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime, timedelta
+import base64
+import json
+import logging
+import os
+
+from .models import INVENTORY_MODELS
+from audit_manager import AuditLog, ActionType
+from audit_archive import audit_archive
+
+logger = logging.getLogger(__name__)
+
+# Les lignes horodatées après le début de la plus ancienne transaction d'écriture
+# encore ouverte ne sont pas servies : elle pourrait valider une date_modification
+# antérieure. SYNC_LAG_SECONDS couvre en plus l'écart d'horloge entre l'application
+# et la base, et sert seul de marge sur les bases sans vue des transactions en cours.
+# MAX_SYNC_LAG_SECONDS borne l'attente : une transaction plus longue ne bloque pas /sync
+SYNC_LAG_SECONDS = 5
+MAX_SYNC_LAG_SECONDS = int(os.getenv("MAX_SYNC_LAG_SECONDS", "300"))
+DEFAULT_SYNC_LIMIT = 500
+
+# Âge en secondes de la plus ancienne transaction ayant écrit dans la base courante,
+# ouverte par une autre session active (les lectures seules, comme les exports, sont ignorées)
+OLDEST_TRANSACTION_AGE = {
+    "postgresql": (
+        "SELECT EXTRACT(EPOCH FROM now() - min(xact_start)) FROM pg_stat_activity "
+        "WHERE datname = current_database() AND state <> 'idle' AND backend_xid IS NOT NULL "
+        "AND pid <> pg_backend_pid()"
+    ),
+    "mysql": (
+        "SELECT TIMESTAMPDIFF(SECOND, MIN(t.trx_started), NOW()) FROM information_schema.innodb_trx t "
+        "JOIN information_schema.processlist p ON p.id = t.trx_mysql_thread_id "
+        "WHERE p.db = DATABASE() AND t.trx_rows_modified > 0 AND t.trx_mysql_thread_id <> CONNECTION_ID()"
+    ),
+}
+
+
+def encode_cursor(state: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Dict:
+    """Curseur : {"t": {table: [date_modification, id]}, "a": [timestamp, id] | None}"""
+    if not cursor:
+        return {"t": {}, "a": None}
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        for table_name, (timestamp, record_id) in state["t"].items():
+            if table_name not in INVENTORY_MODELS:
+                raise ValueError(table_name)
+            datetime.fromisoformat(timestamp)
+            int(record_id)
+        if state["a"] is not None:
+            timestamp, audit_id = state["a"]
+            datetime.fromisoformat(timestamp)
+            int(audit_id)
+        return state
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+
+class SyncOperations:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_changes(self, since: Optional[str] = None, limit: int = DEFAULT_SYNC_LIMIT) -> Dict:
+        """
+        Renvoie les articles créés ou modifiés et les suppressions depuis le curseur.
+        Chaque table est parcourue dans l'ordre de l'index (date_modification, id),
+        les suppressions dans l'ordre (timestamp, id) de audit_logs. Les deux
+        parcours s'arrêtent au même horodatage, avant toute transaction en cours.
+        Un curseur antérieur à l'historique archivé ne peut plus recevoir toutes les
+        suppressions : 410, le client doit resynchroniser depuis le début.
+        """
+        state = decode_cursor(since)
+        upserted = {}
+        deleted = {}
+        has_more = False
+
+        if since:
+            self._check_not_archived(state["a"])
+
+        try:
+            upper_bound = self._watermark()
+            for table_name, model in INVENTORY_MODELS.items():
+                pk = model.__mapper__.primary_key[0]
+                query = select(model.__table__).where(model.date_modification <= upper_bound)
+                position = state["t"].get(table_name)
+                if position:
+                    timestamp, record_id = position
+                    query = query.where(
+                        tuple_(model.date_modification, pk) > tuple_(datetime.fromisoformat(timestamp), record_id)
+                    )
+                rows = self.db.execute(
+                    query.order_by(model.date_modification, pk).limit(limit)
+                ).mappings().all()
+
+                upserted[table_name] = [dict(row) for row in rows]
+                if rows:
+                    last = rows[-1]
+                    state["t"][table_name] = [last["date_modification"].isoformat(), last[pk.name]]
+                has_more = has_more or len(rows) == limit
+
+            query = self.db.query(
+                AuditLog.id, AuditLog.timestamp, AuditLog.table_name, AuditLog.record_id
+            ).filter(
+                and_(
+                    AuditLog.timestamp <= upper_bound,
+                    AuditLog.action == ActionType.DELETE,
+                    AuditLog.table_name.in_(list(INVENTORY_MODELS)),
+                )
+            )
+            if state["a"]:
+                timestamp, audit_id = state["a"]
+                query = query.filter(
+                    tuple_(AuditLog.timestamp, AuditLog.id) > tuple_(datetime.fromisoformat(timestamp), audit_id)
+                )
+            deletions = query.order_by(AuditLog.timestamp, AuditLog.id).limit(limit).all()
+
+            for audit_id, timestamp, table_name, record_id in deletions:
+                deleted.setdefault(table_name, []).append(record_id)
+                state["a"] = [timestamp.isoformat(), audit_id]
+            if len(deletions) < limit and (
+                state["a"] is None or datetime.fromisoformat(state["a"][0]) < upper_bound
+            ):
+                # Toutes les suppressions jusqu'à upper_bound sont servies : le curseur
+                # avance même sans suppression, pour dater sa position dans l'historique
+                state["a"] = [upper_bound.isoformat(), 0]
+            has_more = has_more or len(deletions) == limit
+
+            return {
+                "upserted": upserted,
+                "deleted": deleted,
+                "cursor": encode_cursor(state),
+                "has_more": has_more,
+            }
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def _check_not_archived(self, position: Optional[list]):
+        """410 si des entrées postérieures à la position ont pu être archivées"""
+        archived = [audit_archive.newest_timestamp(table_name) for table_name in INVENTORY_MODELS]
+        archived = [timestamp for timestamp in archived if timestamp is not None]
+        if not archived:
+            return
+        if position is None or datetime.fromisoformat(position[0]) <= max(archived):
+            raise HTTPException(
+                status_code=410, detail="Sync cursor predates archived history, full resync required"
+            )
+
+    def _watermark(self) -> datetime:
+        """
+        Horodatage jusqu'auquel les lignes sont servies : SYNC_LAG_SECONDS avant
+        maintenant, ou avant le début de la plus ancienne transaction d'écriture
+        ouverte, dans la limite de MAX_SYNC_LAG_SECONDS
+        """
+        lag = SYNC_LAG_SECONDS
+        statement = OLDEST_TRANSACTION_AGE.get(self.db.get_bind().dialect.name)
+        if statement:
+            try:
+                with self.db.begin_nested():
+                    age = self.db.execute(text(statement)).scalar()
+                if age is not None:
+                    lag += max(float(age), 0)
+                    if lag > MAX_SYNC_LAG_SECONDS:
+                        logger.warning(f"Write transaction open for {float(age):.0f}s, sync lag capped")
+                        lag = MAX_SYNC_LAG_SECONDS
+            except SQLAlchemyError as e:
+                # Vue des transactions inaccessible (droits) : marge fixe seule
+                logger.warning(f"Cannot read open transactions, using fixed sync lag: {str(e)}")
+        return datetime.utcnow() - timedelta(seconds=lag)
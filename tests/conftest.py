@@ -0,0 +1,39 @@
+import importlib
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# Le dépôt est un paquet (imports relatifs) ; audit_manager et audit_archive sont des modules racine
+sys.path[:0] = [str(ROOT.parent), str(ROOT)]
+
+_tmp = tempfile.mkdtemp(prefix="inventaire-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'inventaire.db')}")
+os.environ.setdefault("JOB_RESULTS_DIR", os.path.join(_tmp, "jobs"))
+os.environ.setdefault("AUDIT_ARCHIVE_DIR", os.path.join(_tmp, "audit_archive"))
+
+
+def load(module: str):
+    """Importe un module du paquet (le nom du paquet est celui du répertoire)"""
+    return importlib.import_module(f"{ROOT.name}.{module}")
+
+
+@pytest.fixture
+def db():
+    database = load("database")
+    models = load("models")
+    import audit_manager
+
+    metadatas = [models.Base.metadata, audit_manager.Base.metadata]
+    for metadata in metadatas:
+        metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        for metadata in reversed(metadatas):
+            metadata.drop_all(bind=database.engine)
@@ -0,0 +1,24 @@
+from sqlalchemy.pool import NullPool, QueuePool
+
+from conftest import load
+
+admission = load("admission")
+
+
+def _creator():
+    raise AssertionError("no connection expected")
+
+
+def test_capacity_is_pool_size_plus_overflow():
+    assert admission.pool_capacity(QueuePool(_creator, pool_size=5, max_overflow=3)) == 8
+    assert admission.pool_capacity(NullPool(_creator)) == admission.DEFAULT_POOL_CAPACITY
+
+
+def test_limits_follow_the_pool_and_stay_within_it():
+    limits = admission.route_class_limits(30)
+    assert limits == admission.ROUTE_CLASS_SHARES
+
+    small = admission.route_class_limits(12)
+    assert sum(small.values()) <= 12
+    assert all(limit >= 1 for limit in small.values())
+    assert small["hot"] >= small["export"]
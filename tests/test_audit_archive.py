@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import audit_archive
+import audit_manager
+
+BASE = datetime(2023, 1, 1)
+
+
+def _row(entry_id, record_id, minutes, action="UPDATE"):
+    return {
+        "id": entry_id, "table_name": "mac_inventory", "record_id": record_id, "action": action,
+        "old_values": {"statut": "En stock"}, "new_values": {"statut": "En service"},
+        "user_id": 1, "timestamp": BASE + timedelta(minutes=minutes),
+        "ip_address": None, "user_agent": None, "batch_id": None,
+    }
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    archive = audit_archive.AuditArchive(str(tmp_path))
+    monkeypatch.setattr(audit_manager, "audit_archive", archive)
+    return archive
+
+
+def test_segments_are_queried_newest_first_without_duplicates(archive):
+    archive.write_segment("mac_inventory", "2023-01", [_row(1, 1, 0), _row(2, 2, 1), _row(3, 1, 2)])
+    # Lot repris après un arrêt : l'entrée 3 figure dans deux segments
+    archive.write_segment("mac_inventory", "2023-01", [_row(3, 1, 2), _row(4, 2, 3)])
+
+    assert [row["id"] for row in archive.query("mac_inventory")] == [4, 3, 2, 1]
+    assert [row["id"] for row in archive.query("mac_inventory", record_id=1)] == [3, 1]
+    assert [row["id"] for row in archive.query("mac_inventory", limit=2)] == [4, 3]
+    assert [row["id"] for row in archive.query("mac_inventory", before=(BASE + timedelta(minutes=2), 3))] == [2, 1]
+    assert archive.query("mac_inventory")[0]["new_values"] == {"statut": "En service"}
+    assert archive.newest_timestamp("mac_inventory") == BASE + timedelta(minutes=3)
+    assert archive.newest_timestamp("ecran") is None
+
+
+def test_latest_entry_per_record_in_one_lookup(archive):
+    archive.write_segment("mac_inventory", "2023-01", [_row(1, 1, 0), _row(2, 2, 1)])
+    archive.write_segment("mac_inventory", "2023-02", [_row(3, 1, 50000)])
+
+    latest = archive.latest("mac_inventory", [1, 2, 9])
+
+    assert {record_id: row["id"] for record_id, row in latest.items()} == {1: 3, 2: 2}
+    assert archive.latest("mac_inventory", [2], start_date=BASE + timedelta(days=30)) == {}
+
+
+def test_last_changes_fall_back_to_the_archive(db, archive):
+    archive.write_segment("mac_inventory", "2023-01", [_row(1, 1, 0), _row(2, 2, 1, action="CREATE")])
+    db.add(audit_manager.AuditLog(
+        id=10, table_name="mac_inventory", record_id=1, action=audit_manager.ActionType.UPDATE,
+        user_id=1, timestamp=datetime.utcnow(),
+    ))
+    db.commit()
+
+    last_changes = audit_manager.AuditManager(db).get_last_changes("mac_inventory", [1, 2, 3])
+
+    assert last_changes[1].id == 10
+    assert (last_changes[2].id, last_changes[2].action) == (2, audit_manager.ActionType.CREATE)
+    assert 3 not in last_changes
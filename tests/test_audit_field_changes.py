@@ -0,0 +1,93 @@
+import pytest
+from fastapi import HTTPException
+
+from conftest import load
+
+jobs = load("jobs")
+models = load("models")
+archive_operations = load("archive_operations")
+import audit_manager
+from audit_manager import AuditFieldChange, AuditLog, ActionType
+
+
+def test_changed_fields_of_an_update_lists_only_modified_fields():
+    changes = audit_manager.changed_fields(
+        {"statut": "En stock", "localisation": "Paris", "prix": "100.00"},
+        {"statut": "En service", "localisation": "Paris", "ram": 16},
+    )
+
+    assert changes == [
+        ("prix", "100.00", None),
+        ("ram", None, 16),
+        ("statut", "En stock", "En service"),
+    ]
+
+
+def test_changed_fields_of_a_creation_and_a_deletion():
+    assert audit_manager.changed_fields(None, {"statut": "En stock"}) == [("statut", None, "En stock")]
+    assert audit_manager.changed_fields({"statut": "Vendu"}, None) == [("statut", "Vendu", None)]
+    assert audit_manager.changed_fields({}, {}) == []
+
+
+def test_field_value_text_is_stable_and_bounded():
+    assert audit_manager.field_value_text(None) is None
+    assert audit_manager.field_value_text("Lyon") == "Lyon"
+    assert audit_manager.field_value_text(16) == "16"
+    assert audit_manager.field_value_text(True) == "true"
+    assert audit_manager.field_value_text({"a": 1}) == '{"a": 1}'
+    assert len(audit_manager.field_value_text("x" * 1000)) == audit_manager.FIELD_VALUE_LENGTH
+
+
+def test_bulk_entries_are_indexed_per_entry_even_for_repeated_records(db):
+    manager = audit_manager.AuditManager(db)
+    manager.log_changes_bulk("mac_inventory", ActionType.UPDATE, [
+        (1, {"statut": "En stock"}, {"statut": "En service"}),
+        (1, {"localisation": "Paris"}, {"localisation": "Lyon"}),
+        (2, {"statut": "En stock"}, {"statut": "Vendu"}),
+    ], batch_id="batch-1", user_id=7)
+
+    entries = db.query(AuditLog).order_by(AuditLog.id).all()
+    indexed = {
+        (change.audit_log_id, change.field, change.new)
+        for change in db.query(AuditFieldChange).all()
+    }
+    assert indexed == {
+        (entries[0].id, "statut", "En service"),
+        (entries[1].id, "localisation", "Lyon"),
+        (entries[2].id, "statut", "Vendu"),
+    }
+
+
+def test_backfill_indexes_each_entry_once(db):
+    db.add_all([
+        AuditLog(table_name="mac_inventory", record_id=1, action=ActionType.UPDATE, user_id=1,
+                 old_values={"statut": "En stock"}, new_values={"statut": "En service"}),
+        # Entrée sans champ modifié : aucune ligne, mais comptée comme parcourue
+        AuditLog(table_name="mac_inventory", record_id=2, action=ActionType.UPDATE, user_id=1,
+                 old_values={"statut": "Vendu"}, new_values={"statut": "Vendu"}),
+    ])
+    db.commit()
+
+    for job_id in ("job-1", "job-2"):
+        db.add(models.JobDB(id=job_id, type="audit_field_changes", statut=jobs.JOB_PENDING, params={}))
+        db.commit()
+        jobs.JobRunner()._execute(job_id)
+
+    results = [db.get(models.JobDB, job_id) for job_id in ("job-1", "job-2")]
+    for job in results:
+        db.refresh(job)
+    assert [job.result for job in results] == [
+        {"entries": 2, "field_changes": 1},
+        {"entries": 2, "field_changes": 0},
+    ]
+    assert db.query(AuditFieldChange).count() == 1
+
+
+def test_backfill_runs_one_at_a_time(db):
+    ops = jobs.JobOperations(db)
+    ops.prepare_job("audit_field_changes", {})
+    db.commit()
+
+    with pytest.raises(HTTPException) as error:
+        ops.prepare_job("audit_field_changes", {})
+    assert error.value.status_code == 409
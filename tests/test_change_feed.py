@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from conftest import load
+
+import audit_manager
+
+change_feed = load("change_feed")
+
+
+def _log(db, entry_id):
+    db.add(audit_manager.AuditLog(
+        id=entry_id, table_name="mac_inventory", record_id=entry_id,
+        action=audit_manager.ActionType.UPDATE, user_id=1,
+    ))
+    db.commit()
+
+
+async def _next_ids(subscription, count):
+    return [(await asyncio.wait_for(subscription.queue.get(), timeout=2))["id"] for _ in range(count)]
+
+
+def test_late_commit_below_last_id_is_published_once(db):
+    async def scenario():
+        publisher = change_feed.ChangePublisher(poll_interval=0.01)
+        subscription = await publisher.subscribe()
+        _log(db, 1)
+        _log(db, 3)
+        first = await _next_ids(subscription, 2)
+        assert publisher._gaps.keys() == {2}
+
+        _log(db, 2)
+        late = await _next_ids(subscription, 1)
+        await asyncio.sleep(0.05)
+        publisher.unsubscribe(subscription)
+        return first, late, subscription.queue.empty(), publisher._gaps
+
+    first, late, drained, gaps = asyncio.run(scenario())
+    assert first == [1, 3]
+    assert late == [2]
+    assert drained and not gaps
+
+
+def test_failed_start_is_retried_without_leaving_a_subscriber(db, monkeypatch):
+    fetch_last_id = change_feed._fetch_last_id
+
+    def failing():
+        raise RuntimeError("database unavailable")
+
+    async def scenario():
+        publisher = change_feed.ChangePublisher(poll_interval=0.01)
+        monkeypatch.setattr(change_feed, "_fetch_last_id", failing)
+        with pytest.raises(RuntimeError):
+            await publisher.subscribe()
+        assert publisher._subscribers == []
+
+        monkeypatch.setattr(change_feed, "_fetch_last_id", fetch_last_id)
+        subscription = await publisher.subscribe()
+        _log(db, 1)
+        received = await _next_ids(subscription, 1)
+        publisher.unsubscribe(subscription)
+        return received
+
+    assert asyncio.run(scenario()) == [1]
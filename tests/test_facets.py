@@ -0,0 +1,46 @@
+import pytest
+from fastapi import HTTPException
+
+from conftest import load
+
+facets = load("facets")
+models = load("models")
+
+
+def _add_items(db, statuts):
+    for index, statut in enumerate(statuts):
+        db.add(models.MacItemDB(numero_serie=f"SN{index}", statut=statut))
+    db.commit()
+
+
+def test_counts_per_value_sorted_by_count(db):
+    _add_items(db, ["En stock", "En service", "En stock", None])
+
+    counts = facets.compute_facets(db, models.MacItemDB, [], ["statut"])
+
+    assert counts == {"statut": {"En stock": 2, "En service": 1, facets.NULL_FACET: 1}}
+
+
+def test_application_side_scan_is_bounded(db, monkeypatch):
+    monkeypatch.setattr(facets, "MAX_SCAN_ROWS", 2)
+    monkeypatch.setattr(facets, "SCAN_BATCH_SIZE", 1)
+    _add_items(db, ["En stock", "En service", "En stock"])
+
+    with pytest.raises(HTTPException) as error:
+        facets.compute_facets(db, models.MacItemDB, [], ["statut"])
+    assert error.value.status_code == 400
+
+
+def test_facets_on_a_large_table_need_no_indexed_filter(db, monkeypatch):
+    mac_operations = load("mac_operations")
+    filter_dsl = load("filter_dsl")
+    monkeypatch.setattr(filter_dsl, "LARGE_TABLE_ROWS", 1)
+    _add_items(db, ["En stock", "En service", "En stock"])
+    ops = mac_operations.MacOperations(db)
+
+    with pytest.raises(HTTPException):
+        ops.search_mac_items(modele="Mac")
+
+    counts = ops.search_mac_facets(["statut"], modele="Mac", filters=["fournisseur=Apple"])
+    assert counts == {"statut": {}}
+    assert ops.search_mac_facets(["statut"]) == {"statut": {"En stock": 2, "En service": 1}}
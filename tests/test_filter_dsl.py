@@ -0,0 +1,68 @@
+import pytest
+from fastapi import HTTPException
+
+from conftest import load
+
+filter_dsl = load("filter_dsl")
+models = load("models")
+
+
+@pytest.fixture
+def large_table(db, monkeypatch):
+    # Trois lignes suffisent à dépasser le seuil abaissé pour le test
+    monkeypatch.setattr(filter_dsl, "LARGE_TABLE_ROWS", 3)
+    monkeypatch.setattr(filter_dsl, "_row_estimates", {})
+    for index in range(3):
+        db.add(models.MacItemDB(numero_serie=f"SN{index}", statut="En stock", commentaires="x"))
+    db.commit()
+    return db
+
+
+def test_row_estimate_without_statistics_counts_up_to_the_threshold(large_table):
+    assert filter_dsl.estimate_rows(large_table, models.MacItemDB) == 3
+
+
+def test_small_table_accepts_unindexed_unpaginated_query(db, monkeypatch):
+    monkeypatch.setattr(filter_dsl, "_row_estimates", {})
+    plan = filter_dsl.plan_query(db, models.MacItemDB, ["commentaires=x"])
+
+    assert plan.limit is None
+    assert not plan.indexed
+
+
+def test_large_table_refuses_unpaginated_unindexed_query(large_table):
+    with pytest.raises(HTTPException) as error:
+        filter_dsl.plan_query(large_table, models.MacItemDB, ["commentaires=x"])
+    assert error.value.status_code == 400
+
+
+def test_large_table_refuses_limit_above_the_unindexed_maximum(large_table):
+    with pytest.raises(HTTPException) as error:
+        filter_dsl.plan_query(large_table, models.MacItemDB, ["commentaires=x"],
+                              limit=filter_dsl.MAX_UNINDEXED_LIMIT + 1)
+    assert error.value.status_code == 400
+
+
+def test_large_table_keeps_a_small_unindexed_page(large_table):
+    plan = filter_dsl.plan_query(large_table, models.MacItemDB, ["commentaires=x"], limit=50)
+
+    assert plan.limit == 50
+
+
+def test_large_table_refuses_sort_on_unindexed_column(large_table):
+    with pytest.raises(HTTPException) as error:
+        filter_dsl.plan_query(large_table, models.MacItemDB, sort="-commentaires", limit=10)
+    assert error.value.status_code == 400
+
+
+def test_indexed_filter_is_not_limited(large_table):
+    plan = filter_dsl.plan_query(large_table, models.MacItemDB, ["statut=En stock"], sort="-commentaires")
+
+    assert plan.indexed
+    assert plan.limit is None
+
+
+def test_invalid_filter_value_is_rejected(db):
+    with pytest.raises(HTTPException) as error:
+        filter_dsl.plan_query(db, models.MacItemDB, ["prix>=abc"])
+    assert error.value.status_code == 400
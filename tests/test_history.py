@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import load
+
+history_operations = load("history_operations")
+import audit_manager
+
+
+def _add_entries(db, count):
+    # Plusieurs entrées partagent le même timestamp : l'ordre est départagé par l'id
+    base = datetime(2024, 1, 1)
+    for index in range(count):
+        db.add(audit_manager.AuditLog(
+            table_name="mac_inventory", record_id=index % 3, action=audit_manager.ActionType.UPDATE,
+            old_values={"statut": "En stock"}, new_values={"statut": "En service"},
+            user_id=1, timestamp=base + timedelta(minutes=index // 2),
+        ))
+    db.commit()
+
+
+def test_history_cursor_round_trip():
+    timestamp = datetime(2024, 5, 17, 10, 30, 12, 345678)
+    cursor = history_operations.encode_history_cursor(timestamp, 42)
+
+    assert history_operations.decode_history_cursor(cursor) == (timestamp, 42)
+    assert history_operations.decode_history_cursor(None) is None
+
+
+def test_invalid_history_cursor_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        history_operations.decode_history_cursor("not-a-cursor")
+    assert error.value.status_code == 400
+
+
+def test_pages_follow_each_other_without_gap_or_duplicate(db):
+    _add_entries(db, 7)
+    ops = history_operations.HistoryOperations(db)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = ops.query_history(table_names=["mac_inventory"], cursor=cursor, limit=2)
+        seen += [item["id"] for item in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    expected = [
+        entry.id for entry in db.query(audit_manager.AuditLog).order_by(
+            audit_manager.AuditLog.timestamp.desc(), audit_manager.AuditLog.id.desc()
+        )
+    ]
+    assert seen == expected
+    assert pages == 4
+
+
+def test_record_history_page_is_read_eagerly_with_its_cursor(db):
+    _add_entries(db, 7)
+    ops = history_operations.HistoryOperations(db)
+
+    page = ops.record_history_page("mac_inventory", 0, limit=2)
+
+    assert isinstance(page["items"], list) and len(page["items"]) == 2
+    assert page["next_cursor"] is not None
+    assert ops.record_history_page("mac_inventory", 0, limit=3)["next_cursor"] is None
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from conftest import load
+
+idempotency = load("idempotency")
+models = load("models")
+
+calls = []
+
+app = FastAPI()
+app.add_middleware(idempotency.IdempotencyMiddleware)
+
+
+@app.post("/items")
+def create_item(response: Response):
+    calls.append(1)
+    response.headers["ETag"] = f'"{len(calls)}"'
+    return {"created": len(calls)}
+
+
+def _client():
+    calls.clear()
+    return TestClient(app)
+
+
+def test_retry_replays_status_body_and_headers(db):
+    client = _client()
+    first = client.post("/items", json={"a": 1}, headers={"Idempotency-Key": "k1"})
+    retry = client.post("/items", json={"a": 1}, headers={"Idempotency-Key": "k1"})
+
+    assert len(calls) == 1
+    assert retry.status_code == first.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["ETag"] == first.headers["ETag"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+
+def test_key_reused_for_another_request_is_refused(db):
+    client = _client()
+    client.post("/items", json={"a": 1}, headers={"Idempotency-Key": "k1"})
+    response = client.post("/items", json={"a": 2}, headers={"Idempotency-Key": "k1"})
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+
+def test_in_progress_key_with_live_lease_is_busy(db):
+    assert idempotency._reserve("k1", "hash", "POST", "/items", "owner-a") is None
+
+    existing = idempotency._reserve("k1", "hash", "POST", "/items", "owner-b")
+    assert existing is not None and existing.status_code is None
+
+
+def test_abandoned_key_is_taken_over_after_lease_expiry(db):
+    assert idempotency._reserve("k1", "hash", "POST", "/items", "owner-a") is None
+    db.query(models.IdempotencyKeyDB).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+    assert idempotency._reserve("k1", "hash", "POST", "/items", "owner-b") is None
+
+    # L'exécution abandonnée ne peut plus ni prolonger ni enregistrer sa réponse
+    assert not idempotency._extend("k1", "owner-a")
+    idempotency._complete("k1", "owner-a", 201, "application/json", [], b"stale")
+    idempotency._complete("k1", "owner-b", 200, "application/json", [["etag", '"2"']], b"fresh")
+
+    entry = idempotency._reserve("k1", "hash", "POST", "/items", "owner-c")
+    assert entry.status_code == 200
+    assert entry.response_body == b"fresh"
+    assert entry.response_headers == [["etag", '"2"']]
+
+
+def test_server_error_releases_the_key(db):
+    assert idempotency._reserve("k1", "hash", "POST", "/items", "owner-a") is None
+    idempotency._release("k1", "owner-a")
+
+    assert idempotency._reserve("k1", "hash", "POST", "/items", "owner-b") is None
@@ -0,0 +1,50 @@
+from conftest import load
+
+models = load("models")
+inventory_campaign = load("inventory_campaign")
+reconciliation = load("reconciliation")
+
+
+def _campaign(db):
+    db.add(models.MacItemDB(numero_serie="SN1", localisation="Bureau 1"))
+    db.commit()
+    ops = inventory_campaign.CampaignOperations(db)
+    return ops, ops.open_campaign({"nom": "Inventaire"}).id_campagne
+
+
+def test_resent_scan_at_the_same_location_is_a_duplicate(db):
+    ops, campaign_id = _campaign(db)
+
+    first = ops.add_scans(campaign_id, "Bureau 2", ["SN1", "SN1"], user_id=1)
+    resent = ops.add_scans(campaign_id, "Bureau 2", ["SN1"], user_id=1)
+
+    assert (first["accepted"], first["duplicates"]) == (1, 1)
+    assert (resent["accepted"], resent["duplicates"]) == (0, 1)
+
+
+def test_rescan_elsewhere_moves_the_item_to_the_latest_location(db):
+    ops, campaign_id = _campaign(db)
+
+    ops.add_scans(campaign_id, "Bureau 2", ["SN1"], user_id=1)
+    ops.flush(campaign_id)
+    assert ops.add_scans(campaign_id, "Bureau 3", ["SN1"], user_id=1)["accepted"] == 1
+    ops.flush(campaign_id)
+
+    mac = db.query(models.MacItemDB).filter_by(numero_serie="SN1").one()
+    db.refresh(mac)
+    assert mac.localisation == "Bureau 3"
+
+    entries = list(reconciliation.ReconciliationEngine(db).iter_entries(campaign_id))
+    assert entries == [("Bureau 3", reconciliation.MISPLACED, "SN1", "mac_inventory", "Bureau 1")]
+
+
+def test_scans_in_one_batch_apply_the_latest_location(db):
+    ops, campaign_id = _campaign(db)
+
+    ops.add_scans(campaign_id, "Bureau 3", ["SN1"], user_id=1)
+    ops.add_scans(campaign_id, "Bureau 2", ["SN1"], user_id=1)
+    ops.flush(campaign_id)
+
+    mac = db.query(models.MacItemDB).filter_by(numero_serie="SN1").one()
+    db.refresh(mac)
+    assert mac.localisation == "Bureau 2"
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import load
+
+jobs = load("jobs")
+models = load("models")
+
+
+def _add_job(db, job_type="test_counter", **values):
+    job = models.JobDB(id=values.pop("id", "job-1"), type=job_type, statut=jobs.JOB_PENDING, params={}, **values)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_pending_job_is_claimed_by_a_single_worker(db):
+    _add_job(db)
+
+    assert jobs.claim_job(db, "job-1", "worker-a")
+    assert not jobs.claim_job(db, "job-1", "worker-b")
+
+    job = db.query(models.JobDB).filter_by(id="job-1").one()
+    db.refresh(job)
+    assert job.statut == jobs.JOB_RUNNING
+    assert job.owner == "worker-a"
+
+
+def test_running_job_with_live_lease_is_not_claimed(db):
+    _add_job(db)
+    db.query(models.JobDB).update({
+        "statut": jobs.JOB_RUNNING, "owner": "worker-a", "heartbeat": datetime.utcnow(),
+    })
+    db.commit()
+
+    assert not jobs.claim_job(db, "job-1", "worker-b")
+
+
+def test_running_job_with_expired_lease_is_taken_over(db):
+    _add_job(db)
+    expired = datetime.utcnow() - timedelta(seconds=jobs.JOB_LEASE_SECONDS + 1)
+    db.query(models.JobDB).update({"statut": jobs.JOB_RUNNING, "owner": "worker-a", "heartbeat": expired})
+    db.commit()
+
+    assert jobs.claim_job(db, "job-1", "worker-b")
+    assert not jobs.claim_job(db, "job-1", "worker-c")
+
+
+def test_finished_job_is_not_claimed(db):
+    _add_job(db)
+    db.query(models.JobDB).update({"statut": jobs.JOB_DONE})
+    db.commit()
+
+    assert not jobs.claim_job(db, "job-1", "worker-a")
+
+
+def test_job_runs_once_across_workers(db):
+    runs = []
+
+    @jobs.register_job("test_counter")
+    def count(context):
+        runs.append(context.job_id)
+        return {"runs": len(runs)}
+
+    _add_job(db)
+    first, second = jobs.JobRunner(), jobs.JobRunner()
+    first._execute("job-1")
+    second._execute("job-1")
+
+    job = db.query(models.JobDB).filter_by(id="job-1").one()
+    db.refresh(job)
+    assert runs == ["job-1"]
+    assert job.statut == jobs.JOB_DONE
+    assert job.owner == first.worker_id
+
+
+def test_final_state_is_not_written_after_lease_loss(db):
+    @jobs.register_job("test_takeover")
+    def taken_over(context):
+        db.query(models.JobDB).update({"owner": "worker-b"})
+        db.commit()
+        return {}
+
+    _add_job(db, job_type="test_takeover")
+    jobs.JobRunner()._execute("job-1")
+
+    job = db.query(models.JobDB).filter_by(id="job-1").one()
+    db.refresh(job)
+    assert job.statut == jobs.JOB_RUNNING
+    assert job.owner == "worker-b"
+
+
+def test_exclusive_job_type_runs_one_at_a_time(db):
+    @jobs.register_job("test_exclusive", exclusive=True)
+    def exclusive(context):
+        return {}
+
+    ops = jobs.JobOperations(db)
+    ops.prepare_job("test_exclusive", {})
+    db.commit()
+    with pytest.raises(HTTPException) as error:
+        ops.prepare_job("test_exclusive", {})
+    assert error.value.status_code == 409
+
+    # Une seconde tâche créée malgré tout ne démarre pas tant que la première tient son bail
+    _add_job(db, id="job-2", job_type="test_exclusive")
+    db.query(models.JobDB).filter(models.JobDB.id != "job-2").update({
+        "statut": jobs.JOB_RUNNING, "owner": "worker-a", "heartbeat": datetime.utcnow(),
+    })
+    db.commit()
+    jobs.JobRunner()._execute("job-2")
+
+    job = db.query(models.JobDB).filter_by(id="job-2").one()
+    db.refresh(job)
+    assert job.statut == jobs.JOB_FAILED
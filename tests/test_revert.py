@@ -0,0 +1,90 @@
+import uuid
+
+from conftest import load
+
+import audit_manager
+
+models = load("models")
+revert_operations = load("revert_operations")
+
+AuditLog, ActionType = audit_manager.AuditLog, audit_manager.ActionType
+
+
+def _add_mac(db, numero_serie, **values):
+    mac = models.MacItemDB(numero_serie=numero_serie, **values)
+    db.add(mac)
+    db.commit()
+    return mac
+
+
+def _log(db, mac, action, old_values, new_values, batch_id):
+    db.add(AuditLog(
+        table_name="mac_inventory", record_id=mac.id_mac, action=action,
+        old_values=old_values, new_values=new_values, user_id=1, batch_id=batch_id,
+    ))
+    db.commit()
+
+
+def _revert(db, batch_id):
+    db.add(models.BulkRevertDB(batch_id=batch_id, revert_batch_id=str(uuid.uuid4()), user_id=2))
+    db.commit()
+    ops = revert_operations.RevertOperations(db)
+    ops.run(batch_id)
+    return ops.get_revert(batch_id)
+
+
+def _revert_entries(db, revert, action):
+    return db.query(AuditLog).filter(
+        AuditLog.batch_id == revert.revert_batch_id, AuditLog.action == action
+    ).all()
+
+
+def test_update_is_restored_unless_changed_since(db):
+    batch_id = str(uuid.uuid4())
+    kept = _add_mac(db, "S1", statut="En stock")
+    changed = _add_mac(db, "S2", statut="Vendu")
+    for mac in (kept, changed):
+        _log(db, mac, ActionType.UPDATE, {"statut": "En service"}, {"statut": "En stock"}, batch_id)
+
+    revert = _revert(db, batch_id)
+
+    assert (revert.statut, revert.reverted, revert.conflicts) == (revert_operations.REVERT_DONE, 1, 1)
+    db.expire_all()
+    assert kept.statut == "En service"
+    assert changed.statut == "Vendu"
+    assert [entry.record_id for entry in _revert_entries(db, revert, ActionType.UPDATE)] == [kept.id_mac]
+
+
+def test_creation_is_deleted_only_if_unchanged(db):
+    batch_id = str(uuid.uuid4())
+    audit = audit_manager.AuditManager(db)
+    untouched = _add_mac(db, "S1", statut="En stock")
+    edited = _add_mac(db, "S2", statut="En stock")
+    for mac in (untouched, edited):
+        _log(db, mac, ActionType.CREATE, None, audit._serialize_model(mac), batch_id)
+    edited.statut = "Vendu"
+    db.commit()
+    untouched_id, edited_id = untouched.id_mac, edited.id_mac
+    snapshot = audit._serialize_model(untouched)
+
+    revert = _revert(db, batch_id)
+
+    assert (revert.reverted, revert.conflicts) == (1, 1)
+    assert db.query(models.MacItemDB).filter_by(id_mac=untouched_id).first() is None
+    assert db.query(models.MacItemDB).filter_by(id_mac=edited_id).one().statut == "Vendu"
+
+    deletions = _revert_entries(db, revert, ActionType.DELETE)
+    assert [entry.record_id for entry in deletions] == [untouched_id]
+    assert deletions[0].old_values == snapshot
+    assert deletions[0].user_id == 2
+
+
+def test_deletions_are_skipped(db):
+    batch_id = str(uuid.uuid4())
+    mac = _add_mac(db, "S1")
+    _log(db, mac, ActionType.DELETE, {"numero_serie": "S1"}, None, batch_id)
+
+    revert = _revert(db, batch_id)
+
+    assert (revert.reverted, revert.conflicts, revert.skipped) == (0, 0, 1)
+    assert db.query(models.MacItemDB).count() == 1
@@ -0,0 +1,39 @@
+from conftest import load
+
+serial_bloom = load("serial_bloom")
+models = load("models")
+
+
+def test_unknown_serials_are_rejected_once_ready():
+    bloom = serial_bloom.SerialBloomFilter(capacity=1000)
+    bloom.add_many(["SN1", "SN2"])
+
+    assert bloom.might_contain("SN3")
+    bloom.ready = True
+    assert bloom.might_contain("SN1") and bloom.might_contain("SN2")
+    assert not bloom.might_contain("SN3")
+
+
+def test_readding_a_serial_does_not_fill_the_filter():
+    bloom = serial_bloom.SerialBloomFilter(capacity=1000)
+    for _ in range(5):
+        bloom.add("SN1")
+    bloom.add(None)
+
+    assert bloom.count == 1
+
+
+def test_warm_start_reloads_the_saved_filter(db, tmp_path):
+    db.add(models.MacItemDB(numero_serie="SN1"))
+    db.commit()
+    path = str(tmp_path / "bloom.bin")
+
+    first = serial_bloom.warm_start(db, path)
+    first.save(path)
+    db.add(models.EcranItemDB(numero_serie="SN2"))
+    db.commit()
+    reloaded = serial_bloom.warm_start(db, path)
+
+    assert reloaded.ready
+    assert reloaded.might_contain("SN1") and reloaded.might_contain("SN2")
+    assert reloaded.count == 2
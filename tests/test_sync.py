@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import load
+
+import audit_manager
+
+models = load("models")
+sync_operations = load("sync_operations")
+
+
+def _add_mac(db, numero_serie, minutes_ago):
+    mac = models.MacItemDB(numero_serie=numero_serie)
+    db.add(mac)
+    db.flush()
+    mac.date_modification = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    db.commit()
+    return mac
+
+
+def _log_deletion(db, record_id, minutes_ago):
+    db.add(audit_manager.AuditLog(
+        table_name="mac_inventory", record_id=record_id, action=audit_manager.ActionType.DELETE,
+        user_id=1, timestamp=datetime.utcnow() - timedelta(minutes=minutes_ago),
+    ))
+    db.commit()
+
+
+def test_changes_are_paged_by_cursor(db):
+    first = _add_mac(db, "S1", minutes_ago=3)
+    _log_deletion(db, 42, minutes_ago=2)
+    ops = sync_operations.SyncOperations(db)
+
+    page = ops.get_changes()
+    assert [row["id_mac"] for row in page["upserted"]["mac_inventory"]] == [first.id_mac]
+    assert page["deleted"] == {"mac_inventory": [42]}
+
+    second = _add_mac(db, "S2", minutes_ago=1)
+    page = ops.get_changes(page["cursor"])
+    assert [row["id_mac"] for row in page["upserted"]["mac_inventory"]] == [second.id_mac]
+    assert page["deleted"] == {}
+
+
+def test_audit_id_only_cursor_is_rejected(db):
+    cursor = sync_operations.encode_cursor({"t": {}, "a": 42})
+    with pytest.raises(HTTPException) as error:
+        sync_operations.SyncOperations(db).get_changes(cursor)
+    assert error.value.status_code == 400
+
+
+def test_cursor_older_than_archived_history_is_gone(db, monkeypatch):
+    ops = sync_operations.SyncOperations(db)
+    cursor = ops.get_changes()["cursor"]
+    archived = {"mac_inventory": None}
+    monkeypatch.setattr(sync_operations.audit_archive, "newest_timestamp", lambda table_name: archived.get(table_name))
+
+    archived["mac_inventory"] = datetime.utcnow() - timedelta(days=400)
+    assert ops.get_changes(cursor)["deleted"] == {}
+
+    archived["mac_inventory"] = datetime.utcnow()
+    with pytest.raises(HTTPException) as error:
+        ops.get_changes(cursor)
+    assert error.value.status_code == 410
+
+    assert ops.get_changes()["cursor"]
@@ -0,0 +1,18 @@
+from conftest import load
+
+xlsx_export = load("xlsx_export")
+
+
+def test_producer_failure_is_forwarded_to_the_writer(db, monkeypatch):
+    def failing(model, schema):
+        raise ValueError("unexpected column")
+
+    monkeypatch.setattr(xlsx_export, "Workbook", object)
+    monkeypatch.setattr(xlsx_export, "schema_columns", failing)
+    export = xlsx_export.XLSXInventoryExport(context=None, tables=["mac_inventory"])
+
+    export._produce("mac_inventory")
+
+    table_name, error = export.batches.get_nowait()
+    assert table_name == "mac_inventory"
+    assert isinstance(error, ValueError)
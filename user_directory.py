@@ -0,0 +1,101 @@
+from typing import Dict, Iterable, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from audit_manager import User
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECONDS = 300
+PREFETCH_CHUNK_SIZE = 1000
+
+
+def _unknown_user(user_id: Optional[int]) -> Dict:
+    return {"id": user_id, "name": "Unknown", "email": ""}
+
+
+class UserDirectory:
+    """
+    Cache LRU des informations utilisateur, commun au processus, avec expiration.
+    Les modifications faites par l'ORM dans ce processus invalident l'entrée ;
+    celles des autres workers sont visibles au plus tard après le TTL.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl_seconds: int = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, user_id: int) -> Optional[Dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires, info = entry
+        if expires < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return info
+
+    def _store(self, user_id: int, info: Dict):
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, info)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def prefetch(self, db: Session, user_ids: Iterable[Optional[int]]):
+        """Charge en une requête (par lot) les utilisateurs absents du cache"""
+        with self._lock:
+            missing = sorted({user_id for user_id in user_ids if user_id is not None and self._lookup(user_id) is None})
+        if not missing:
+            return
+
+        found = {}
+        try:
+            for start in range(0, len(missing), PREFETCH_CHUNK_SIZE):
+                chunk = missing[start:start + PREFETCH_CHUNK_SIZE]
+                for user_id, name, email in db.query(User.id, User.name, User.email).filter(User.id.in_(chunk)):
+                    found[user_id] = {"id": user_id, "name": name, "email": email}
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            return
+
+        with self._lock:
+            for user_id in missing:
+                # Les utilisateurs introuvables sont aussi mis en cache (jusqu'au TTL)
+                self._store(user_id, found.get(user_id) or _unknown_user(user_id))
+
+    def get_user_info(self, db: Session, user_id: Optional[int]) -> Dict:
+        if user_id is None:
+            return _unknown_user(None)
+        with self._lock:
+            info = self._lookup(user_id)
+        if info is None:
+            self.prefetch(db, [user_id])
+            with self._lock:
+                info = self._lookup(user_id)
+        return info or _unknown_user(user_id)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+user_directory = UserDirectory()
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    user_directory.invalidate(target.id)
@@ -0,0 +1,185 @@
+from fastapi import HTTPException
+from typing import Dict, List, Optional
+from sqlalchemy import select, literal, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import date, datetime, timedelta
+import logging
+import threading
+
+from .database import get_service_session
+from .models import INVENTORY_MODELS, WarrantyExpiringDB
+
+logger = logging.getLogger(__name__)
+
+# Horizon de la table matérialisée et fréquence du scan planifié
+SCAN_HORIZON_DAYS = 90
+SCAN_INTERVAL_SECONDS = 24 * 60 * 60
+
+
+class WarrantyOperations:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _expiring_query(self, start: date, end: date):
+        """
+        Construit un UNION ALL sur toutes les tables d'inventaire.
+        Chaque branche filtre par intervalle sur garantie_expire (colonne indexée),
+        la base ne parcourt donc que la plage concernée et non la table entière.
+        """
+        branches = []
+        for table_name, model in INVENTORY_MODELS.items():
+            pk = model.__mapper__.primary_key[0]
+            branches.append(
+                select(
+                    literal(table_name).label("table_name"),
+                    pk.label("record_id"),
+                    model.numero_serie,
+                    model.marque,
+                    model.modele,
+                    model.localisation,
+                    model.statut,
+                    model.garantie_expire,
+                ).where(model.garantie_expire.between(start, end))
+            )
+        expiring = union_all(*branches).subquery()
+        return select(expiring).order_by(
+            expiring.c.garantie_expire, expiring.c.table_name, expiring.c.record_id
+        )
+
+    def get_expiring(self, within_days: int = 30, skip: int = 0, limit: int = 100) -> List[Dict]:
+        try:
+            start = date.today()
+            end = start + timedelta(days=within_days)
+            query = self._expiring_query(start, end).offset(skip).limit(limit)
+            return [dict(row) for row in self.db.execute(query).mappings()]
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def refresh_expiring_table(self, horizon_days: int = SCAN_HORIZON_DAYS) -> int:
+        """
+        Matérialise les garanties expirant dans l'horizon donné.
+        L'état de notification est conservé tant que la date d'expiration ne change pas.
+        """
+        try:
+            start = date.today()
+            end = start + timedelta(days=horizon_days)
+            scan_time = datetime.utcnow()
+
+            existing = {
+                (row.table_name, row.record_id): row
+                for row in self.db.query(WarrantyExpiringDB).all()
+            }
+
+            count = 0
+            for row in self.db.execute(self._expiring_query(start, end)).mappings():
+                key = (row["table_name"], row["record_id"])
+                entry = existing.pop(key, None)
+                if entry is None:
+                    entry = WarrantyExpiringDB(table_name=key[0], record_id=key[1])
+                    self.db.add(entry)
+                elif entry.garantie_expire != row["garantie_expire"]:
+                    # Nouvelle date d'expiration : la notification doit être renvoyée
+                    entry.notifie = False
+                    entry.date_notification = None
+
+                for field in ("numero_serie", "marque", "modele", "localisation", "statut", "garantie_expire"):
+                    setattr(entry, field, row[field])
+                entry.date_scan = scan_time
+                count += 1
+
+            # Les entrées restantes ne sont plus dans l'horizon (expirées ou prolongées)
+            for entry in existing.values():
+                self.db.delete(entry)
+
+            self.db.commit()
+            logger.info(f"Warranty scan materialized {count} expiring items")
+            return count
+
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def get_expiring_report(self,
+                            within_days: int = SCAN_HORIZON_DAYS,
+                            notifie: Optional[bool] = None,
+                            skip: int = 0,
+                            limit: int = 100) -> List["WarrantyExpiringDB"]:
+        try:
+            end = date.today() + timedelta(days=within_days)
+            query = self.db.query(WarrantyExpiringDB).filter(
+                WarrantyExpiringDB.garantie_expire <= end
+            )
+            if notifie is not None:
+                query = query.filter(WarrantyExpiringDB.notifie == notifie)
+
+            return query.order_by(
+                WarrantyExpiringDB.garantie_expire, WarrantyExpiringDB.id
+            ).offset(skip).limit(limit).all()
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+    def mark_notified(self, entry_id: int) -> "WarrantyExpiringDB":
+        try:
+            entry = self.db.query(WarrantyExpiringDB).filter(
+                WarrantyExpiringDB.id == entry_id
+            ).first()
+            if not entry:
+                logger.warning(f"Expiring warranty entry not found with ID: {entry_id}")
+                raise HTTPException(status_code=404, detail="Expiring warranty entry not found")
+
+            entry.notifie = True
+            entry.date_notification = datetime.utcnow()
+            self.db.commit()
+            self.db.refresh(entry)
+            return entry
+
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Database operation failed")
+
+
+class WarrantyScanScheduler:
+    """Thread de fond qui rafraîchit la table des garanties expirant une fois par jour"""
+
+    def __init__(self, interval_seconds: int = SCAN_INTERVAL_SECONDS, horizon_days: int = SCAN_HORIZON_DAYS):
+        self.interval_seconds = interval_seconds
+        self.horizon_days = horizon_days
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> int:
+        db = get_service_session()
+        try:
+            return WarrantyOperations(db).refresh_expiring_table(self.horizon_days)
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Warranty scan failed: {str(e)}")
+            self._stop_event.wait(self.interval_seconds)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="warranty-scan", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+warranty_scheduler = WarrantyScanScheduler()
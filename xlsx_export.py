@@ -0,0 +1,186 @@
+from fastapi import HTTPException
+from typing import Dict, List, Optional
+from sqlalchemy import select, Date, DateTime, Numeric
+from sqlalchemy.exc import SQLAlchemyError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import queue
+import threading
+
+from .database import get_job_session
+from .models import MacItemDB, EcranItemDB, EquipementDB, MacItem, EcranItem, Equipement
+from .fast_json import schema_columns
+from .filter_dsl import estimate_rows
+from .jobs import register_job, JobContext
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+except ImportError:  # openpyxl est optionnel, requis seulement pour l'export Excel
+    Workbook = None
+    WriteOnlyCell = None
+
+logger = logging.getLogger(__name__)
+
+# Une feuille par table d'inventaire (nom de feuille limité à 31 caractères)
+EXPORT_SHEETS = {
+    "mac_inventory": ("Macs", MacItemDB, MacItem),
+    "ecran": ("Ecrans", EcranItemDB, EcranItem),
+    "equipements": ("Equipements", EquipementDB, Equipement),
+}
+EXPORT_BATCH_SIZE = 2000
+# Lots en attente d'écriture : borne la mémoire quand l'écriture est plus lente que la lecture
+EXPORT_QUEUE_BATCHES = 8
+DATE_FORMAT = "yyyy-mm-dd"
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+PRICE_FORMAT = "#,##0.00"
+
+_END_OF_SHEET = object()
+
+
+def parse_tables(tables: Optional[str]) -> List[str]:
+    if not tables:
+        return list(EXPORT_SHEETS)
+    names = list(dict.fromkeys(name.strip() for name in tables.split(",") if name.strip()))
+    unknown = [name for name in names if name not in EXPORT_SHEETS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown inventory table: {', '.join(unknown)}. Use one of: {', '.join(EXPORT_SHEETS)}"
+        )
+    return names
+
+
+def _number_formats(columns) -> Dict[int, str]:
+    """Format Excel des colonnes typées (dates, montants), par position"""
+    formats = {}
+    for position, column in enumerate(columns):
+        if isinstance(column.type, DateTime):
+            formats[position] = DATETIME_FORMAT
+        elif isinstance(column.type, Date):
+            formats[position] = DATE_FORMAT
+        elif isinstance(column.type, Numeric) and column.name == "prix":
+            formats[position] = PRICE_FORMAT
+    return formats
+
+
+class XLSXInventoryExport:
+    """
+    Un lecteur par feuille, en parallèle, chacun avec sa session et un curseur
+    côté serveur ; un seul thread écrit le classeur en mode write-only, sur disque.
+    Les lots transitent par une file bornée : la mémoire reste constante quelle
+    que soit la taille de l'inventaire. La mise en forme des cellules reste dans le
+    thread d'écriture : un classeur write-only n'a qu'un écrivain et ses cellules ne
+    passent pas d'un processus à l'autre.
+    """
+
+    def __init__(self, context: JobContext, tables: List[str]):
+        if Workbook is None:
+            raise HTTPException(status_code=501, detail="XLSX export requires the openpyxl package")
+        self.context = context
+        self.tables = tables
+        self.batches = queue.Queue(maxsize=EXPORT_QUEUE_BATCHES)
+        self._stop_event = threading.Event()
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self.batches.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _produce(self, table_name: str):
+        db = get_job_session()
+        try:
+            _, model, schema = EXPORT_SHEETS[table_name]
+            columns = schema_columns(model, schema)
+            pk = model.__mapper__.primary_key[0]
+            result = db.execute(
+                select(*columns).order_by(pk)
+                .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+            )
+            for batch in result.partitions():
+                if self._stop_event.is_set():
+                    return
+                self._put((table_name, batch))
+            self._put((table_name, _END_OF_SHEET))
+        except SQLAlchemyError as e:
+            logger.error(f"Database error during export of {table_name}: {str(e)}")
+            self._put((table_name, e))
+        except Exception as e:
+            # Toute erreur est transmise : sans elle, l'écriture attendrait la feuille indéfiniment
+            logger.error(f"Export of {table_name} failed: {str(e)}")
+            self._put((table_name, e))
+        finally:
+            db.close()
+
+    def _expected_rows(self) -> int:
+        total = 0
+        for table_name in self.tables:
+            estimate = estimate_rows(self.context.db, EXPORT_SHEETS[table_name][1])
+            total += estimate or 0
+        return total
+
+    def write(self, path: str) -> Dict[str, int]:
+        workbook = Workbook(write_only=True)
+        sheets, formats = {}, {}
+        for table_name in self.tables:
+            title, model, schema = EXPORT_SHEETS[table_name]
+            columns = schema_columns(model, schema)
+            sheet = workbook.create_sheet(title)
+            sheet.append([column.name for column in columns])
+            sheets[table_name] = sheet
+            formats[table_name] = _number_formats(columns)
+
+        expected = self._expected_rows()
+        counts = {table_name: 0 for table_name in self.tables}
+        remaining = len(self.tables)
+        producers = ThreadPoolExecutor(max_workers=len(self.tables), thread_name_prefix="xlsx-export")
+        try:
+            for table_name in self.tables:
+                producers.submit(self._produce, table_name)
+
+            while remaining:
+                table_name, batch = self.batches.get()
+                if batch is _END_OF_SHEET:
+                    remaining -= 1
+                    continue
+                if isinstance(batch, Exception):
+                    raise batch
+
+                sheet, typed = sheets[table_name], formats[table_name]
+                for row in batch:
+                    if typed:
+                        row = list(row)
+                        for position, number_format in typed.items():
+                            if row[position] is not None:
+                                cell = WriteOnlyCell(sheet, value=row[position])
+                                cell.number_format = number_format
+                                row[position] = cell
+                    sheet.append(row)
+                counts[table_name] += len(batch)
+
+                written = sum(counts.values())
+                percent = int(written * 100 / expected) if expected else 0
+                self.context.progress(min(percent, 99), f"{written} rows written")
+
+            workbook.save(path)
+            logger.info(f"XLSX export written to {path}: {counts}")
+            return counts
+        finally:
+            self._stop_event.set()
+            producers.shutdown(wait=True)
+
+
+@register_job("inventory_xlsx")
+def run_inventory_xlsx_job(context: JobContext) -> Dict:
+    """Export Excel de l'inventaire, une feuille par table"""
+    tables = parse_tables(",".join(context.params.get("tables") or []))
+    filename = f"inventaire_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    path = context.result_file(
+        filename, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    counts = XLSXInventoryExport(context, tables).write(path)
+    return {"rows": counts}